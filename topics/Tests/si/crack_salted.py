@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+""" The module runs the dictionary attack against the salted PBKDF2 hashes of
+    the Users_Top*H tables to demonstrate how the per-row salts and the PBKDF2
+    iterations change the cost of the attack
+# =============================================================================
+    This software was developed at the National Institute of Standards
+    and Technology by employees of the Federal Government in the course
+    of their official duties.  Pursuant to title 17 Section 105 of the
+    United States Code this software is not subject to copyright
+    protection and is in the public domain.  NIST assumes no
+    responsibility whatsoever for its use by other parties, and makes
+    no guarantees, expressed or implied, about its quality,
+    reliability, or any other characteristic.
+# =============================================================================
+    We would appreciate acknowledgement if the software is used.
+"""
+__author__ = "Dmitry Cousin"
+__status__ = "Prototype"
+
+import os
+import argparse
+import time
+from collections import deque
+
+import db_base as dbBase
+import db_create as dbCreate
+import cred_crypto as pop
+
+# PBKDF2 iteration counts to project the attack cost for
+PROJECTED_ITERATIONS = (1_000, 10_000, 100_000, 210_000, 600_000, 1_000_000)
+# ============================================================================||
+
+
+class HashedUsersDB(dbBase.BaseDB):
+    """ Read access to the Users_Top*H tables created by db_create.DbMaker
+    """
+
+    def __init__(self, db_path: str = '', db_name: str = ''):
+        super().__init__(db_path, db_name, must_create_db=False)
+    # ------------------------------------------------------------------------|
+
+    def read_hashed_users(self, table_name: str, limit: int = 0):
+        """ Streams the (user_name, salt, password_hash) rows of the table
+        Args:
+            table_name (str): e.g. 'Users_Top500H'
+            limit (int, optional): read only the first rows. Defaults to 0 (all).
+        Yields:
+            tuple: (user_name, salt, password_hash) in the id order
+        """
+        # The table name can not be a parameter, so it must be a known table
+        if not self.is_table_in_db(table_name):
+            raise ValueError(f'Table [{table_name}] is not found in [{self.db_name}]')
+        command = f'SELECT user_name, salt, password_hash FROM {table_name} ORDER BY id'
+        yield from self.__select__(command + (' LIMIT ?' if limit > 0 else ''),
+                                   (limit,) if limit > 0 else None)
+# ============================================================================||
+
+
+class AttackReport(object):
+    """ Results and the throughput of a dictionary attack
+    """
+
+    def __init__(self, words: int, iterations: int, workers: int):
+        self.words = words
+        self.iterations = iterations
+        self.workers = workers
+        self.rows = 0
+        self.guesses = 0
+        self.elapsed = 0.0
+        self.cracked = dict()   # user_name -> password
+    # ------------------------------------------------------------------------|
+
+    @property
+    def guesses_per_second(self) -> float:
+        return self.guesses / self.elapsed if self.elapsed > 0 else 0.0
+
+    def projected_seconds(self, rows: int = 0, iterations: int = 0) -> float:
+        """ Time to try the whole dictionary against rows (default: the attacked ones)
+            at the iterations count (default: the attacked one)
+            The cost of PBKDF2 grows linearly with the iterations, and each
+            salt needs its own pass over the dictionary.
+        """
+        rows = rows if rows else self.rows
+        iterations = iterations if iterations else self.iterations
+        rate = self.guesses_per_second * self.iterations / iterations
+        return rows * self.words / rate if rate > 0 else float('inf')
+
+    def __str__(self) -> str:
+        lines = [f'Attacked {self.rows} salted rows with {self.words} words'
+                 f' at {self.iterations:,} iterations on {self.workers} workers:',
+                 f'\tCracked {len(self.cracked)} of {self.rows} in {self.elapsed:.2f} s',
+                 f'\t{self.guesses:,} guesses, {self.guesses_per_second:,.1f} guesses/sec',
+                 f'\tProjected exhaustive attack over the dictionary:']
+        for iterations in sorted(set(PROJECTED_ITERATIONS) | {self.iterations}):
+            seconds = self.projected_seconds(iterations=iterations)
+            lines.append(f'\t\t{iterations:>10,} iterations: {seconds:>12,.1f} s'
+                         f' ({seconds / 3600:,.2f} h)')
+        return '\n'.join(lines)
+# ============================================================================||
+
+
+class DictionaryAttack(object):
+    """ Dictionary attack over the salted rows on a pool of workers
+        Each row is split into the (row, words chunk) jobs; the jobs of a row
+        stop being scheduled as soon as one of them finds the password.
+    """
+
+    def __init__(self, words: list, sha_version: str = 'sha512',
+                 iterations: int = 100_000, workers: int = None,
+                 pool_mode: str = 'process', words_per_job: int = 32):
+        self.words = list(words)
+        self.sha_version = sha_version
+        self.iterations = iterations
+        self.workers = workers if workers and workers > 0 else (os.cpu_count() or 1)
+        self.pool_mode = pool_mode
+        self.words_per_job = words_per_job
+    # ------------------------------------------------------------------------|
+
+    def run(self, rows, verbose: bool = False) -> AttackReport:
+        """ Attacks the (user_name, salt, password_hash) rows
+        Returns:
+            AttackReport: the cracked passwords and the guessing rate
+        """
+        report = AttackReport(len(self.words), self.iterations, self.workers)
+        scheduled = deque()     # (user_name, words offset) of the jobs in order
+
+        def jobs():
+            for (user_name, salt, password_hash) in rows:
+                report.rows += 1
+                for offset in range(0, len(self.words), self.words_per_job):
+                    if user_name in report.cracked:
+                        break
+                    scheduled.append((user_name, offset))
+                    yield (self.words[offset:offset + self.words_per_job], password_hash, salt)
+
+        start = time.perf_counter()
+        for (found, guesses) in pop.find_passwords_parallel(jobs(), self.sha_version,
+                                                            self.iterations, self.workers,
+                                                            self.pool_mode):
+            user_name, offset = scheduled.popleft()
+            report.guesses += guesses
+            if found >= 0 and user_name not in report.cracked:
+                report.cracked[user_name] = self.words[offset + found]
+                if verbose:
+                    print(f'\t{user_name}: {report.cracked[user_name]}')
+        report.elapsed = time.perf_counter() - start
+        return report
+# ============================================================================||
+
+def parse_args(default_wd: str, default_db: str) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog = 'python3 crack_salted.py',
+        description = """
+        NIST Security InVITE Salted-Hash Dictionary Attack Python Script [in File crack_salted.py]
+
+        Runs the bad-passwords dictionary against the salted PBKDF2 hashes of
+        a Users_Top*H table and reports the guesses/sec and the projected time
+        of the attack for the different PBKDF2 iteration counts.""",
+        epilog='WARNING: Do not ever use any of these passwords if you expect to maintain your security posture!'
+    )
+    parser.add_argument("-wd", "--WorkDir",
+                        help = "Directory of the DB File [Default ~/si/db]",
+                        default = default_wd
+                        )
+    parser.add_argument("-db", "--Database",
+                        help = "Database file name [Default SI_DBF.db]",
+                        default = default_db
+                        )
+    parser.add_argument("-t", "--Table",
+                        help = "Salted table to attack [Default Users_Top500H]",
+                        default = 'Users_Top500H'
+                        )
+    parser.add_argument("-wl", "--WordList",
+                        help = "Dictionary of the attack [Default ./bp_top500_owasp22.txt]",
+                        default = './bp_top500_owasp22.txt'
+                        )
+    parser.add_argument("-n", "--Rows", type=int,
+                        help = "Attack only the first rows of the table [Default all]",
+                        default = 0
+                        )
+    parser.add_argument("-i", "--Iterations", type=int,
+                        help = "PBKDF2 iterations the table was hashed with [Default 100,000]",
+                        default = 100_000
+                        )
+    parser.add_argument("-sha", "--ShaVersion",
+                        help = "PBKDF2 hash the table was hashed with [Default sha512]",
+                        choices = ['sha256', 'sha512'],
+                        default = 'sha512'
+                        )
+    parser.add_argument("-w", "--Workers", type=int,
+                        help = "Number of the attack workers [Default CPU count]",
+                        default = None
+                        )
+    parser.add_argument("-pl", "--Pool",
+                        help = "Attack pool mode [Default process]",
+                        choices = pop.POOL_MODES,
+                        default = 'process'
+                        )
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args('~/si/db', 'SI_DBF.db')
+    dictionary = list(dbCreate.read_passwords(os.path.expanduser(args.WordList), dedupe=True))
+    attack = DictionaryAttack(dictionary, args.ShaVersion, args.Iterations,
+                              args.Workers, args.Pool)
+    with HashedUsersDB(args.WorkDir, args.Database) as users_db:
+        attack_report = attack.run(users_db.read_hashed_users(args.Table, args.Rows), verbose=True)
+    print(attack_report)
@@ -1,6 +1,11 @@
 import os
 import hmac
 import hashlib
+import threading
+import time
+import concurrent.futures as futures
+from collections import deque
+from itertools import islice
 
 
 ### ---------------------------------------------------------------------------|
@@ -28,6 +33,24 @@ def interlace(array1:list, array2:list) -> list:
     return result
 ### ---------------------------------------------------------------------------|
 
+SALT_SIZE = 32  # bytes of the newly generated salts
+
+# Unsalted digests used to demonstrate the rainbow-table attacks
+UNSALTED_ALGORITHMS = ('md5', 'sha256', 'sha512')
+
+def digest_password(password: str, algorithm: str = 'sha256') -> bytes:
+    """ Unsalted, single pass digest of the password (how NOT to store passwords)
+    Args:
+        password (str): the password to hash
+        algorithm (str, optional): 'md5'| 'sha256'| 'sha512'. Defaults to 'sha256'.
+    Returns:
+        bytes: the raw digest
+    """
+    if algorithm not in UNSALTED_ALGORITHMS:
+        raise ValueError(f'Unknown algorithm [{algorithm}], expected one of {UNSALTED_ALGORITHMS}')
+    return hashlib.new(algorithm, password.encode("utf-8"), usedforsecurity=False).digest()
+### ---------------------------------------------------------------------------|
+
 
 class PasswordOperations(object):
     """ Aggregator-Class for all Password Crypto operations
@@ -48,8 +71,22 @@ class PasswordOperations(object):
     ### -----------------------------------------------------------------------|
 
     def is_password_same(self, input_password:str, db_password_hash: str, db_password_salt: str) -> bool:
-        input_pwd_hash, _ = self.hash_password(input_password, db_password_salt)
-        return (input_pwd_hash == db_password_hash)
+        """ Verifies the password against the hex hash and salt of the DB
+            (a malformed hex value never matches)
+        """
+        try:
+            password_hash = bytes.fromhex(db_password_hash)
+            salt = bytes.fromhex(db_password_salt)
+        except ValueError:
+            return False
+        return self.is_password_bytes_same(input_password, password_hash, salt)
+    ### -----------------------------------------------------------------------|
+
+    def is_password_bytes_same(self, input_password: str, password_hash: bytes, salt: bytes) -> bool:
+        """ Verifies the password against the raw hash and salt
+            The digests are compared in constant time (no timing side-channel)
+        """
+        return hmac.compare_digest(self.hash_password_bytes(input_password, salt), password_hash)
     ### -----------------------------------------------------------------------|
 
     def hash_password(self, password:str, salt:str) -> tuple[str, str]:
@@ -63,6 +100,15 @@ class PasswordOperations(object):
         return (password_hash.hex(), salt_bytes.hex())
     ### -----------------------------------------------------------------------|
 
+    def hash_password_bytes(self, password: str, salt: bytes) -> bytes:
+        """ Hashes the password with the raw salt bytes
+        Returns:
+            bytes: the raw password-hash (no hex conversions on the way)
+        """
+        return hashlib.pbkdf2_hmac(self.sha_version, password.encode("utf-8"),
+                                   salt, self.iterations)
+    ### -----------------------------------------------------------------------|
+
     def hash_new_password(self, password: str) -> tuple[str, str]:
         """ For the new password generate new salt and call has_password
         Args:
@@ -70,9 +116,231 @@ class PasswordOperations(object):
         Returns:
             tuple[PWD_HASH:str, SALT:str]: the tuple containing bytes.hex() representations of the password-hash and salt
         """
-        salt = os.urandom(32)
-        return self.hash_password( password, salt.hex() )
+        salt = os.urandom(SALT_SIZE)
+        return (self.hash_password_bytes(password, salt).hex(), salt.hex())
+    ### -----------------------------------------------------------------------|
+
+    def hash_new_passwords(self, passwords, as_hex: bool = True):
+        """ Batch version of hash_new_password for seeding many passwords
+            The algorithm settings are bound once for the whole batch and the
+            salts stay raw bytes; the hex conversion is only done on request.
+        Args:
+            passwords (Iterable[str]): the new passwords to hash
+            as_hex (bool, optional): yield bytes.hex() strings instead of the raw bytes.
+                Defaults to True.
+        Yields:
+            tuple[PWD_HASH, SALT]: the password-hash and salt of each password in order
+        """
+        pbkdf2_hmac = hashlib.pbkdf2_hmac
+        urandom = os.urandom
+        sha_version, iterations = self.sha_version, self.iterations
+        for password in passwords:
+            salt = urandom(SALT_SIZE)
+            password_hash = pbkdf2_hmac(sha_version, password.encode("utf-8"), salt, iterations)
+            yield (password_hash.hex(), salt.hex()) if as_hex else (password_hash, salt)
+    ### -----------------------------------------------------------------------|
+### ===========================================================================|
+
+POOL_MODES = ('process', 'thread', 'serial')
+
+# PasswordOperations of a pool worker: one per worker process or thread, so the
+# pools running at the same time with different parameters do not share it
+_WORKER = threading.local()
+
+def _init_hash_worker(sha_version: str, iterations: int) -> None:
+    """ Pool initializer creating the worker's PasswordOperations once
+    """
+    _WORKER.operations = PasswordOperations(sha_version, iterations)
+
+def _hash_new_passwords_task(passwords: list, operations: PasswordOperations = None) -> list:
+    """ Pool task hashing a chunk of passwords with newly generated salts
+    """
+    operations = operations if operations else _WORKER.operations
+    return list(operations.hash_new_passwords(passwords))
+
+def _as_bytes(value) -> bytes:
+    """ Accepts both the raw bytes and the bytes.hex() strings stored in the DB
+    """
+    return value if isinstance(value, (bytes, bytearray)) else bytes.fromhex(value)
+
+def _verify_passwords_task(triples: list, operations: PasswordOperations = None) -> list:
+    """ Pool task verifying a chunk of (candidate, password_hash, salt) triples
+    """
+    operations = operations if operations else _WORKER.operations
+    return [operations.is_password_bytes_same(candidate, _as_bytes(pwd_hash), _as_bytes(salt))
+            for (candidate, pwd_hash, salt) in triples]
+
+def _find_password_task(jobs: list, operations: PasswordOperations = None) -> list:
+    """ Pool task searching the candidates of each (candidates, password_hash, salt)
+        job for the password, stopping at the first match
+    """
+    operations = operations if operations else _WORKER.operations
+    results = []
+    for (candidates, pwd_hash, salt) in jobs:
+        pwd_hash, salt = _as_bytes(pwd_hash), _as_bytes(salt)
+        found, guesses = -1, 0
+        for index, candidate in enumerate(candidates):
+            guesses += 1
+            if operations.is_password_bytes_same(candidate, pwd_hash, salt):
+                found = index
+                break
+        results.append((found, guesses))
+    return results
+### ---------------------------------------------------------------------------|
+
+def map_chunks_on_pool(task, items, sha_version: str, iterations: int,
+                       workers: int = None, pool_mode: str = 'process',
+                       chunk_size: int = None):
+    """ Runs the task over the consecutive chunks of items on a pool of workers
+        Each worker owns one PasswordOperations(sha_version, iterations) object;
+        the serial mode passes its own one with every chunk (the serial runs
+        may be interleaved on one thread).
+        The chunk results come back in the order of the input, the input may be
+        any iterable: only a few chunks per worker are in flight at a time.
+        Closing the generator early cancels the chunks that did not start yet.
+    Args:
+        task (Callable[[list, PasswordOperations], list]): module-level function
+            taking a chunk (and the operations to use, or None for the worker's)
+        items (Iterable): the input stream
+        sha_version (str): 'sha256'| 'sha512'
+        iterations (int): PBKDF2 iterations
+        workers (int, optional): the pool size. Defaults to os.cpu_count().
+        pool_mode (str, optional): 'process'| 'thread'| 'serial'. Defaults to 'process'.
+        chunk_size (int, optional): items per task call. Defaults to 32 for
+            processes (less inter-process traffic) and 4 otherwise.
+    Yields:
+        list: the result of the task for the next chunk
+    """
+    if pool_mode not in POOL_MODES:
+        raise ValueError(f'Unknown pool mode [{pool_mode}], expected one of {POOL_MODES}')
+    workers = workers if workers and workers > 0 else (os.cpu_count() or 1)
+    chunk_size = chunk_size if chunk_size else (32 if pool_mode == 'process' else 4)
+    iterator = iter(items)
+    if pool_mode == 'serial' or workers == 1:
+        operations = PasswordOperations(sha_version, iterations)
+        while chunk := list(islice(iterator, chunk_size)):
+            yield task(chunk, operations)
+        return
+    pool_class = (futures.ProcessPoolExecutor if pool_mode == 'process'
+                  else futures.ThreadPoolExecutor)
+    executor = pool_class(max_workers=workers, initializer=_init_hash_worker,
+                          initargs=(sha_version, iterations))
+    max_pending = workers * 2
+    pending = deque()
+    try:
+        while chunk := list(islice(iterator, chunk_size)):
+            pending.append(executor.submit(task, chunk))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+### ---------------------------------------------------------------------------|
+
+def hash_new_passwords_parallel(passwords, sha_version: str = 'sha512',
+                                iterations: int = 100_000, workers: int = None,
+                                pool_mode: str = 'process'):
+    """ Hashes the passwords with new salts on a pool of workers
+        The results come back in the order of the input passwords, so the
+        callers can rely on the index of a password in the stream. The input
+        may be any iterable (e.g. a file-reading generator), it is never
+        materialized.
+        hashlib.pbkdf2_hmac releases the GIL, so the 'thread' mode scales over
+        the cores as well, without the process start-up and pickling costs.
+    Args:
+        passwords (Iterable[str]): the passwords to hash
+        sha_version (str, optional): 'sha256'| 'sha512'. Defaults to 'sha512'.
+        iterations (int, optional): PBKDF2 iterations. Defaults to 100,000.
+        workers (int, optional): the pool size. Defaults to os.cpu_count().
+        pool_mode (str, optional): 'process'| 'thread'| 'serial'. Defaults to 'process'.
+    Yields:
+        tuple[PWD_HASH:str, SALT:str]: hex representations of the hash and salt
+    """
+    for hashes in map_chunks_on_pool(_hash_new_passwords_task, passwords,
+                                     sha_version, iterations, workers, pool_mode):
+        yield from hashes
+### ---------------------------------------------------------------------------|
+
+def find_passwords_parallel(jobs, sha_version: str = 'sha512',
+                            iterations: int = 100_000, workers: int = None,
+                            pool_mode: str = 'process'):
+    """ Searches the candidates of every (candidates, password_hash, salt) job on
+        a pool of workers, each job stops at its first match
+        The jobs are pulled from the iterable lazily (a few per worker ahead), so
+        a generator of jobs may skip the work that became useless meanwhile.
+    Yields:
+        tuple[int, int]: (index of the matching candidate or -1, guesses made) per job in order
+    """
+    for results in map_chunks_on_pool(_find_password_task, jobs, sha_version,
+                                      iterations, workers, pool_mode, chunk_size=1):
+        yield from results
+### ---------------------------------------------------------------------------|
+
+
+class VerificationReport(object):
+    """ Outcome and throughput of a batch password verification
+    """
+
+    def __init__(self) -> None:
+        self.results = []       # bool per verified triple in the input order
+        self.elapsed = 0.0      # seconds
+        self.stopped_early = False
     ### -----------------------------------------------------------------------|
+
+    @property
+    def checked(self) -> int:
+        """ Number of the verified triples """
+        return len(self.results)
+
+    @property
+    def matches(self) -> list:
+        """ Input indices of the triples whose candidate matched """
+        return [index for index, same in enumerate(self.results) if same]
+
+    @property
+    def rate(self) -> float:
+        """ Verifications per second """
+        return self.checked / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (f'Verified {self.checked} passwords in {self.elapsed:.3f} s '
+                f'({self.rate:.1f} per second), {len(self.matches)} matched'
+                f'{" (stopped at the first match)" if self.stopped_early else ""}')
+### ---------------------------------------------------------------------------|
+
+def verify_passwords_parallel(triples, sha_version: str = 'sha512',
+                              iterations: int = 100_000, workers: int = None,
+                              pool_mode: str = 'process',
+                              stop_on_match: bool = False) -> VerificationReport:
+    """ Verifies many (candidate, password_hash, salt) triples in one pass
+        The hash and salt may be raw bytes or the bytes.hex() strings of the DB,
+        the digests are compared with hmac.compare_digest.
+    Args:
+        triples (Iterable[tuple]): (candidate:str, password_hash, salt) to verify
+        sha_version (str, optional): 'sha256'| 'sha512'. Defaults to 'sha512'.
+        iterations (int, optional): PBKDF2 iterations. Defaults to 100,000.
+        workers (int, optional): the pool size. Defaults to os.cpu_count().
+        pool_mode (str, optional): 'process'| 'thread'| 'serial'. Defaults to 'process'.
+        stop_on_match (bool, optional): stop after the chunk holding the first
+            match (e.g. a dictionary attack on one row). Defaults to False.
+    Returns:
+        VerificationReport: per-triple results in input order and the throughput
+    """
+    report = VerificationReport()
+    start = time.perf_counter()
+    chunks = map_chunks_on_pool(_verify_passwords_task, triples,
+                                sha_version, iterations, workers, pool_mode)
+    try:
+        for results in chunks:
+            report.results.extend(results)
+            if stop_on_match and any(results):
+                report.stopped_early = True
+                break
+    finally:
+        chunks.close()
+    report.elapsed = time.perf_counter() - start
+    return report
 ### ===========================================================================|
 
 ### ===========================================================================|
@@ -108,10 +376,29 @@ def test_hashing() -> None:
     password = 'Password1!'
     print_pass_info('SHA-512', password, p512.hash_new_password(password))
     print_pass_info('SHA-256', password, p256.hash_new_password(password))
+
+def benchmark_batch_hashing(count: int = 200, iterations: int = 20_000) -> None:
+    """ Compares the former seeding loop (new PasswordOperations per password and
+        hex round-trips of the salt) against the hash_new_passwords batch
+    """
+    passwords = [f'Password{index}!' for index in range(count)]
+    start = time.perf_counter()
+    for password in passwords:
+        PasswordOperations('sha512', iterations).hash_password(password, os.urandom(SALT_SIZE).hex())
+    per_password = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in PasswordOperations('sha512', iterations).hash_new_passwords(passwords, as_hex=False):
+        pass
+    batch = time.perf_counter() - start
+    print(f'\nHashing {count} passwords with sha512 x {iterations:,} iterations:'
+          f'\n\tper-password objects: {per_password:.4f} s ({per_password/count*1e6:.1f} us/password)'
+          f'\n\tbatch API (raw bytes): {batch:.4f} s ({batch/count*1e6:.1f} us/password)'
+          f'\n\tgain: {(per_password - batch)/per_password:.2%}')
 ### ===========================================================================|
 
 if __name__ == "__main__":
  
     test_interlace1()
     test_interlace2()
-    test_hashing()
\ No newline at end of file
+    test_hashing()
+    benchmark_batch_hashing()
\ No newline at end of file
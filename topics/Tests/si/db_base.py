@@ -16,17 +16,34 @@
 __author__ = "Dmitry Cousin"
 __status__ = "Prototype"
 
+import bisect
+from collections import deque, namedtuple
 from datetime import datetime
 from enum import Enum
+from itertools import islice
+import logging
 import sqlite3 as sql
 import os
 from pathlib import Path
 import sys
-import traceback
+import threading
+import time
 # ============================================================================||
 
 
 PRINT_THRESHOLD_LEVEL = -2
+# The statement traces of BaseDB go to this logger: they are DEBUG records with
+# deferred %-arguments, so nothing is formatted unless DEBUG is enabled for it
+# (e.g. logging.getLogger('db_base').setLevel(logging.DEBUG)); the failures are
+# ERROR records with the caller's location and the traceback
+LOGGER = logging.getLogger(__name__)
+# The number of the latest statement states (and select keys) a BaseDB keeps
+STATUS_STACK_SIZE = 256
+# Upper bounds (seconds) of the statement latency histogram buckets; the last
+# bucket counts the statements slower than the last bound
+LATENCY_BUCKETS = (0.0001, 0.001, 0.01, 0.1, 1.0)
+# The rows __select__ fetches at a time
+SELECT_ARRAY_SIZE = 1000
 
 def get_location(level: int = 1) -> str:
     """ Gets location description for the call place to log exact function name, file, and line
@@ -36,6 +53,17 @@ def get_location(level: int = 1) -> str:
             f' at line: {locator.f_lineno}'
             f' of file: {locator.f_code.co_filename} ')
 
+def batched(iterable, size: int):
+    """ Splits the iterable into the lists of up to size elements
+        without materializing the whole iterable
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
 def print_if(str_to_print: str, message_level=0):
     """Conditional prompt function for debugging
 
@@ -82,8 +110,150 @@ class ScoreSuffix(Enum):
 
 
 
+class PooledConnection(object):
+    """ A pooled connection, the thread it belongs to, and the ids of the
+        BaseDB instances using it
+    """
+    def __init__(self, connection: sql.Connection, thread: threading.Thread):
+        self.connection = connection
+        self.thread = thread
+        self.owners = set()
+# ============================================================================||
+
+
+class ConnectionPool(object):
+    """ Thread-aware pool of reusable SQLite connections keyed by the database file
+        Every thread gets its own connection per database file (a transaction must
+        not be shared between threads). The objects of one thread working with the
+        same file share the connection, which is closed when the last of them
+        releases it; the connections of the finished threads are closed as well.
+    """
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__connections = dict()  # (db_name, thread-id) -> PooledConnection
+    # ------------------------------------------------------------------------|
+
+    def acquire(self, db_name: str, owner: int = 0) -> sql.Connection:
+        """ Returns the connection of the calling thread to the db_name
+            file opening it on the first request only
+        Args:
+            db_name (str): the database file
+            owner (int, optional): id of the object using the connection. Defaults to 0.
+        """
+        key = (db_name, threading.get_ident())
+        dead = []
+        with self.__lock:
+            pooled = self.__connections.get(key)
+            # A new thread may get the ident of a finished one: its entry is not ours
+            if pooled is None or pooled.thread is not threading.current_thread():
+                # A new thread: the good time to drop the ones that finished
+                dead = self.__pop_dead_threads()
+                pooled = PooledConnection(sql.connect(db_name, check_same_thread=False),
+                                          threading.current_thread())
+                self.__connections[key] = pooled
+            pooled.owners.add(owner)
+        for connection in dead:
+            connection.close()
+        return pooled.connection
+    # ------------------------------------------------------------------------|
+
+    def release(self, db_name: str, owner: int = 0) -> int:
+        """ The owner stops using its connections to the db_name file: the
+            connection of the calling thread is closed if no other object of
+            the thread uses it, and so are the connections of the finished
+            threads; the connections of the other running threads are left
+            to them (they may be in a transaction or a select)
+        Returns:
+            int: The number of the closed connections
+        """
+        key = (db_name, threading.get_ident())
+        with self.__lock:
+            for (pooled_key, pooled) in self.__connections.items():
+                if pooled_key[0] == db_name:
+                    pooled.owners.discard(owner)
+            connections = self.__pop_dead_threads()
+            pooled = self.__connections.get(key)
+            if (pooled is not None and pooled.thread is threading.current_thread()
+                    and not pooled.owners):
+                connections.append(self.__connections.pop(key).connection)
+        for connection in connections:
+            connection.close()
+        return len(connections)
+    # ------------------------------------------------------------------------|
+
+    def __pop_dead_threads(self) -> list:
+        """ Removes the connections of the finished threads (under the lock)
+        Returns:
+            list: the removed connections to close
+        """
+        dead_keys = [key for (key, pooled) in self.__connections.items()
+                     if not pooled.thread.is_alive()]
+        return [self.__connections.pop(key).connection for key in dead_keys]
+    # ------------------------------------------------------------------------|
+
+    def release_all(self) -> int:
+        """ Closes every connection known to the pool (at the end of the process)
+        """
+        with self.__lock:
+            connections = [pooled.connection for pooled in self.__connections.values()]
+            self.__connections.clear()
+        for connection in connections:
+            connection.close()
+        return len(connections)
+    # ------------------------------------------------------------------------|
+
+    def __len__(self) -> int:
+        with self.__lock:
+            return len(self.__connections)
+    # ------------------------------------------------------------------------|
+# ============================================================================||
+
+# The pool is shared by all the BaseDB instances of the process, so the objects
+# of a thread working with the same database file reuse the same connection.
+CONNECTION_POOL = ConnectionPool()
+
+
+class OpsStats(object):
+    """ Aggregate health of the statements run by a BaseDB in O(1) memory:
+        the ok/failed counts, the last error, and the latency histogram
+    """
+    def __init__(self):
+        self.ok_count = 0
+        self.failed_count = 0
+        self.last_error = None      # (command, error text) of the last failure
+        self.total_seconds = 0.0
+        self.latency_histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+    # ------------------------------------------------------------------------|
+
+    def record(self, seconds: float, command: str = '', error: Exception = None):
+        """ Counts one statement that took seconds (failed with the error) """
+        if error is None:
+            self.ok_count += 1
+        else:
+            self.failed_count += 1
+            self.last_error = (command, f'{type(error).__name__}: {error}')
+        self.total_seconds += seconds
+        self.latency_histogram[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+    # ------------------------------------------------------------------------|
+
+    def as_dict(self) -> dict:
+        """ The stats with the histogram keyed by the bucket bounds ('inf' last) """
+        count = self.ok_count + self.failed_count
+        return {'ok': self.ok_count, 'failed': self.failed_count,
+                'last_error': self.last_error,
+                'mean_seconds': self.total_seconds / count if count else 0.0,
+                'latency_histogram': dict(zip([*map(str, LATENCY_BUCKETS), 'inf'],
+                                              self.latency_histogram))}
+    # ------------------------------------------------------------------------|
+# ============================================================================||
+
+
 class BaseDB():
     """ Base class for SQLite database manipulation
+        The instance holds a pooled connection to its database file between the
+        statements. Use it as a context manager (or call close()) to release it:
+            with BaseDB(work_dir, db_file) as db:
+                db.__execute__(...)
     """
     def make_log_message(self, error)->str:
         """ Makes Log Message as specified
@@ -110,30 +280,32 @@ class BaseDB():
                  must_create_db: bool = True):
         """ Default constructor for SQLite wrapper
         """
-        print(f'1. @Base WDir={work_dir}\t DBF={db_file}')
+        debug = LOGGER.isEnabledFor(logging.DEBUG)
+        if debug:
+            LOGGER.debug('1. @Base WDir=%s\t DBF=%s', work_dir, db_file)
         the_db_name = (db_file if db_file 
                        else f'SI-Data.db')
         the_work_dir = (work_dir if work_dir
                         else Path(Path.home(), 'SI-DB-DATA'))
         the_db_file = Path(the_work_dir, the_db_name)
-        print(
-            f'2. @Base onInit\n\tDBN="{the_db_name}",'
-            f'\n\tWDIR = "{the_work_dir}",'
-            f'\n\tDBFP = "{the_db_file}"')
+        if debug:
+            LOGGER.debug('2. @Base onInit\n\tDBN="%s",\n\tWDIR = "%s",\n\tDBFP = "%s"',
+                         the_db_name, the_work_dir, the_db_file)
 
         self.__last_rows_affected__ = 0
-        self.stack_ops_state = list()
-        self.stack_select = list()
+        # The latest states only: a long-running process must not grow them
+        self.stack_ops_state = deque(maxlen=STATUS_STACK_SIZE)
+        self.stack_select = deque(maxlen=STATUS_STACK_SIZE)
+        self.ops_stats = OpsStats()
         self.db_suffix = '_DBF'
-        print_if(f'The Suffix Test: {self.db_suffix}')
         self.db_path = os.path.expanduser(the_work_dir)
         self.db_file = os.path.expanduser(
                         f'{the_db_name}{self.db_suffix}.db'
                         if not the_db_name.endswith('.db')
                         else the_db_name)
-        print_if(f'DB_File = [=- {self.db_file} -=]')
         temp_db_file = os.path.expanduser(Path(self.db_path, self.db_file))
-        print_if(f'Temp DB File = [{temp_db_file}]')
+        if debug:
+            LOGGER.debug('DB_File = [=- %s -=] Temp DB File = [%s]', self.db_file, temp_db_file)
         if not os.path.isdir(self.db_path):
             os.makedirs(self.db_path)
         if (not must_create_db) or (os.path.isdir(self.db_path) and not os.path.isfile(temp_db_file)):
@@ -147,9 +319,34 @@ class BaseDB():
         self.db_connection = None
     # ------------------------------------------------------------------------|
 
+    def __enter__(self):
+        return self
+    # ------------------------------------------------------------------------|
+
+    def __exit__(self, *args):
+        self.close()
+    # ------------------------------------------------------------------------|
+
+    def get_connection(self) -> sql.Connection:
+        """ Returns the pooled connection of the current thread to the database
+            (opens it on the first use)
+        """
+        return CONNECTION_POOL.acquire(str(self.db_name), id(self))
+    # ------------------------------------------------------------------------|
+
+    def close(self) -> int:
+        """ Releases the pooled connection of this object and thread (closed
+            when no other object of the thread uses it)
+        Returns:
+            int: The number of the closed connections
+        """
+        return CONNECTION_POOL.release(str(self.db_name), id(self))
+    # ------------------------------------------------------------------------|
+
     def init_database(self, db_name=None, db_working_dir=None):
         """ Initializes database
         """
+        self.close()    # The connections to the previous database are not needed
         self.db_working_dir =os.path.expanduser( db_working_dir if not (db_working_dir is None) \
             else Path(Path.home(), 'SI-Topics-DBs'))
         self.db_name = os.path.expanduser(db_name if not (db_name is None) \
@@ -166,88 +363,97 @@ class BaseDB():
         """
         last_id = None
         db = None
-        print_if(
-            f'!!!! Running Execute for {command} with {values} for DB={self.db_name}')
+        started = time.perf_counter()
+        debug = LOGGER.isEnabledFor(logging.DEBUG)
+        if debug:
+            LOGGER.debug('Running Execute for %s with %s for DB=%s', command, values, self.db_name)
         try:
-            print_if(f'\n\tDbName = {self.db_name}\n\tType= {type(self.db_name)}')
-            with sql.connect(str(self.db_name)) as db:
-                print_if('1. Opened DB')
+            db = self.get_connection()
+            with db:    # Commits on success and rolls back on exception
                 cur = db.cursor()
                 if values:
-                    print_if('2a. Run command from Tuple')
                     last_id = cur.execute(command, values).lastrowid
                 else:
-                    print_if('2b. Run command NO-Tuple-Data')
                     last_id = cur.execute(command).lastrowid
-                print_if('3. Count rows')
                 rows = cur.rowcount
-                print_if('4. Commit')
-                db.commit()
-                print_if('5. Update State')
-                self.stack_ops_state.append(
-                    ('OK.', f'Affected {rows} Row{"s" if rows>1 else ""}'))
+                if debug:
+                    LOGGER.debug('Affected %d rows, last id %s', rows, last_id)
+                self.track_status(
+                    ('OK.', f'Affected {rows} Row{"s" if rows>1 else ""}'), started)
         except sql.Error as sql_error:
-            print_if(get_location(2))
-            print_if(f'\nSQLite3 error: {sql_error.args}')
-            print_if(f'Exception class is: {sql_error.__class__}')
-            print_if('SQLite traceback: ')
-            error_type, error_value, error_trace_back = sys.exc_info()
-            extra = traceback.format_exception(error_type, error_value, error_trace_back)
-            print_if(sql_error)
-            print_if(extra)
+            LOGGER.error('SQLite3 error %s (%s) running:\n\t%s', sql_error.args,
+                         sql_error.__class__.__name__, command, exc_info=True, stacklevel=2)
+            self.track_status(
+                (f'\nFailed!\n', f'\tCommand Was:\n\t{command}', sql_error),
+                started, command, sql_error)
         except Exception as ex:
-            print_if(get_location(2))
-            print_if(f'6. Failed as : {ex}')
-            error_type, error_value, error_trace_back = sys.exc_info()
-            extra = traceback.format_exception(error_type, error_value, error_trace_back)
-            print_if(extra)            
-            self.stack_ops_state.append(
-                (f'\nFailed!\n', f'\tCommand Was:\n\t{command}', ex))
-            if db:
-                db.rollback()
-        finally:
-            if db:
-                print_if('6. Closing DB')
-                db.close()
+            LOGGER.error('Failed as: %s running:\n\t%s', ex, command,
+                         exc_info=True, stacklevel=2)
+            self.track_status(
+                (f'\nFailed!\n', f'\tCommand Was:\n\t{command}', ex), started, command, ex)
         return last_id
     # ------------------------------------------------------------------------|
 
-    def __select__(self, command: str, values: tuple) -> list:
-        """ Convergence method for all queries execution without return (Update/Insert)
+    def __select__(self, command: str, values: tuple = None,
+                   array_size: int = SELECT_ARRAY_SIZE, row_factory: str = 'tuple'):
+        """ Streams the rows of the query fetching them array_size rows at a
+            time (cursor.fetchmany), so a table scan runs in constant memory
+            The column names (from cursor.description) are pushed to
+            stack_select before the first row; a failure is recorded in
+            stack_ops_state and raised, so a cut stream is never taken
+            for the whole result.
+        Args:
+            command (str): the SELECT statement
+            values (tuple, optional): its parameters. Defaults to None.
+            array_size (int, optional): rows per fetch. Defaults to SELECT_ARRAY_SIZE.
+            row_factory (str, optional): 'tuple', 'row' (sqlite3.Row: by index
+                and by column name), or 'namedtuple'. Defaults to 'tuple'.
+        Yields:
+            the rows in the row_factory form
+        Raises:
+            sqlite3.Error: the query failed (before or after some rows)
         """
-        db = None
-        records = list()
+        rows = 0
+        started = time.perf_counter()
         try:
-            with sql.connect(str(self.db_name)) as db:
-                cur = db.cursor()
-                cur.execute(command, values)
-                bits = cur.fetchall()
-                rows = cur.rowcount
-                keys = cur.keys()
-                self.stack_select.append(keys)
-                for row in rows:
-                    records.append(row)
-                # db.commit()
-                self.__last_rows_affected__ = rows
-                self.stack_ops_state.append(
-                    ('OK.', f'Affected {rows} Row{"s" if rows>1 else ""}'))
-        except Exception as ex:
-            self.stack_ops_state.append(
-                (f'Failed!\n\t{ex}', f'\tCommand Was:\n\t{command}', ex))
-            if db:
-                db.rollback()
-        finally:
-            if db:
-                db.close()
-            return records
+            cur = self.get_connection().cursor()
+            if row_factory == 'row':
+                cur.row_factory = sql.Row
+            cur.arraysize = max(1, array_size)
+            cur.execute(command, values if values else ())
+            columns = tuple(column[0] for column in cur.description or ())
+            self.stack_select.append(columns)
+            make_row = (namedtuple('Row', columns, rename=True)._make
+                        if row_factory == 'namedtuple' else None)
+            while True:
+                batch = cur.fetchmany()
+                if not batch:
+                    break
+                rows += len(batch)
+                if make_row:
+                    yield from map(make_row, batch)
+                else:
+                    yield from batch
+            cur.close()
+            self.__last_rows_affected__ = rows
+            self.track_status(
+                ('OK.', f'Selected {rows} Row{"s" if rows>1 else ""}'), started)
+        except sql.Error as ex:
+            LOGGER.error('Select failed as: %s after %d rows running:\n\t%s',
+                         ex, rows, command, stacklevel=2)
+            self.track_status(
+                (f'Failed!\n\t{ex}', f'\tCommand Was:\n\t{command}', ex), started, command, ex)
+            raise
     # ------------------------------------------------------------------------|
 
-    def __select_array__(self, select_query: str, where_values: list):
-        """ Generic select Query of multiple value tuples
-            !!! the values parameter has to come in as a list of tuples !!!
+    def __select_array__(self, select_query: str, where_values: list = None,
+                         row_factory: str = 'tuple') -> list:
+        """ Generic select Query returning all the rows at once
+            (the where_values are the parameters of the query)
         """
-        # "insert into student (name, age, marks) values(?, ?, ?), (?, ?, ?),... (?, ?, ?);"
-        self.__select__(select_query, tuple(where_values))
+        return list(self.__select__(select_query,
+                                    tuple(where_values) if where_values else None,
+                                    row_factory=row_factory))
     # ------------------------------------------------------------------------|
 
     def __select_scalar__(self, command: str, values: tuple = None) -> int:
@@ -256,8 +462,10 @@ class BaseDB():
         """
         db = None
         scalar = -1
+        started = time.perf_counter()
         try:
-            with sql.connect(str(self.db_name)) as db:
+            db = self.get_connection()
+            with db:
                 sql_cur = db.cursor()
                 if values:
                     sql_cur.execute(command, values)
@@ -270,58 +478,58 @@ class BaseDB():
                     # !!! Do not touch the comma below
                     # It is tuple transcending
                     (scalar,) = tuple_or_none
-                db.commit()
                 self.__last_rows_affected__ = 1
-                self.stack_ops_state.append('Select Scalar OK.')
+                self.track_status('Select Scalar OK.', started)
         except Exception as ex:
-            print_if(get_location())
-            self.stack_ops_state.append(
-                (f'Failed!\n', f'\tCommand Was:\n\t{command}', ex))
-            if db:
-                db.rollback()
-        finally:
-            if db:
-                db.close()
+            LOGGER.error('Select scalar failed as: %s running:\n\t%s', ex, command,
+                         stacklevel=2)
+            self.track_status(
+                (f'Failed!\n', f'\tCommand Was:\n\t{command}', ex), started, command, ex)
         return scalar
     # ------------------------------------------------------------------------|
 
     def create_new_db(self, db_path: str = None) -> str:
-        """ Creates a new database file
+        """ Creates a new database file (by opening the pooled connection to it)
         """
-        connection = None
-        db_name = self.db_name
-        print(db_name)
+        LOGGER.debug('Creating %s (SQLite %s)', self.db_name, sql.sqlite_version)
         try:
-            connection = sql.connect(str(db_name))
-            print_if(sql.version)
+            self.get_connection()
         except Exception as ex:
-            print_if(get_location())
-            print_if(ex)
-        finally:
-            if connection:
-                connection.close()
+            LOGGER.error('Could not create %s: %s', self.db_name, ex, stacklevel=2)
     # ------------------------------------------------------------------------|
 
-    def __insert_many__(self, insert_query: str, values: list):
+    def __insert_many__(self, insert_query: str, values, batch_size: int = 0) -> int:
         """ Generic insert Query of multiple value tuples
-            !!! the values parameter has to come in as a list of tuples !!!
+            !!! the values parameter has to come in as an iterable of tuples !!!
+            With batch_size > 0 the rows are fed to executemany in chunks of that
+            size, so a generator of rows is never materialized, while all the
+            chunks still go into the one transaction.
+        Returns:
+            int: The number of the inserted rows (0 if the transaction failed)
         """
-        # "insert into student (name, age, marks) values(?, ?, ?), (?, ?, ?),... (?, ?, ?);"
-        db = None
+        # "insert into student (name, age, marks) values(?, ?, ?);"
+        inserted = 0
+        started = time.perf_counter()
         try:
-            with sql.connect(str(self.db_name)) as db:
+            db = self.get_connection()
+            with db:
                 cur = db.cursor()
-                cur.executemany(insert_query, values)
-                db.commit()
-            self.stack_ops_state.append("OK.")
+                chunks = batched(values, batch_size) if batch_size > 0 else (values,)
+                for chunk in chunks:
+                    cur.executemany(insert_query, chunk)
+                    inserted += cur.rowcount
+            self.__last_rows_affected__ = inserted
+            self.track_status(
+                ('OK.', f'Affected {inserted} Row{"s" if inserted>1 else ""}'), started)
         except Exception as ex:
-            print_if(get_location())
-            self.stack_ops_state.append(
+            LOGGER.error('Insert many failed as: %s after %d rows running:\n\t%s',
+                         ex, inserted, insert_query, stacklevel=2)
+            # The rows are not kept in the status, they may be a long stream
+            self.track_status(
                 (f'Failed!\n\t{ex}', f'\tCommand Was:\n\t{insert_query}'
-                 f'\tWith Params:\n\t{values}', ex))
-            db.rollback()
-        finally:
-            db.close()
+                 f'\tAfter Rows:\n\t{inserted}', ex), started, insert_query, ex)
+            inserted = 0
+        return inserted
     # ------------------------------------------------------------------------|
 
     def __insert__(self, insert_query: str, values: tuple):
@@ -377,7 +585,7 @@ class BaseDB():
             pass
         # Debugging the statement generation
         if debug_print:
-            print_if(cmd)
+            LOGGER.debug('%s', cmd)
         return cmd
     # ------------------------------------------------------------------------|
 
@@ -387,17 +595,28 @@ class BaseDB():
         """
         cmd = self.prepare_insert_statement(table_name, values, fields)
         if cmd:
-            print_if(f'Running:\n\t{cmd}\nwith values\n\t[{values}]')
+            LOGGER.debug('Running:\n\t%s\nwith values\n\t[%s]', cmd, values)
             return self.__insert__(cmd, values)
         else:
             # !!! TODO Fail Spectacularly !!!
             return None
     # ------------------------------------------------------------------------|
 
+    def track_status(self, state, started: float, command: str = '',
+                     error: Exception = None):
+        """ Keeps the state of the statement started at started (perf_counter)
+            on the bounded stack_ops_state and counts it in ops_stats
+        """
+        if error is not None:
+            error.with_traceback(None)  # The kept error must not keep the frames alive
+        self.stack_ops_state.append(state)
+        self.ops_stats.record(time.perf_counter() - started, command, error)
+    # ------------------------------------------------------------------------|
+
     def pop_last_status(self, kill_all: bool = False) -> tuple:
         """Pops and (optionally) clears the last operation status
         """
-        x = self.stack_ops_state.pop(-1)  # Pop the last entry
+        x = self.stack_ops_state.pop()  # Pop the last entry
         if kill_all:
             self.stack_ops_state.clear()
         return x
@@ -406,7 +625,7 @@ class BaseDB():
     def pop_select(self, kill_all: bool = False):
         """Pops and (optionally) clears the last select results
         """
-        ret_value = self.stack_select.pop(-1)
+        ret_value = self.stack_select.pop()
         if kill_all:
             self.stack_select.clear()
         return ret_value
@@ -433,8 +652,91 @@ class BaseDB():
 # ============================================================================||
 
 
+# logging - the BaseDB traces as they are; eager - the earlier print_if traces
+# (their f-strings built on every statement) with the threshold above them;
+# eager-print - the same at the default threshold, printing (to os.devnull)
+BENCHMARK_MODES = ('logging', 'eager', 'eager-print')
+
+
+class _EagerTraceDB(BaseDB):
+    """ BaseDB with the earlier __execute__ traces, the baseline of the benchmark:
+        the print_if f-strings are formatted before the threshold check
+    """
+
+    def __execute__(self, command: str, values: tuple = None):
+        last_id = None
+        started = time.perf_counter()
+        print_if(f'!!!! Running Execute for {command} with {values} for DB={self.db_name}')
+        try:
+            print_if(f'\n\tDbName = {self.db_name}\n\tType= {type(self.db_name)}')
+            db = self.get_connection()
+            with db:
+                print_if('1. Acquired DB')
+                cur = db.cursor()
+                if values:
+                    print_if('2a. Run command from Tuple')
+                    last_id = cur.execute(command, values).lastrowid
+                else:
+                    print_if('2b. Run command NO-Tuple-Data')
+                    last_id = cur.execute(command).lastrowid
+                print_if('3. Count rows')
+                rows = cur.rowcount
+                print_if('4. Update State')
+                self.track_status(
+                    ('OK.', f'Affected {rows} Row{"s" if rows>1 else ""}'), started)
+        except sql.Error as sql_error:
+            self.track_status(
+                (f'\nFailed!\n', f'\tCommand Was:\n\t{command}', sql_error),
+                started, command, sql_error)
+        return last_id
+# ============================================================================||
+
+
+def benchmark_statements(rows: int = 100000, work_dir: str = '', mode: str = 'logging') -> dict:
+    """ Measures the per-statement cost of BaseDB on rows single-row inserts
+        and as many scalar selects (fsync off, so the wrapper overhead shows)
+        The mode (one of BENCHMARK_MODES) picks the traces measured, so the
+        lazy logging can be compared with the earlier eager print_if path.
+    Returns:
+        dict: microseconds per insert and per select
+    """
+    import contextlib
+    import tempfile
+    global PRINT_THRESHOLD_LEVEL
+    if mode not in BENCHMARK_MODES:
+        raise ValueError(f'Unknown benchmark mode [{mode}], use one of {BENCHMARK_MODES}')
+    db_class = BaseDB if mode == 'logging' else _EagerTraceDB
+    threshold = PRINT_THRESHOLD_LEVEL
+    if mode == 'eager':
+        PRINT_THRESHOLD_LEVEL = 1   # above all the trace levels: nothing prints
+    try:
+        with contextlib.ExitStack() as stack:
+            if mode == 'eager-print':
+                stack.enter_context(contextlib.redirect_stdout(
+                    stack.enter_context(open(os.devnull, 'w', encoding='utf-8'))))
+            bench_dir = stack.enter_context(
+                tempfile.TemporaryDirectory(dir=work_dir if work_dir else None))
+            bench_db = stack.enter_context(db_class(bench_dir, 'Bench.db', must_create_db=False))
+            bench_db.get_connection().execute('PRAGMA synchronous=OFF')
+            bench_db.get_connection().execute('PRAGMA journal_mode=MEMORY')
+            bench_db.__execute__('CREATE TABLE Bench (id INTEGER PRIMARY KEY, name TEXT, hash TEXT)')
+            started = time.perf_counter()
+            for row in range(rows):
+                bench_db.__insert__('INSERT INTO Bench (name, hash) VALUES (?, ?)',
+                                    (f'user{row}', 'x' * 64))
+            insert_us = (time.perf_counter() - started) / rows * 1e6
+            started = time.perf_counter()
+            for row in range(rows):
+                bench_db.__select_scalar__('SELECT id FROM Bench WHERE id = ?', (row + 1,))
+            select_us = (time.perf_counter() - started) / rows * 1e6
+    finally:
+        PRINT_THRESHOLD_LEVEL = threshold
+    return {'mode': mode, 'rows': rows, 'insert_us': insert_us, 'select_scalar_us': select_us}
+# ============================================================================||
+
+
 if __name__ == "__main__":
-    #test_table = True
-    #if test_table:
-       
-    pass
\ No newline at end of file
+    # python3 db_base.py [rows] [mode] - all the BENCHMARK_MODES without a mode
+    for bench_mode in (sys.argv[2:3] if len(sys.argv) > 2 else BENCHMARK_MODES):
+        print(benchmark_statements(int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+                                   mode=bench_mode))
\ No newline at end of file
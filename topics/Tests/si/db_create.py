@@ -32,6 +32,46 @@ import cred_crypto as pop
 #        WHERE user_name='{user_name}' and password_text='{password}'
 #         """)
 
+# Rows handed to a single executemany call while seeding the tables
+INSERT_BATCH_SIZE = 5_000
+
+
+def read_passwords(pwd_file: str, dedupe: bool = False):
+    """ Streams the stripped passwords out of the bad-passwords file line by line
+        (the file is never read into memory as a whole)
+    Args:
+        pwd_file (str): the bad-passwords file, one password per line
+        dedupe (bool, optional): skip the repeated passwords. Defaults to False.
+            Keeps the set of the unique passwords seen so far, so the memory
+            grows with the unique passwords (one copy, not the whole file).
+    Yields:
+        str: the next password
+    """
+    seen = set()
+    with open(pwd_file, encoding='utf-8', errors='replace') as file:
+        for line in file:
+            password = line.strip()
+            if dedupe:
+                if password in seen:
+                    continue
+                seen.add(password)
+            yield password
+
+def load_pass_map(map_file: str) -> dict:
+    """ Loads the PassMap YAML mapping the table names to the bad-passwords files
+    Returns:
+        dict: {table_name: password_file} (empty if the YAML could not be read)
+    """
+    map_table_file = {}
+    with open(map_file, "r") as stream:
+        try:
+            map_table_file = yaml.safe_load(stream) or {}
+        except yaml.YAMLError as exc:
+            print(f'\n\nyaml.YAMLError:\n{exc}\n\n')
+        except Exception as general_ex:
+            print(f'\n\nGeneral Exception:\n{general_ex}\n\n')
+    return map_table_file
+
 # ============================================================================||
 
 class DbMaker(dbBase.BaseDB):
@@ -166,49 +206,35 @@ class DbMaker(dbBase.BaseDB):
                                 PRIMARY KEY("id" AUTOINCREMENT));"""
                         )
     # ------------------------------------------------------------------------|
-    def populate_db_schema_hash(self, pwd_file_in: str, table_name:str ):
+    def populate_db_schema_hash(self, pwd_file_in: str, table_name:str,
+                                workers: int = None, pool_mode: str = 'process'):
         """ Populates DB-File with password HASH and SALTS
         Args:
             pwd_file_in (str): THe data from the bad-passwords file
             table_name (str): the DB Table for filling in data
+            workers (int, optional): hashing pool size. Defaults to CPU count.
+            pool_mode (str, optional): 'process'| 'thread'| 'serial'. Defaults to 'process'.
         """
-        value_lines=[]
-        file_lines=[]
         pwd_file = os.path.expanduser(pwd_file_in)
         if os.path.isfile(pwd_file):
-            # read file lines
-            with open(pwd_file) as file:
-                file_lines = file.readlines()
-            # loop over strings read from file
-            for index, line in enumerate(file_lines, start=1):
-                password = line.strip()
-                ops = pop.PasswordOperations('sha512', 100_000)
-                pass_hash, salt = ops.hash_new_password(password)
-                value_lines.append(f"('dummy{index}', '{pass_hash}', '{salt}')")
-            values = "\n\t, ".join(value_lines)
-            insert =( f"INSERT INTO {table_name} ( user_name, password_hash, salt ) VALUES \n\t {values}")
-            # print(f'\n\n\n\t{insert}')
-            self.__insert__(insert, None)    
+            # read -> strip -> dedupe -> hash -> enumerate -> batch, all streamed
+            passwords = read_passwords(pwd_file, dedupe=True)
+            # The pool returns hashes in the order of passwords keeping dummyN stable
+            hashes = pop.hash_new_passwords_parallel(passwords, 'sha512', 100_000,
+                                                     workers=workers, pool_mode=pool_mode)
+            rows = ((f'dummy{index}', pass_hash, salt)
+                    for index, (pass_hash, salt) in enumerate(hashes, start=1))
+            insert = f"INSERT INTO {table_name} ( user_name, password_hash, salt ) VALUES (?, ?, ?)"
+            self.__insert_many__(insert, rows, batch_size=INSERT_BATCH_SIZE)
         else:
             print(f'The File [{pwd_file}] could not be found or is corrupted!')
     # ------------------------------------------------------------------------|
-    def populate_from_map_hash(self, map_file):
-        map_table_file = {}
+    def populate_from_map_hash(self, map_file, workers: int = None, pool_mode: str = 'process'):
         if os.path.isfile(map_file):    
-            with open(map_file, "r") as stream:
-                try:
-                    map_table_file = yaml.safe_load(stream)
-                except yaml.YAMLError as exc:
-                    print(f'\n\nyaml.YAMLError:\n{exc}\n\n')
-                    status = -1
-                except Exception as general_ex:
-                    print(f'\n\nGeneral Exception:\n{general_ex}\n\n')
-                    status = -10
-                finally:
-                    if stream:
-                        stream.close()
+            map_table_file = load_pass_map(map_file)
             for table, pwd_file in map_table_file.items():
-                self.populate_db_schema_hash( os.path.expanduser(pwd_file), table_name=f'{table}H')
+                self.populate_db_schema_hash( os.path.expanduser(pwd_file), table_name=f'{table}H',
+                                              workers=workers, pool_mode=pool_mode)
         else:
             print(f'The File [{map_file}] could not be found or is corrupted!')
     # ------------------------------------------------------------------------|
@@ -219,36 +245,20 @@ class DbMaker(dbBase.BaseDB):
             pwd_file_in (str): _description_
             table_name (str): _description_
         """
-        value_lines=[]
-        file_lines=[]
         pwd_file = os.path.expanduser(pwd_file_in)
         if os.path.isfile(pwd_file):
-            with open(pwd_file) as file:
-                file_lines = file.readlines()
-            for index, line in enumerate(file_lines, start=1):
-                value_lines.append(f"('dummy{index}', '{line.strip()}')")
-            values = "\n\t, ".join(value_lines)
-            insert =( f"INSERT INTO {table_name} ( user_name, password_text ) VALUES \n\t {values}")
-            # print(f'\n\n\n\t{insert}')
-            self.__insert__(insert, None)    
+            # read -> strip -> dedupe -> enumerate -> batch, all streamed
+            rows = ((f'dummy{index}', password)
+                    for index, password in enumerate(read_passwords(pwd_file, dedupe=True),
+                                                     start=1))
+            insert = f"INSERT INTO {table_name} ( user_name, password_text ) VALUES (?, ?)"
+            self.__insert_many__(insert, rows, batch_size=INSERT_BATCH_SIZE)
         else:
             print(f'The File [{pwd_file}] could not be found or is corrupted!')
     # ------------------------------------------------------------------------|
     def populate_from_map_text(self, map_file):
-        map_table_file = {}
         if os.path.isfile(map_file):    
-            with open(map_file, "r") as stream:
-                try:
-                    map_table_file = yaml.safe_load(stream)
-                except yaml.YAMLError as exc:
-                    print(f'\n\nyaml.YAMLError:\n{exc}\n\n')
-                    status = -1
-                except Exception as general_ex:
-                    print(f'\n\nGeneral Exception:\n{general_ex}\n\n')
-                    status = -10
-                finally:
-                    if stream:
-                        stream.close()
+            map_table_file = load_pass_map(map_file)
             for table, pwd_file in map_table_file.items():
                 self.populate_db_schema_simple( os.path.expanduser(pwd_file), table_name=table)
         else:
@@ -256,7 +266,7 @@ class DbMaker(dbBase.BaseDB):
     # ------------------------------------------------------------------------|
 # ============================================================================||
 
-def parse_args(default_wd: str, default_db: str, default_map_file:str ) -> tuple:
+def parse_args(default_wd: str, default_db: str, default_map_file:str ) -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         prog = 'python3 db_create.py',
         description = """
@@ -283,15 +293,25 @@ def parse_args(default_wd: str, default_db: str, default_map_file:str ) -> tuple
                         help = "YAML file with BAD PASSWORD FILE mapped to populate-enumerate tables",
                         default = default_map_file
                         ) 
+    parser.add_argument("-w", "--Workers", type=int,
+                        help = "Number of password hashing workers [Default CPU count]",
+                        default = None
+                        )
+    parser.add_argument("-pl", "--Pool",
+                        help = "Password hashing pool mode [Default process]",
+                        choices = pop.POOL_MODES,
+                        default = 'process'
+                        )
     args = parser.parse_args()
-    print(args.WorkDir, args.Database, args.PassMap)
-    return  (args.WorkDir, args.Database, args.PassMap)
+    print(args.WorkDir, args.Database, args.PassMap, args.Workers, args.Pool)
+    return  args
 
 if __name__ == "__main__":
      # Initialize parser
     default_wd = '~/si/db'
     default_db = 'SI_DBF.db'    
-    path, db, map_file = parse_args(default_wd, default_db,  '~/si/map_ubu.yaml')
+    args = parse_args(default_wd, default_db,  '~/si/map_ubu.yaml')
+    path, db, map_file = (args.WorkDir, args.Database, args.PassMap)
 
     if path and db: # should be 100% now, but still the elses are already written from before :)
         db_maker = DbMaker(db_path =path, db_name=db)
@@ -302,6 +322,8 @@ if __name__ == "__main__":
     else:
         db_maker = DbMaker(db_path =default_wd, db_name=default_db)
 
-    db_maker.create_db_schema()
-    db_maker.populate_from_map_text(map_file)
-    db_maker.populate_from_map_hash(map_file)
\ No newline at end of file
+    # One pooled connection serves the whole run and gets closed on exit
+    with db_maker:
+        db_maker.create_db_schema()
+        db_maker.populate_from_map_text(map_file)
+        db_maker.populate_from_map_hash(map_file, workers=args.Workers, pool_mode=args.Pool)
\ No newline at end of file
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+""" The module builds precomputed (unsalted) hash => password lookup tables
+    from the bad-passwords lists used to seed the Users_Top* tables and
+    demonstrates the cost of the lookups against the brute-force search
+# =============================================================================
+    This software was developed at the National Institute of Standards
+    and Technology by employees of the Federal Government in the course
+    of their official duties.  Pursuant to title 17 Section 105 of the
+    United States Code this software is not subject to copyright
+    protection and is in the public domain.  NIST assumes no
+    responsibility whatsoever for its use by other parties, and makes
+    no guarantees, expressed or implied, about its quality,
+    reliability, or any other characteristic.
+# =============================================================================
+    We would appreciate acknowledgement if the software is used.
+"""
+__author__ = "Dmitry Cousin"
+__status__ = "Prototype"
+
+import os
+import argparse
+import time
+
+import db_base as dbBase
+import db_create as dbCreate
+import cred_crypto as pop
+
+# ============================================================================||
+
+class RainbowDB(dbBase.BaseDB):
+    """ SQLite-stored lookup tables: one Rainbow_<algorithm> table per algorithm
+        keyed by the raw digest, so a lookup is a single B-tree search O(log n)
+    Args:
+        BaseDB ([type]): Extends a generic SQLite functionality from BaseDB
+    """
+    # ------------------------------------------------------------------------|
+
+    def __init__(self,
+                 db_path : str = '',
+                 db_name: str = '',
+                 must_create_db: bool = False
+                 ):
+        """ db_path - Dir for the database file
+            db_name - DB-file name
+        """
+        super().__init__(db_path, db_name, must_create_db=must_create_db)
+    # ------------------------------------------------------------------------|
+
+    @staticmethod
+    def table_name(algorithm: str) -> str:
+        """ Lookup table name for the algorithm
+        """
+        if algorithm not in pop.UNSALTED_ALGORITHMS:
+            raise ValueError(f'Unknown algorithm [{algorithm}], expected one of {pop.UNSALTED_ALGORITHMS}')
+        return f'Rainbow_{algorithm}'
+    # ------------------------------------------------------------------------|
+
+    def create_table(self, algorithm: str):
+        """ Creates the lookup table for the algorithm if it does not exist
+            The digest is the primary key of a WITHOUT ROWID table, so the
+            rows are stored right in the index B-tree.
+        """
+        self.__execute__(f""" CREATE TABLE IF NOT EXISTS
+                            "{self.table_name(algorithm)}" (
+                            "digest"	BLOB NOT NULL,
+                            "password"	TEXT NOT NULL,
+                            PRIMARY KEY("digest")) WITHOUT ROWID;"""
+                         )
+    # ------------------------------------------------------------------------|
+
+    def build_from_file(self, pwd_file_in: str, algorithms: tuple = pop.UNSALTED_ALGORITHMS) -> int:
+        """ Precomputes the digests of the bad-passwords file for every algorithm
+        Args:
+            pwd_file_in (str): the bad-passwords file
+            algorithms (tuple, optional): the digest algorithms. Defaults to all.
+        Returns:
+            int: the number of the stored rows
+        """
+        stored = 0
+        pwd_file = os.path.expanduser(pwd_file_in)
+        if not os.path.isfile(pwd_file):
+            print(f'The File [{pwd_file}] could not be found or is corrupted!')
+            return stored
+        for algorithm in algorithms:
+            self.create_table(algorithm)
+            rows = ((pop.digest_password(password, algorithm), password)
+                    for password in dbCreate.read_passwords(pwd_file))
+            insert = (f'INSERT OR IGNORE INTO {self.table_name(algorithm)}'
+                      f' ( digest, password ) VALUES (?, ?)')
+            stored += self.__insert_many__(insert, rows, batch_size=dbCreate.INSERT_BATCH_SIZE)
+        return stored
+    # ------------------------------------------------------------------------|
+
+    def build_from_map(self, map_file: str, algorithms: tuple = pop.UNSALTED_ALGORITHMS) -> int:
+        """ Precomputes the digests of every bad-passwords file of the PassMap YAML
+            (the same YAML db_create.py seeds the Users_Top* tables from)
+        """
+        stored = 0
+        if os.path.isfile(map_file):
+            for pwd_file in dbCreate.load_pass_map(map_file).values():
+                stored += self.build_from_file(pwd_file, algorithms)
+        else:
+            print(f'The File [{map_file}] could not be found or is corrupted!')
+        return stored
+    # ------------------------------------------------------------------------|
+
+    def lookup(self, digest, algorithm: str = 'sha256') -> str:
+        """ Finds the password of the unsalted digest
+        Args:
+            digest (bytes|str): the raw digest or its hex representation
+            algorithm (str, optional): the digest algorithm. Defaults to 'sha256'.
+        Returns:
+            str: the password or None when the digest is not in the table
+        """
+        digest = digest if isinstance(digest, bytes) else bytes.fromhex(digest)
+        password = self.__select_scalar__(
+            f'SELECT password FROM {self.table_name(algorithm)} WHERE digest = ?', (digest,))
+        return None if password == -1 else password
+    # ------------------------------------------------------------------------|
+# ============================================================================||
+
+
+def brute_force_lookup(digest: bytes, pwd_file: str, algorithm: str = 'sha256') -> str:
+    """ The attack without the precomputed table: hash the list until the digest matches
+        Costs O(n) digests per target instead of O(log n) comparisons
+    """
+    for password in dbCreate.read_passwords(pwd_file):
+        if pop.digest_password(password, algorithm) == digest:
+            return password
+    return None
+
+
+def benchmark_lookup(rainbow_db: RainbowDB, pwd_file: str,
+                     algorithm: str = 'sha256', samples: int = 100) -> dict:
+    """ Measures the indexed lookups against the brute-force search
+        for the digests of the passwords spread evenly over the file
+    Returns:
+        dict: timings in seconds and the speedup of the indexed lookup
+    """
+    passwords = list(dbCreate.read_passwords(os.path.expanduser(pwd_file)))
+    step = max(1, len(passwords) // samples)
+    targets = [pop.digest_password(password, algorithm) for password in passwords[::step]]
+
+    start = time.perf_counter()
+    built = rainbow_db.build_from_file(pwd_file, (algorithm,))
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indexed_found = sum(1 for digest in targets if rainbow_db.lookup(digest, algorithm) is not None)
+    indexed_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    brute_found = sum(1 for digest in targets
+                      if brute_force_lookup(digest, os.path.expanduser(pwd_file), algorithm) is not None)
+    brute_time = time.perf_counter() - start
+
+    stats = {
+        'algorithm': algorithm,
+        'passwords': len(passwords),
+        'targets': len(targets),
+        'build_seconds': build_time,
+        'rows_built': built,
+        'indexed_found': indexed_found,
+        'indexed_per_lookup': indexed_time / len(targets),
+        'brute_found': brute_found,
+        'brute_per_lookup': brute_time / len(targets),
+        'speedup': brute_time / indexed_time if indexed_time > 0 else float('inf'),
+    }
+    print(f'\n{algorithm}: {len(targets)} targets over {len(passwords)} passwords'
+          f'\n\tTable build (one time): {build_time:.4f} s'
+          f'\n\tIndexed lookup: {stats["indexed_per_lookup"]*1e6:.1f} us per target, found {indexed_found}'
+          f'\n\tBrute force:    {stats["brute_per_lookup"]*1e6:.1f} us per target, found {brute_found}'
+          f'\n\tSpeedup: x{stats["speedup"]:.1f}')
+    return stats
+# ============================================================================||
+
+def parse_args(default_wd: str, default_db: str, default_map_file:str ) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog = 'python3 db_rainbow.py',
+        description = """
+        NIST Security InVITE Rainbow-Table Builder Python Script [in File db_rainbow.py]
+
+        Precomputes the unsalted hash => password lookup tables from the same
+        bad-passwords files the PassMap YAML maps to the Users_Top* tables and
+        (optionally) benchmarks the lookups against the brute-force search.""",
+        epilog='WARNING: Do not ever use any of these passwords if you expect to maintain your security posture!'
+    )
+    parser.add_argument("-wd", "--WorkDir",
+                        help = "Directory inside of which to Create DB File [Default ~/si/db]",
+                        default = default_wd
+                        )
+    parser.add_argument("-db", "--Database",
+                        help = "Database file name [Default SI_Rainbow.db]",
+                        default = default_db
+                        )
+    parser.add_argument("-pm", "--PassMap",
+                        help = "YAML file with BAD PASSWORD FILE mapped to populate-enumerate tables",
+                        default = default_map_file
+                        )
+    parser.add_argument("-a", "--Algorithms", nargs='+',
+                        help = "Unsalted digest algorithms [Default all]",
+                        choices = pop.UNSALTED_ALGORITHMS,
+                        default = list(pop.UNSALTED_ALGORITHMS)
+                        )
+    parser.add_argument("-bm", "--Benchmark", action='store_true',
+                        help = "Benchmark the lookups against the brute force instead of building the tables"
+                        )
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args('~/si/db', 'SI_Rainbow.db', '~/si/map_ubu.yaml')
+    with RainbowDB(db_path=args.WorkDir, db_name=args.Database) as rainbow_db:
+        if args.Benchmark:
+            for pwd_file in dbCreate.load_pass_map(os.path.expanduser(args.PassMap)).values():
+                for algorithm in args.Algorithms:
+                    benchmark_lookup(rainbow_db, pwd_file, algorithm)
+        else:
+            rows = rainbow_db.build_from_map(os.path.expanduser(args.PassMap), tuple(args.Algorithms))
+            print(f'Stored {rows} precomputed digests in {rainbow_db.db_name}')
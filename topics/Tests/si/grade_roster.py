@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+""" The module grades a whole class roster of the student VMs in one run:
+    the grading jobs are scheduled over a bounded pool of worker processes
+    and the results are consolidated into one SQLite store and a JSON file
+# =============================================================================
+    This software was developed at the National Institute of Standards
+    and Technology by employees of the Federal Government in the course
+    of their official duties.  Pursuant to title 17 Section 105 of the
+    United States Code this software is not subject to copyright
+    protection and is in the public domain.  NIST assumes no
+    responsibility whatsoever for its use by other parties, and makes
+    no guarantees, expressed or implied, about its quality,
+    reliability, or any other characteristic.
+# =============================================================================
+    We would appreciate acknowledgement if the software is used.
+
+    The roster is a CSV file with a header line or a YAML list of mappings,
+    one student VM per row:
+        user,port,key,homework[,vm,app,address]
+        student1,2021,~/si/keys/student1.pri,3
+"""
+__author__ = "Dmitry Cousin"
+__status__ = "Prototype"
+
+import os
+import argparse
+import csv
+import json
+import multiprocessing
+import sys
+import time
+from concurrent import futures
+from datetime import datetime
+
+import yaml
+
+import db_base as dbBase
+from si_async_session import AsyncSessionSI, run_sessions
+
+ROSTER_FIELDS = ('user', 'port', 'key', 'homework', 'vm', 'app', 'address')
+# process - a fresh interpreter per student, thread - all the students in this one
+POOL_MODES = ('process', 'thread')
+# A fresh worker process per student needs max_tasks_per_child (Python 3.11+);
+# the older ones reuse the workers, the grade_student contexts keep the jobs apart
+CHILD_LIMITS = {'max_tasks_per_child': 1} if sys.version_info >= (3, 11) else {}
+# Seconds the probe waits for the first prompt of the student app
+PROBE_TIMEOUT = 30.0
+# ============================================================================||
+
+
+def load_roster(roster_file: str, default_homework: int = 3) -> list:
+    """ Reads the roster (CSV with a header or YAML list) into the job dicts
+    Args:
+        roster_file (str): the .csv or .yaml/.yml roster
+        default_homework (int, optional): for the rows without one. Defaults to 3.
+    Returns:
+        list: dict per student with the ROSTER_FIELDS keys
+    """
+    roster_file = os.path.expanduser(roster_file)
+    with open(roster_file, 'r', encoding='utf-8', newline='') as roster_data:
+        if roster_file.endswith(('.yaml', '.yml')):
+            rows = yaml.safe_load(roster_data) or []
+        else:
+            rows = list(csv.DictReader(roster_data))
+    roster = []
+    for line, row in enumerate(rows, start=1):
+        row = {str(key).strip().lower(): str(value).strip()
+               for key, value in row.items() if value is not None}
+        if not row.get('user'):
+            print(f'Roster [{roster_file}] row {line} has no user and is skipped')
+            continue
+        job = {field: row.get(field, '') for field in ROSTER_FIELDS}
+        job['port'] = job['port'] or '2020'
+        job['homework'] = int(job['homework'] or default_homework)
+        roster.append(job)
+    return roster
+# ------------------------------------------------------------------------|
+
+
+def make_job_args(job: dict) -> list:
+    """ The test_homework.py command line of the roster job """
+    args = ['-u', job['user'], '-hw', str(job['homework']), '-w', str(job['port'])]
+    for (option, field) in (('-k', 'key'), ('-t', 'vm'), ('-r', 'app'), ('-a', 'address')):
+        if job.get(field):
+            args.extend([option, os.path.expanduser(job[field]) if field == 'key' else job[field]])
+    return args
+# ------------------------------------------------------------------------|
+
+
+def make_probe_command(job: dict) -> list:
+    """ The ssh command starting the app of the roster job """
+    key = ['-i', os.path.expanduser(job['key'])] if job.get('key') else []
+    return (['ssh', f'{job["user"]}@{job["address"] or "localhost"}', '-p', job['port']] + key
+            + ['-o', 'StrictHostKeyChecking=no', '-o', 'BatchMode=yes', '-q',
+               job['app'] or f'python3 hw{job["homework"]}.py'])
+
+
+async def probe_student(job: dict) -> str:
+    """ Starts the app of the student VM and waits for its first prompt
+    Returns:
+        str: '' when the app prompted, otherwise what went wrong
+    """
+    async with AsyncSessionSI(make_probe_command(job), step_timeout=PROBE_TIMEOUT) as session:
+        response = await session.expect(':')
+    if session.timed_out:
+        return f'no prompt in {PROBE_TIMEOUT:.0f} s: {response[-200:]!r}'
+    if not response.endswith(':'):
+        return f'the app exited: {response[-200:]!r}'
+    return ''
+
+
+def probe_roster(roster: list, limit: int = 32) -> list:
+    """ Probes all the student VMs concurrently, limit sessions at a time
+        (one event loop drives them, no thread or process per student)
+    Returns:
+        list: the probe_student messages in the roster order
+    """
+    return [f'{type(result).__name__}: {result}' if isinstance(result, Exception) else result
+            for result in run_sessions((probe_student(job) for job in roster), limit)]
+# ------------------------------------------------------------------------|
+
+
+def grade_student(job: dict) -> dict:
+    """ Grades one student VM (in a worker process or a worker thread)
+        Every job builds its own TestContext, so the jobs sharing a process
+        do not see each other's logger, server, or VM home.
+    Returns:
+        dict: the job, its status ('GRADED' or 'ERROR'), and the test records
+    """
+    import si_server_utils as utils
+    import si_server_test_utils as test_utils
+    import test_homework
+    from test_suites import TestContext
+
+    outcome = dict(job, status='ERROR', message='', tests=[], elapsed=0.0)
+    start = time.perf_counter()
+    context = TestContext()
+    try:
+        try:
+            context.init_context(utils.VmTestArguments(args=make_job_args(job)))
+        except SystemExit as ex:    # init_context exits on the bad keys and user names
+            raise RuntimeError('the test context setup failed (see the log)') from ex
+        results = test_homework.run_report_tests(context)
+        outcome['tests'] = [test_utils.serializable_test_record(record)
+                            for record in results.test_results]
+        outcome['status'] = 'GRADED'
+    except Exception as ex:
+        outcome['message'] = f'{type(ex).__name__}: {ex}'
+    finally:
+        context.close()
+    outcome['elapsed'] = time.perf_counter() - start
+    return outcome
+# ============================================================================||
+
+
+class GradesDB(dbBase.BaseDB):
+    """ Consolidated results of the roster runs: one Grading_Results row per
+        graded student VM and run
+    """
+
+    def __init__(self, db_path: str = '', db_name: str = ''):
+        super().__init__(db_path, db_name, must_create_db=False)
+        self.__execute__(""" CREATE TABLE IF NOT EXISTS
+                            "Grading_Results" (
+                            "id"	INTEGER NOT NULL UNIQUE,
+                            "run_stamp"	TEXT NOT NULL,
+                            "user_name"	TEXT NOT NULL,
+                            "tcp_port"	TEXT,
+                            "homework"	INTEGER,
+                            "status"	TEXT NOT NULL,
+                            "tests"	INTEGER DEFAULT 0,
+                            "successes"	INTEGER DEFAULT 0,
+                            "failures"	INTEGER DEFAULT 0,
+                            "errors"	INTEGER DEFAULT 0,
+                            "elapsed"	REAL,
+                            "message"	TEXT,
+                            "details"	TEXT,
+                            PRIMARY KEY("id" AUTOINCREMENT));"""
+                         )
+    # ------------------------------------------------------------------------|
+
+    def store_outcome(self, run_stamp: str, outcome: dict):
+        """ Records the outcome of grade_student """
+        results = [test['result'] for test in outcome['tests']]
+        self.__insert__(""" INSERT INTO Grading_Results
+                            ( run_stamp, user_name, tcp_port, homework, status, tests,
+                              successes, failures, errors, elapsed, message, details )
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                        (run_stamp, outcome['user'], outcome['port'], outcome['homework'],
+                         outcome['status'], len(results), results.count('SUCCESS'),
+                         results.count('FAILURE'), results.count('ERROR'),
+                         outcome['elapsed'], outcome['message'], json.dumps(outcome['tests'])))
+    # ------------------------------------------------------------------------|
+# ============================================================================||
+
+
+class RosterGrader(object):
+    """ Schedules the grading jobs of the roster over a bounded worker pool
+        The jobs mostly wait on the VMs, so the thread pool grades without
+        paying the interpreter start-up and the imports per student; the
+        process pool (max_tasks_per_child=1 on Python 3.11+, see CHILD_LIMITS)
+        isolates the crashing runs.
+    """
+
+    def __init__(self, roster: list, workers: int = 4, grades_db: GradesDB = None,
+                 pool_mode: str = 'process', probe: bool = False):
+        """ probe - skip the students whose app does not prompt (see probe_roster) """
+        self.roster = roster
+        self.probe = probe
+        self.workers = max(1, workers)
+        self.grades_db = grades_db
+        self.pool_mode = pool_mode
+        self.run_stamp = datetime.now().strftime('%Y-%m-%d-@-%Hh-%Mm-%Ss')
+    # ------------------------------------------------------------------------|
+
+    def run(self) -> list:
+        """ Grades every student of the roster
+        Returns:
+            list: the outcomes of grade_student in the roster order
+        """
+        outcomes = [None] * len(self.roster)
+        start = time.perf_counter()
+        if self.probe:
+            for (index, message) in enumerate(probe_roster(self.roster)):
+                if message:
+                    outcomes[index] = dict(self.roster[index], status='ERROR', tests=[],
+                                           elapsed=0.0, message=f'probe: {message}')
+                    self.record(outcomes, outcomes[index])
+        if self.pool_mode == 'thread':
+            executor = futures.ThreadPoolExecutor(max_workers=self.workers)
+        else:
+            executor = futures.ProcessPoolExecutor(max_workers=self.workers,
+                                                   mp_context=multiprocessing.get_context('spawn'),
+                                                   **CHILD_LIMITS)
+        with executor:
+            jobs = {executor.submit(grade_student, job): index
+                    for index, job in enumerate(self.roster) if outcomes[index] is None}
+            for done in futures.as_completed(jobs):
+                index = jobs[done]
+                try:
+                    outcome = done.result()
+                except Exception as ex:     # the worker process died
+                    outcome = dict(self.roster[index], status='ERROR', tests=[],
+                                   elapsed=0.0, message=f'{type(ex).__name__}: {ex}')
+                outcomes[index] = outcome
+                self.record(outcomes, outcome)
+        print(f'Graded {len(outcomes)} VMs on {self.workers} {self.pool_mode} workers'
+              f' in {time.perf_counter() - start:.1f} s')
+        return outcomes
+    # ------------------------------------------------------------------------|
+
+    def record(self, outcomes: list, outcome: dict):
+        """ Stores and prints the outcome of one student """
+        if self.grades_db is not None:
+            self.grades_db.store_outcome(self.run_stamp, outcome)
+        print(f'[{sum(1 for o in outcomes if o)}/{len(outcomes)}]'
+              f' {outcome["user"]}@{outcome["port"]} HW{outcome["homework"]}:'
+              f' {outcome["status"]} {outcome["message"]}')
+    # ------------------------------------------------------------------------|
+
+    def export_json(self, outcomes: list, json_file: str) -> str:
+        """ Writes the consolidated outcomes of the run
+        Returns:
+            str: the written file
+        """
+        json_file = os.path.expanduser(json_file)
+        os.makedirs(os.path.dirname(os.path.abspath(json_file)), exist_ok=True)
+        with open(json_file, 'w', encoding='utf-8') as json_data:
+            json.dump({'run_stamp': self.run_stamp, 'outcomes': outcomes}, json_data, indent=1)
+        return json_file
+    # ------------------------------------------------------------------------|
+# ============================================================================||
+
+def parse_args(default_wd: str, default_db: str) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog = 'python3 grade_roster.py',
+        description = """
+        NIST Security InVITE Roster Grading Python Script [in File grade_roster.py]
+
+        Grades every student VM of the roster with the test_homework.py suites
+        on a bounded pool of worker processes and consolidates the results.""",
+    )
+    parser.add_argument("-rs", "--Roster", required=True,
+                        help = "CSV or YAML roster: user, port, key, homework[, vm, app, address]"
+                        )
+    parser.add_argument("-hw", "--Homework", type=int, choices=range(1, 6),
+                        help = "Homework of the roster rows without one [Default 3]",
+                        default = 3
+                        )
+    parser.add_argument("-w", "--Workers", type=int,
+                        help = "Number of the VMs graded at a time [Default 4]",
+                        default = 4
+                        )
+    parser.add_argument("-pl", "--Pool",
+                        help = "Run the jobs in worker processes or threads [Default process]",
+                        choices = POOL_MODES,
+                        default = 'process'
+                        )
+    parser.add_argument("-pr", "--Probe", action='store_true',
+                        help = "First check concurrently that every student app prompts,"
+                               " and grade only those that do"
+                        )
+    parser.add_argument("-wd", "--WorkDir",
+                        help = "Directory of the results DB File [Default ~/si/db]",
+                        default = default_wd
+                        )
+    parser.add_argument("-db", "--Database",
+                        help = "Results database file name [Default SI_Grades.db]",
+                        default = default_db
+                        )
+    parser.add_argument("-js", "--Json",
+                        help = "Consolidated JSON results [Default ~/si/results/roster-<run>.json]",
+                        default = ''
+                        )
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args('~/si/db', 'SI_Grades.db')
+    with GradesDB(args.WorkDir, args.Database) as results_db:
+        grader = RosterGrader(load_roster(args.Roster, args.Homework), args.Workers, results_db,
+                              args.Pool, args.Probe)
+        roster_outcomes = grader.run()
+    json_path = args.Json if args.Json else f'~/si/results/roster-{grader.run_stamp}.json'
+    print(f'Results saved to {results_db.db_name} and {grader.export_json(roster_outcomes, json_path)}')
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+""" The module implements the chain-based (Hellman/Oechslin) rainbow tables
+    over the unsalted digests of cred_crypto and measures their time-memory
+    trade-off: table size vs. crack time vs. success rate
+# =============================================================================
+    This software was developed at the National Institute of Standards
+    and Technology by employees of the Federal Government in the course
+    of their official duties.  Pursuant to title 17 Section 105 of the
+    United States Code this software is not subject to copyright
+    protection and is in the public domain.  NIST assumes no
+    responsibility whatsoever for its use by other parties, and makes
+    no guarantees, expressed or implied, about its quality,
+    reliability, or any other characteristic.
+# =============================================================================
+    We would appreciate acknowledgement if the software is used.
+
+    A chain starts at a password, hashes it, reduces the digest back to a
+    password of the keyspace with the reduction function of the position in
+    the chain, hashes that one, and so on chain_length times. Only the start
+    and the end of each chain are stored: chain_length times less memory than
+    the flat lookup table, paid for with up to chain_length^2 / 2 digests and
+    reductions per cracked digest. Different reduction functions per position
+    (the "rainbow") keep the merging chains from duplicating each other.
+"""
+__author__ = "Dmitry Cousin"
+__status__ = "Prototype"
+
+import os
+import argparse
+import math
+import random
+import time
+
+import db_create as dbCreate
+import cred_crypto as pop
+
+# Bytes needed to store one chain: start and end keyspace indices
+CHAIN_BYTES = 16
+# ============================================================================||
+
+
+class DictionaryKeyspace(object):
+    """ Keyspace of the listed passwords (e.g. the Users_Top500 wordlist)
+        The reduction picks a word of the list by its index
+    """
+
+    def __init__(self, words: list):
+        self.words = list(words)
+        self.size = len(self.words)
+
+    def password(self, index: int) -> str:
+        """ The password at the keyspace index """
+        return self.words[index]
+# ============================================================================||
+
+
+class CharsetKeyspace(object):
+    """ Keyspace of all the passwords of 1 up to max_length characters of the charset
+        (indices enumerate the shorter passwords first)
+    """
+
+    def __init__(self, charset: str = 'abcdefghijklmnopqrstuvwxyz0123456789', max_length: int = 4):
+        self.charset = charset
+        self.max_length = max_length
+        base = len(charset)
+        self.length_sizes = [base ** length for length in range(1, max_length + 1)]
+        self.size = sum(self.length_sizes)
+
+    def password(self, index: int) -> str:
+        """ The password at the keyspace index """
+        base = len(self.charset)
+        for length, length_size in enumerate(self.length_sizes, start=1):
+            if index < length_size:
+                break
+            index -= length_size
+        characters = []
+        for _ in range(length):
+            index, digit = divmod(index, base)
+            characters.append(self.charset[digit])
+        return ''.join(characters)
+# ============================================================================||
+
+
+class RainbowChainTable(object):
+    """ One rainbow table: the chain ends mapped to their starts
+    """
+
+    def __init__(self, keyspace, algorithm: str = 'sha256',
+                 chain_length: int = 100, table_index: int = 0):
+        """ Creates an empty table
+        Args:
+            keyspace (DictionaryKeyspace|CharsetKeyspace): the passwords covered by the table
+            algorithm (str, optional): the unsalted digest algorithm. Defaults to 'sha256'.
+            chain_length (int, optional): the reductions per chain. Defaults to 100.
+            table_index (int, optional): selects the family of the reduction functions,
+                the tables of a set must differ. Defaults to 0.
+        """
+        self.keyspace = keyspace
+        self.algorithm = algorithm
+        self.chain_length = chain_length
+        self.table_index = table_index
+        self.endpoints = dict()     # chain end index -> list of chain start indices
+        self.chain_count = 0
+    # ------------------------------------------------------------------------|
+
+    def reduce(self, digest: bytes, position: int) -> int:
+        """ Reduction function of the chain position: digest -> keyspace index
+        """
+        value = int.from_bytes(digest[:8], 'big')
+        return (value + position + self.table_index * 0x9E3779B1) % self.keyspace.size
+
+    def digest(self, index: int) -> bytes:
+        """ Digest of the password at the keyspace index """
+        return pop.digest_password(self.keyspace.password(index), self.algorithm)
+    # ------------------------------------------------------------------------|
+
+    def walk(self, index: int, first: int, last: int) -> int:
+        """ Walks the chain from the index at position first up to position last
+        Returns:
+            int: the keyspace index at the position last
+        """
+        for position in range(first, last):
+            index = self.reduce(self.digest(index), position)
+        return index
+    # ------------------------------------------------------------------------|
+
+    def build(self, chain_count: int, seed: int = 0) -> int:
+        """ Generates chain_count chains from distinct random starts
+        Returns:
+            int: the number of the distinct chain ends (merged chains share one)
+        """
+        generator = random.Random(seed * 1_000_003 + self.table_index)
+        count = min(chain_count, self.keyspace.size)
+        starts = (generator.sample(range(self.keyspace.size), count)
+                  if count < self.keyspace.size else range(self.keyspace.size))
+        for start in starts:
+            end = self.walk(start, 0, self.chain_length)
+            self.endpoints.setdefault(end, []).append(start)
+        self.chain_count += count
+        return len(self.endpoints)
+    # ------------------------------------------------------------------------|
+
+    def crack(self, digest: bytes) -> str:
+        """ Looks the digest up assuming it sits at every chain position in turn
+            (from the last one backwards, the cheapest to check first)
+        Returns:
+            str: the password or None when the table does not cover the digest
+        """
+        for position in range(self.chain_length - 1, -1, -1):
+            end = self.walk(self.reduce(digest, position), position + 1, self.chain_length)
+            for start in self.endpoints.get(end, ()):
+                # Rebuild the chain up to the position to tell a hit from a false alarm
+                index = self.walk(start, 0, position)
+                if self.digest(index) == digest:
+                    return self.keyspace.password(index)
+        return None
+    # ------------------------------------------------------------------------|
+
+    @property
+    def stored_bytes(self) -> int:
+        """ Memory the chain starts and ends take (compact storage estimate) """
+        return sum(len(starts) for starts in self.endpoints.values()) * CHAIN_BYTES
+# ============================================================================||
+
+
+class RainbowTableSet(object):
+    """ Several rainbow tables with different reduction functions over one keyspace
+    """
+
+    def __init__(self, keyspace, algorithm: str = 'sha256',
+                 chain_length: int = 100, table_count: int = 4):
+        self.tables = [RainbowChainTable(keyspace, algorithm, chain_length, table_index)
+                       for table_index in range(table_count)]
+
+    def build(self, chains_per_table: int, seed: int = 0) -> int:
+        """ Builds all the tables
+        Returns:
+            int: the total number of the stored chains
+        """
+        for table in self.tables:
+            table.build(chains_per_table, seed)
+        return sum(table.chain_count for table in self.tables)
+
+    def crack(self, digest) -> str:
+        """ Cracks the digest (bytes or hex) with the tables one by one
+        """
+        digest = digest if isinstance(digest, bytes) else bytes.fromhex(digest)
+        for table in self.tables:
+            password = table.crack(digest)
+            if password is not None:
+                return password
+        return None
+
+    @property
+    def stored_bytes(self) -> int:
+        return sum(table.stored_bytes for table in self.tables)
+# ============================================================================||
+
+
+def benchmark_trade_off(passwords: list, algorithm: str = 'sha256',
+                        configurations: list = ((5, 1), (10, 1), (10, 4), (25, 4), (50, 4), (100, 4)),
+                        coverage: float = 1.0, keyspace=None) -> list:
+    """ Builds the table sets of every (chain_length, table_count) configuration
+        and cracks the digests of all the passwords with each of them
+    Args:
+        passwords (list): the passwords to crack (e.g. the Users_Top500 ones)
+        algorithm (str, optional): the unsalted digest algorithm. Defaults to 'sha256'.
+        configurations (list, optional): (chain_length, table_count) pairs to compare
+        coverage (float, optional): chains per table = coverage * keyspace / chain_length.
+            Defaults to 1.0.
+        keyspace (optional): the keyspace of the tables. Defaults to the passwords themselves.
+    Returns:
+        list: dict of the measurements per configuration
+    Raises:
+        ValueError: there are no passwords to crack
+    """
+    if not passwords:
+        raise ValueError('No passwords to crack: the benchmark needs at least one')
+    keyspace = keyspace if keyspace is not None else DictionaryKeyspace(passwords)
+    targets = [pop.digest_password(password, algorithm) for password in passwords]
+    flat_bytes = keyspace.size * (len(targets[0]) + 8)
+    print(f'\n{algorithm}: {len(targets)} targets, keyspace of {keyspace.size} passwords'
+          f' (flat lookup table ~{flat_bytes:,} bytes)')
+    print(f'{"chain":>6} {"tables":>6} {"chains":>8} {"bytes":>10} {"build s":>9}'
+          f' {"crack ms":>9} {"success":>8}')
+    results = []
+    for chain_length, table_count in configurations:
+        chains_per_table = max(1, math.ceil(coverage * keyspace.size / chain_length))
+        table_set = RainbowTableSet(keyspace, algorithm, chain_length, table_count)
+        start = time.perf_counter()
+        chains = table_set.build(chains_per_table)
+        build_time = time.perf_counter() - start
+        start = time.perf_counter()
+        cracked = sum(1 for digest in targets if table_set.crack(digest) is not None)
+        crack_time = time.perf_counter() - start
+        result = {
+            'chain_length': chain_length,
+            'table_count': table_count,
+            'chains': chains,
+            'stored_bytes': table_set.stored_bytes,
+            'build_seconds': build_time,
+            'crack_ms_per_digest': crack_time / len(targets) * 1000,
+            'success_rate': cracked / len(targets),
+        }
+        print(f'{chain_length:>6} {table_count:>6} {chains:>8} {result["stored_bytes"]:>10,}'
+              f' {build_time:>9.3f} {result["crack_ms_per_digest"]:>9.3f}'
+              f' {result["success_rate"]:>8.1%}')
+        results.append(result)
+    return results
+# ============================================================================||
+
+def parse_args(default_pwd_file: str) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog = 'python3 rainbow_chains.py',
+        description = """
+        NIST Security InVITE Rainbow-Chains Python Script [in File rainbow_chains.py]
+
+        Builds the chain-based rainbow tables for the bad-passwords file and
+        reports the table size vs. crack time vs. success rate trade-off.""",
+        epilog='WARNING: Do not ever use any of these passwords if you expect to maintain your security posture!'
+    )
+    parser.add_argument("-pf", "--PasswordFile",
+                        help = "Bad-passwords file to crack [Default ./bp_top500_owasp22.txt]",
+                        default = default_pwd_file
+                        )
+    parser.add_argument("-a", "--Algorithm",
+                        help = "Unsalted digest algorithm [Default sha256]",
+                        choices = pop.UNSALTED_ALGORITHMS,
+                        default = 'sha256'
+                        )
+    parser.add_argument("-cv", "--Coverage", type=float,
+                        help = "Chains per table as a multiple of keyspace/chain-length [Default 1.0]",
+                        default = 1.0
+                        )
+    parser.add_argument("-cs", "--Charset",
+                        help = "Cover the passwords of this charset instead of the file words"
+                               " (only the file passwords that fit it are cracked)",
+                        default = ''
+                        )
+    parser.add_argument("-ml", "--MaxLength", type=int,
+                        help = "Longest password of the --Charset keyspace [Default 4]",
+                        default = 4
+                        )
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args('./bp_top500_owasp22.txt')
+    words = list(dbCreate.read_passwords(os.path.expanduser(args.PasswordFile), dedupe=True))
+    chain_keyspace = None
+    if args.Charset:
+        chain_keyspace = CharsetKeyspace(args.Charset, args.MaxLength)
+        words = [word for word in words
+                 if 0 < len(word) <= args.MaxLength and set(word) <= set(args.Charset)]
+    if not words:
+        raise SystemExit(f'No password of [{args.PasswordFile}] to crack'
+                         + (f' within the --Charset [{args.Charset}] keyspace'
+                            f' (up to {args.MaxLength} characters)' if args.Charset else ''))
+    benchmark_trade_off(words, args.Algorithm, coverage=args.Coverage, keyspace=chain_keyspace)
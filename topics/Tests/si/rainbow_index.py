@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+""" The module builds and reads the compact, sorted, memory-mapped binary
+    index of the unsalted password digests (the flat rainbow lookup table)
+# =============================================================================
+    This software was developed at the National Institute of Standards
+    and Technology by employees of the Federal Government in the course
+    of their official duties.  Pursuant to title 17 Section 105 of the
+    United States Code this software is not subject to copyright
+    protection and is in the public domain.  NIST assumes no
+    responsibility whatsoever for its use by other parties, and makes
+    no guarantees, expressed or implied, about its quality,
+    reliability, or any other characteristic.
+# =============================================================================
+    We would appreciate acknowledgement if the software is used.
+
+    File layout (all the integers are little-endian):
+        Header:  magic(8) | algorithm(8) | digest_size(u16) | record_size(u16)
+                 | reserved(u32) | record_count(u64) | blob_offset(u64)
+        Fan-out: 256 x u64, entry [b] = number of records with digest[0] <= b
+        Records: record_count x ( digest | password_offset(u64) | password_length(u32) )
+                 sorted by digest
+        Blob:    utf-8 passwords back to back, offsets are relative to the blob
+"""
+__author__ = "Dmitry Cousin"
+__status__ = "Prototype"
+
+import os
+import argparse
+import heapq
+import mmap
+import struct
+import tempfile
+import time
+
+import db_create as dbCreate
+import cred_crypto as pop
+
+MAGIC = b'SIRBIDX1'
+HEADER = struct.Struct('<8s8sHHIQQ')
+FANOUT = struct.Struct('<256Q')
+POINTER = struct.Struct('<QI')     # password offset in the blob and its length
+RECORDS_OFFSET = HEADER.size + FANOUT.size
+
+# Records sorted in memory before spilling a run to the disk while building
+RUN_SIZE = 1_000_000
+# ============================================================================||
+
+
+def _read_records(run_file, record_size: int):
+    """ Streams the fixed-width records of a sorted run file
+    """
+    while record := run_file.read(record_size):
+        yield record
+
+
+def build_index(index_path: str, pwd_files: list, algorithm: str = 'sha256',
+                run_size: int = RUN_SIZE) -> int:
+    """ Builds the index file out of the bad-passwords files
+        The passwords are streamed into the blob as they are read, the records
+        are sorted in runs of run_size and merged from the disk, so the memory
+        use is bounded by the run size, not by the size of the wordlists.
+        The index is written next to index_path and renamed into place once
+        complete, so the readers never map a partially written file.
+    Args:
+        index_path (str): the index file to create
+        pwd_files (list): the bad-passwords files
+        algorithm (str, optional): the unsalted digest algorithm. Defaults to 'sha256'.
+        run_size (int, optional): records per in-memory sort. Defaults to RUN_SIZE.
+    Returns:
+        int: the number of the indexed (unique digest) passwords
+    """
+    digest_size = len(pop.digest_password('', algorithm))
+    record_size = digest_size + POINTER.size
+    index_path = os.path.expanduser(index_path)
+    work_dir = os.path.dirname(os.path.abspath(index_path))
+    with tempfile.TemporaryDirectory(dir=work_dir) as temp_dir:
+        # 1. Stream the passwords into the blob and the sorted runs of records
+        runs = []
+        blob_size = 0
+        with open(os.path.join(temp_dir, 'blob'), 'wb') as blob:
+            records = []
+            for pwd_file in pwd_files:
+                for password in dbCreate.read_passwords(os.path.expanduser(pwd_file)):
+                    password_bytes = password.encode('utf-8')
+                    blob.write(password_bytes)
+                    records.append(pop.digest_password(password, algorithm)
+                                   + POINTER.pack(blob_size, len(password_bytes)))
+                    blob_size += len(password_bytes)
+                    if len(records) >= run_size:
+                        runs.append(_spill_run(temp_dir, records))
+                        records = []
+            if records or not runs:
+                runs.append(_spill_run(temp_dir, records))
+        # 2. Merge the runs into the index (skipping the repeated digests)
+        temp_index = os.path.join(temp_dir, 'index')
+        fanout = [0] * 256
+        count = 0
+        run_files = [open(run, 'rb') for run in runs]
+        try:
+            with open(temp_index, 'wb') as index:
+                index.seek(RECORDS_OFFSET)
+                last_digest = None
+                for record in heapq.merge(*(_read_records(run_file, record_size)
+                                            for run_file in run_files)):
+                    digest = record[:digest_size]
+                    if digest == last_digest:
+                        continue
+                    last_digest = digest
+                    index.write(record)
+                    fanout[digest[0]] += 1
+                    count += 1
+                with open(os.path.join(temp_dir, 'blob'), 'rb') as blob:
+                    while chunk := blob.read(1 << 20):
+                        index.write(chunk)
+                for first_byte in range(1, 256):
+                    fanout[first_byte] += fanout[first_byte - 1]
+                index.seek(0)
+                index.write(HEADER.pack(MAGIC, algorithm.encode('ascii'), digest_size,
+                                        record_size, 0, count,
+                                        RECORDS_OFFSET + count * record_size))
+                index.write(FANOUT.pack(*fanout))
+        finally:
+            for run_file in run_files:
+                run_file.close()
+        os.replace(temp_index, index_path)
+    return count
+
+
+def _spill_run(temp_dir: str, records: list) -> str:
+    """ Sorts the records (by digest, it leads the record) into a run file
+    """
+    records.sort()
+    run_path = os.path.join(temp_dir, f'run{len(os.listdir(temp_dir))}')
+    with open(run_path, 'wb') as run_file:
+        run_file.write(b''.join(records))
+    return run_path
+# ============================================================================||
+
+
+class HashIndex(object):
+    """ Read-only, memory-mapped view of the index file
+        The pages are shared by all the processes mapping the same file, so any
+        number of grading workers can open it without copying it to the heap.
+        A lookup narrows the range by the fan-out of the first digest byte and
+        binary searches the fixed-width records in place: O(log n) comparisons
+        of digest-sized slices and no other per-lookup structures.
+    """
+
+    def __init__(self, index_path: str):
+        self.index_path = os.path.expanduser(index_path)
+        self.__file = open(self.index_path, 'rb')
+        self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, algorithm, self.digest_size, self.record_size, _,
+         self.count, self.blob_offset) = HEADER.unpack_from(self.__map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f'[{self.index_path}] is not a password digest index')
+        self.algorithm = algorithm.rstrip(b'\0').decode('ascii')
+        self.fanout = FANOUT.unpack_from(self.__map, HEADER.size)
+    # ------------------------------------------------------------------------|
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count
+    # ------------------------------------------------------------------------|
+
+    def close(self):
+        """ Unmaps and closes the index file
+        """
+        self.__map.close()
+        self.__file.close()
+    # ------------------------------------------------------------------------|
+
+    def lookup(self, digest) -> str:
+        """ Finds the password of the unsalted digest
+        Args:
+            digest (bytes|str): the raw digest or its hex representation
+        Returns:
+            str: the password or None when the digest is not indexed
+        """
+        digest = digest if isinstance(digest, bytes) else bytes.fromhex(digest)
+        if len(digest) != self.digest_size:
+            return None
+        index_map, digest_size, record_size = self.__map, self.digest_size, self.record_size
+        low = self.fanout[digest[0] - 1] if digest[0] else 0
+        high = self.fanout[digest[0]]
+        while low < high:
+            middle = (low + high) >> 1
+            position = RECORDS_OFFSET + middle * record_size
+            probe = index_map[position:position + digest_size]
+            if probe < digest:
+                low = middle + 1
+            elif probe > digest:
+                high = middle
+            else:
+                offset, length = POINTER.unpack_from(index_map, position + digest_size)
+                start = self.blob_offset + offset
+                return index_map[start:start + length].decode('utf-8')
+        return None
+    # ------------------------------------------------------------------------|
+# ============================================================================||
+
+
+def benchmark_index(index: HashIndex, pwd_file: str, rainbow_db=None, samples: int = 1000) -> dict:
+    """ Measures the mmap index lookups (and the SQLite table ones, when given a
+        db_rainbow.RainbowDB built for the same algorithm) for the digests of
+        the passwords spread evenly over the file
+    Returns:
+        dict: seconds per lookup of each method
+    """
+    passwords = list(dbCreate.read_passwords(os.path.expanduser(pwd_file)))
+    step = max(1, len(passwords) // samples)
+    targets = [pop.digest_password(password, index.algorithm) for password in passwords[::step]]
+    stats = {'targets': len(targets), 'indexed': len(index)}
+
+    start = time.perf_counter()
+    stats['mmap_found'] = sum(1 for digest in targets if index.lookup(digest) is not None)
+    stats['mmap_per_lookup'] = (time.perf_counter() - start) / len(targets)
+    report = (f'\n{index.algorithm}: {len(targets)} targets over {len(index)} indexed digests'
+              f'\n\tmmap index:   {stats["mmap_per_lookup"]*1e6:.2f} us per target, found {stats["mmap_found"]}')
+    if rainbow_db is not None:
+        start = time.perf_counter()
+        stats['sqlite_found'] = sum(1 for digest in targets
+                                    if rainbow_db.lookup(digest, index.algorithm) is not None)
+        stats['sqlite_per_lookup'] = (time.perf_counter() - start) / len(targets)
+        report += (f'\n\tSQLite table: {stats["sqlite_per_lookup"]*1e6:.2f} us per target,'
+                   f' found {stats["sqlite_found"]}')
+    print(report)
+    return stats
+# ============================================================================||
+
+def parse_args(default_index: str, default_map_file: str) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog = 'python3 rainbow_index.py',
+        description = """
+        NIST Security InVITE Digest-Index Builder Python Script [in File rainbow_index.py]
+
+        Builds the sorted, memory-mapped binary index of the unsalted digests
+        of the bad-passwords files mapped in the PassMap YAML.""",
+        epilog='WARNING: Do not ever use any of these passwords if you expect to maintain your security posture!'
+    )
+    parser.add_argument("-ix", "--Index",
+                        help = "Index file to build [Default ~/si/db/SI_<algorithm>.idx]",
+                        default = default_index
+                        )
+    parser.add_argument("-pm", "--PassMap",
+                        help = "YAML file with BAD PASSWORD FILE mapped to populate-enumerate tables",
+                        default = default_map_file
+                        )
+    parser.add_argument("-a", "--Algorithm",
+                        help = "Unsalted digest algorithm [Default sha256]",
+                        choices = pop.UNSALTED_ALGORITHMS,
+                        default = 'sha256'
+                        )
+    parser.add_argument("-bm", "--Benchmark", action='store_true',
+                        help = "Benchmark the lookups after building the index"
+                        )
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args('', '~/si/map_ubu.yaml')
+    index_file = args.Index if args.Index else f'~/si/db/SI_{args.Algorithm}.idx'
+    pwd_files = list(dbCreate.load_pass_map(os.path.expanduser(args.PassMap)).values())
+    start_time = time.perf_counter()
+    indexed = build_index(index_file, pwd_files, args.Algorithm)
+    print(f'Indexed {indexed} digests into {index_file} in {time.perf_counter() - start_time:.3f} s')
+    if args.Benchmark:
+        with HashIndex(index_file) as hash_index:
+            for pwd_file in pwd_files:
+                benchmark_index(hash_index, pwd_file)
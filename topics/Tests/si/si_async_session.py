@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+""" The module drives the interactive homework sessions with asyncio
+    subprocesses, so one grading process can run many student sessions
+    concurrently instead of blocking a thread per session in read_up_to
+# =============================================================================
+    This software was developed at the National Institute of Standards
+    and Technology by employees of the Federal Government in the course
+    of their official duties.  Pursuant to title 17 Section 105 of the
+    United States Code this software is not subject to copyright
+    protection and is in the public domain.  NIST assumes no
+    responsibility whatsoever for its use by other parties, and makes
+    no guarantees, expressed or implied, about its quality,
+    reliability, or any other characteristic.
+# =============================================================================
+    We would appreciate acknowledgement if the software is used.
+"""
+__author__ = "Dmitry Cousin"
+__status__ = "Prototype"
+
+import asyncio
+import codecs
+import logging
+import re
+
+import si_server_test_utils as test_utils
+
+# Bytes requested from the pipe per read
+READ_SIZE = 4096
+# Seconds one expect step may take before returning the partial response
+STEP_TIMEOUT = 10.0
+# Bytes of the already searched output a regex search goes back over, so a
+# match split between the reads is still found (the matches must be shorter)
+REGEX_OVERLAP = 1024
+# ============================================================================||
+
+
+class AsyncSessionSI(object):
+    """ One interactive session of the tested program (e.g. ssh ... python3 hw3.py)
+        The output is collected in a bytearray and only the consumed part of
+        it is decoded, with an incremental decoder, so the multi-byte UTF-8
+        characters split between the reads come out whole.
+    """
+
+    def __init__(self, command: list, logger=None,
+                 step_timeout: float = STEP_TIMEOUT, encoding: str = 'utf-8'):
+        """ command - the program and its arguments to run
+            logger - the diagnostic logger (defaults to the module one)
+            step_timeout - default deadline of each expect step in seconds
+        """
+        self.command = command
+        self.logger = logger if logger else logging.getLogger(__name__)
+        self.step_timeout = step_timeout
+        self.encoding = encoding
+        self.process = None
+        self.timed_out = False
+        self.__buffer = bytearray()
+        self.__decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        self.__eof = False
+    # ------------------------------------------------------------------------|
+
+    @classmethod
+    def for_server(cls, server: test_utils.ServerSI, conf: str = '',
+                   step_timeout: float = STEP_TIMEOUT):
+        """ Session of the app the ServerSI tests (over its multiplexed ssh) """
+        return cls(server.list_add(server.ssh_params_ext, [server.app_to_test, conf]),
+                   server.logger, step_timeout)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.stop()
+    # ------------------------------------------------------------------------|
+
+    async def start(self, expected_response_endswith=None, timeout: float = None) -> str:
+        """ Starts the program
+        Returns:
+            str: the response up to the expected end ('' when not expecting one)
+        """
+        self.process = await asyncio.create_subprocess_exec(
+            *self.command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT)
+        self.logger.debug(f'Async session started with:\n\t{self.command}')
+        if expected_response_endswith is None:
+            return ''
+        return await self.expect(expected_response_endswith, timeout)
+    # ------------------------------------------------------------------------|
+
+    async def send(self, command: str):
+        """ Types the command (and the line break) into the program """
+        self.process.stdin.write((command + '\n').encode(self.encoding))
+        await self.process.stdin.drain()
+
+    async def type(self, command: str, response_end=': ', timeout: float = None) -> str:
+        """ Types the command and waits for the response ending with response_end
+            (same contract as ServerSI.type_to_server_ext)
+        """
+        await self.send(command)
+        return await self.expect(response_end, timeout)
+    # ------------------------------------------------------------------------|
+
+    async def expect(self, pattern, timeout: float = None) -> str:
+        """ Reads until the output ends with the pattern (str) or the pattern
+            (compiled re.Pattern) is found in it
+            On the deadline, the EOF, or the DATA_LENGTH limit the partial
+            response is returned, like ServerSI.read_up_to does.
+            A regex is searched for in the new output only (and REGEX_OVERLAP
+            bytes before it), so a long output is not rescanned on every read.
+        Args:
+            pattern (str|re.Pattern): the expected end or the regex to search for
+            timeout (float, optional): the step deadline. Defaults to step_timeout.
+        Returns:
+            str: the output up to and including the match (the rest stays buffered)
+        """
+        if isinstance(pattern, re.Pattern):
+            # The buffer holds bytes: search with the bytes version of the regex
+            matcher = re.compile(pattern.pattern.encode(self.encoding), pattern.flags & ~re.UNICODE)
+
+            def find_end(buffer, searched: int) -> int:
+                match = matcher.search(buffer, max(0, searched - REGEX_OVERLAP))
+                return match.end() if match else -1
+        else:
+            suffix = pattern.encode(self.encoding)
+
+            def find_end(buffer, searched: int) -> int:
+                return len(buffer) if buffer.endswith(suffix) else -1
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout if timeout is not None else self.step_timeout)
+        self.timed_out = False
+        searched = 0    # the buffer bytes the pattern was searched in already
+        while True:
+            end = find_end(self.__buffer, searched)
+            if end >= 0:
+                return self.__consume(end)
+            searched = len(self.__buffer)
+            if self.__eof:
+                self.logger.debug('expect: session output got closed')
+                return self.__consume(len(self.__buffer), final=True)
+            if len(self.__buffer) > test_utils.THIS_MODULE.DATA_LENGTH:
+                self.logger.debug('expect: returning BIG response_data')
+                return self.__consume(len(self.__buffer))
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                self.timed_out = True
+                response = self.__consume(len(self.__buffer))
+                self.logger.critical(f'TIMEOUT({response}) EXPECTED({pattern})')
+                return response
+            try:
+                chunk = await asyncio.wait_for(self.process.stdout.read(READ_SIZE), remaining)
+            except asyncio.TimeoutError:
+                continue
+            if chunk:
+                self.__buffer += chunk
+            else:
+                self.__eof = True
+    # ------------------------------------------------------------------------|
+
+    def __consume(self, end: int, final: bool = False) -> str:
+        """ Decodes and drops the first end bytes of the buffer """
+        text = self.__decoder.decode(bytes(self.__buffer[:end]), final)
+        del self.__buffer[:end]
+        return text
+    # ------------------------------------------------------------------------|
+
+    async def stop(self, wait_limit: float = 2.0):
+        """ Sends EOF to the program and kills it if it does not exit in time
+            (same contract as ServerSI.stop_server)
+        """
+        if self.process is None or self.process.returncode is not None:
+            return
+        try:
+            self.process.stdin.close()
+            await asyncio.wait_for(self.process.wait(), wait_limit)
+        except (asyncio.TimeoutError, ConnectionError):
+            self.process.kill()
+            await self.process.wait()
+    # ------------------------------------------------------------------------|
+# ============================================================================||
+
+
+async def gather_limited(coroutines, limit: int = 8) -> list:
+    """ Awaits the coroutines with at most limit of them running at a time
+        (e.g. the MaxSessions of the sshd sharing one master connection)
+    Returns:
+        list: the results (or the raised exceptions) in the coroutines order
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def limited(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(limited(coroutine) for coroutine in coroutines),
+                                return_exceptions=True)
+
+
+def run_sessions(coroutines, limit: int = 8) -> list:
+    """ Synchronous entry point: runs the session coroutines on a new event loop
+    """
+    return asyncio.run(gather_limited(coroutines, limit))
+# ============================================================================||
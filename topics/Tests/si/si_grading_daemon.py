@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+""" The module runs the resident grading service: the submissions come in
+    over a local Unix socket, are queued in the SQLite Grading_Jobs table,
+    and are graded by the worker threads with the warm per-VM contexts
+    (open SSH master connection, logger, resolved VM home), while the
+    results stream back to the waiting clients test by test
+# =============================================================================
+    This software was developed at the National Institute of Standards
+    and Technology by employees of the Federal Government in the course
+    of their official duties.  Pursuant to title 17 Section 105 of the
+    United States Code this software is not subject to copyright
+    protection and is in the public domain.  NIST assumes no
+    responsibility whatsoever for its use by other parties, and makes
+    no guarantees, expressed or implied, about its quality,
+    reliability, or any other characteristic.
+# =============================================================================
+    We would appreciate acknowledgement if the software is used.
+
+    Protocol: one JSON object per line each way
+        {"cmd": "submit", "job": {"user": .., "port": .., "key": .., "homework": ..}}
+            => {"ok": true, "job_id": 7}
+        {"cmd": "status", "job_id": 7}  => {"ok": true, "job": {..}}
+        {"cmd": "wait", "job_id": 7}
+            => {"event": "test", "record": {..}} per graded test, then
+               {"event": "done", "job": {..}}
+"""
+__author__ = "Dmitry Cousin"
+__status__ = "Prototype"
+
+import os
+import argparse
+import json
+import queue
+import socket
+import socketserver
+import threading
+import time
+from datetime import datetime
+
+import db_base as dbBase
+import grade_roster as roster
+import si_server_test_utils as test_utils
+import si_server_utils as utils
+
+DEFAULT_SOCKET = '~/si/grading.sock'
+# Warm contexts unused for this long are closed (their SSH master included);
+# the master itself exits after the ControlPersist seconds without a session
+CONTEXT_IDLE_SECONDS = test_utils.SSH_CONTROL_PERSIST
+# Tells a worker thread to exit (a job id is never this object)
+_STOP = object()
+# ============================================================================||
+
+
+class JobsDB(dbBase.BaseDB):
+    """ Grading_Jobs table: the queue and the history of the submissions
+    """
+    STATUS_FIELDS = ('id', 'submitted', 'started', 'finished', 'status', 'user_name',
+                     'tcp_port', 'homework', 'job', 'message', 'results')
+
+    def __init__(self, db_path: str = '', db_name: str = ''):
+        super().__init__(db_path, db_name, must_create_db=False)
+        self.__execute__(""" CREATE TABLE IF NOT EXISTS
+                            "Grading_Jobs" (
+                            "id"	INTEGER NOT NULL UNIQUE,
+                            "submitted"	TEXT NOT NULL,
+                            "started"	TEXT,
+                            "finished"	TEXT,
+                            "status"	TEXT NOT NULL DEFAULT 'QUEUED',
+                            "user_name"	TEXT NOT NULL,
+                            "tcp_port"	TEXT,
+                            "homework"	INTEGER,
+                            "job"	TEXT NOT NULL,
+                            "message"	TEXT,
+                            "results"	TEXT,
+                            PRIMARY KEY("id" AUTOINCREMENT));"""
+                         )
+    # ------------------------------------------------------------------------|
+
+    def add_job(self, job: dict) -> int:
+        """ Queues the job
+        Returns:
+            int: the job id (None when the insert failed)
+        """
+        return self.__insert__(""" INSERT INTO Grading_Jobs
+                                   ( submitted, user_name, tcp_port, homework, job )
+                                   VALUES (?, ?, ?, ?, ?)""",
+                               (datetime.now().isoformat(), job['user'], job['port'],
+                                job['homework'], json.dumps(job)))
+
+    def set_status(self, job_id: int, status: str, message: str = '', results: list = None):
+        """ Moves the job to RUNNING, DONE, or ERROR """
+        stamp_field = 'started' if status == 'RUNNING' else 'finished'
+        self.__update__(f""" UPDATE Grading_Jobs SET status = ?, {stamp_field} = ?,
+                             message = ?, results = ? WHERE id = ?""",
+                        (status, datetime.now().isoformat(), message,
+                         json.dumps(results) if results is not None else None),
+                        (job_id,))
+
+    def get_job(self, job_id: int) -> dict:
+        """ The job row as a dict (None for the unknown id) """
+        rows = self.__select_array__(
+            f'SELECT {", ".join(self.STATUS_FIELDS)} FROM Grading_Jobs WHERE id = ?',
+            [job_id], row_factory='row')
+        if not rows:
+            return None
+        record = dict(rows[0])
+        record['job'] = json.loads(record['job'])
+        record['results'] = json.loads(record['results']) if record['results'] else []
+        return record
+
+    def unfinished_jobs(self) -> list:
+        """ The ids of the jobs a previous daemon did not finish, in order """
+        return [job_id for (job_id,) in self.__select__(
+            "SELECT id FROM Grading_Jobs WHERE status IN ('QUEUED', 'RUNNING') ORDER BY id")]
+    # ------------------------------------------------------------------------|
+# ============================================================================||
+
+
+class WarmContext(object):
+    """ TestContext of one VM kept between the jobs with its SSH master open
+    """
+
+    def __init__(self, job: dict):
+        from test_homework import create_server_session
+        from test_suites import TestContext
+        self.context = TestContext()
+        self.context.init_context(utils.VmTestArguments(args=roster.make_job_args(job)))
+        self.context.SERVER_TO_TEST = create_server_session(self.context)
+        self.context.SERVER_TO_TEST.verify_recreate_test_tree()
+        self.context.SERVER_TO_TEST.open_control_connection()
+        self.context.HomeResolver.get_home_on_vm()  # resolved once per VM
+        self.lock = threading.Lock()    # one job at a time per VM
+        self.last_used = time.monotonic()
+        self.users = 0      # the workers holding it (GradingService.lock guards it)
+
+    def refresh(self):
+        """ Reopens the SSH master if it exited while the context was idle
+            (ControlPersist ran out, the VM restarted), so the next job does
+            not fall back to a full ssh handshake per step
+        """
+        self.context.SERVER_TO_TEST.open_control_connection()
+
+    def close(self):
+        self.context.SERVER_TO_TEST.close_control_connection()
+        self.context.close()
+# ============================================================================||
+
+
+class JobState(object):
+    """ Progress of a running job for the waiting clients
+    """
+
+    def __init__(self):
+        self.records = []
+        self.done = False
+        self.changed = threading.Condition()
+
+    def add(self, record: dict):
+        with self.changed:
+            self.records.append(test_utils.serializable_test_record(record))
+            self.changed.notify_all()
+
+    def finish(self):
+        with self.changed:
+            self.done = True
+            self.changed.notify_all()
+# ============================================================================||
+
+
+class GradingService(object):
+    """ The job queue, the worker threads, and the warm contexts
+    """
+
+    def __init__(self, jobs_db: JobsDB, workers: int = 4):
+        self.jobs_db = jobs_db
+        self.workers = max(1, workers)
+        self.pending = queue.Queue()
+        self.states = dict()        # job id -> JobState
+        self.contexts = dict()      # VM key -> WarmContext
+        self.lock = threading.Lock()
+        self.threads = []
+    # ------------------------------------------------------------------------|
+
+    @staticmethod
+    def vm_key(job: dict) -> tuple:
+        return (job['user'], str(job['port']), job.get('key', ''),
+                int(job['homework']), job.get('app', ''), job.get('address', ''))
+
+    def start(self):
+        """ Requeues the unfinished jobs and starts the workers """
+        for job_id in self.jobs_db.unfinished_jobs():
+            self.__enqueue__(job_id)
+        for index in range(self.workers):
+            thread = threading.Thread(target=self.__work__, name=f'grader-{index}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        """ Stops the workers after the running jobs and closes the warm contexts """
+        for _ in self.threads:
+            self.pending.put(_STOP)
+        for thread in self.threads:
+            thread.join()
+        with self.lock:
+            for warm in self.contexts.values():
+                warm.close()
+            self.contexts.clear()
+    # ------------------------------------------------------------------------|
+
+    def submit(self, job: dict) -> int:
+        """ Validates, stores, and queues the submission
+        Returns:
+            int: the job id
+        Raises:
+            RuntimeError: the job could not be stored (see the db_base log)
+        """
+        job = {field: str(job.get(field, '')).strip() for field in roster.ROSTER_FIELDS}
+        if not job['user']:
+            raise ValueError('The job has no user')
+        job['port'] = job['port'] or '2020'
+        job['homework'] = int(job['homework'] or 3)
+        job_id = self.jobs_db.add_job(job)
+        if job_id is None:
+            raise RuntimeError(f'The job of {job["user"]} could not be stored')
+        self.__enqueue__(job_id)
+        return job_id
+
+    def __enqueue__(self, job_id: int):
+        with self.lock:
+            self.states[job_id] = JobState()
+        self.pending.put(job_id)
+    # ------------------------------------------------------------------------|
+
+    def __warm_context__(self, job: dict) -> WarmContext:
+        """ The warm context of the job's VM (created on its first job), held
+            for the worker until __release_context__; only the contexts no
+            worker holds are closed as idle
+        """
+        key = self.vm_key(job)
+        with self.lock:
+            now = time.monotonic()
+            for idle_key in [other for other, warm in self.contexts.items()
+                             if other != key and now - warm.last_used > CONTEXT_IDLE_SECONDS
+                             and not warm.users]:
+                self.contexts.pop(idle_key).close()
+            warm = self.contexts.get(key)
+            if warm is not None:
+                warm.users += 1
+                return warm
+        created = WarmContext(job)      # SSH and logger set-up outside of the lock
+        with self.lock:
+            warm = self.contexts.setdefault(key, created)
+            warm.users += 1
+        if warm is not created:         # another worker set up the same VM meanwhile
+            created.close()
+        return warm
+
+    def __release_context__(self, warm: WarmContext):
+        with self.lock:
+            warm.users -= 1
+
+    def __work__(self):
+        """ Worker thread: grades the queued jobs """
+        from test_homework import run_report_tests
+        while (job_id := self.pending.get()) is not _STOP:
+            state = self.states[job_id]
+            try:
+                job_row = self.jobs_db.get_job(job_id)
+                if job_row is None:
+                    raise LookupError(f'Job {job_id} is not in the Grading_Jobs table')
+                job = job_row['job']
+                self.jobs_db.set_status(job_id, 'RUNNING')
+                warm = self.__warm_context__(job)
+                try:
+                    with warm.lock:
+                        warm.refresh()
+                        context = warm.context
+                        context.JSON_FILE = utils.get_fresh_timestamped_log(
+                            context.APP_DEFAULT, 'results', '.json',
+                            tag=f'{job["user"]}-{job["port"]}')
+                        run_report_tests(context, listener=state.add)
+                        warm.last_used = time.monotonic()
+                finally:
+                    self.__release_context__(warm)
+                self.jobs_db.set_status(job_id, 'DONE', results=state.records)
+            except SystemExit:      # init_context exits on the bad keys and user names
+                self.jobs_db.set_status(job_id, 'ERROR', 'SystemExit: the test context setup'
+                                        ' failed (see the log)', state.records)
+            except Exception as ex:
+                self.jobs_db.set_status(job_id, 'ERROR', f'{type(ex).__name__}: {ex}',
+                                        state.records)
+            finally:
+                state.finish()
+                with self.lock:
+                    self.states.pop(job_id, None)
+    # ------------------------------------------------------------------------|
+
+    def wait(self, job_id: int):
+        """ Yields the ('test', record) events of the job as they come and the
+            final ('done', job row)
+        """
+        state = self.states.get(job_id)
+        sent = 0
+        while state is not None:
+            with state.changed:
+                state.changed.wait_for(lambda: state.done or len(state.records) > sent)
+                records, done = state.records[sent:], state.done
+            for record in records:
+                yield ('test', record)
+            sent += len(records)
+            if done:
+                break
+        job = self.jobs_db.get_job(job_id)
+        if job is not None:
+            for record in job['results'][sent:]:   # the job was finished before the wait
+                yield ('test', record)
+        yield ('done', job)
+# ============================================================================||
+
+
+class GradingRequestHandler(socketserver.StreamRequestHandler):
+    """ One client connection: JSON-line commands, JSON-line answers
+    """
+
+    def send(self, message: dict):
+        self.wfile.write((json.dumps(message) + '\n').encode('utf-8'))
+        self.wfile.flush()
+
+    def handle(self):
+        service = self.server.service
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                command = request.get('cmd')
+                if command == 'submit':
+                    self.send({'ok': True, 'job_id': service.submit(request.get('job', {}))})
+                elif command == 'status':
+                    job = service.jobs_db.get_job(int(request['job_id']))
+                    self.send({'ok': job is not None, 'job': job})
+                elif command == 'wait':
+                    for (event, payload) in service.wait(int(request['job_id'])):
+                        self.send({'event': event, 'job' if event == 'done' else 'record': payload})
+                else:
+                    self.send({'ok': False, 'error': f'Unknown command [{command}]'})
+            except (ValueError, KeyError, TypeError, RuntimeError, dbBase.sql.Error) as ex:
+                self.send({'ok': False, 'error': f'{type(ex).__name__}: {ex}'})
+# ============================================================================||
+
+
+class GradingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, service: GradingService):
+        self.service = service
+        socket_path = os.path.expanduser(socket_path)
+        if os.path.exists(socket_path):
+            os.remove(socket_path)  # left over by a previous daemon
+        os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+        super().__init__(socket_path, GradingRequestHandler)
+# ============================================================================||
+
+
+def request_daemon(socket_path: str, request: dict):
+    """ Client side: sends the request and yields the answer lines as dicts
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(os.path.expanduser(socket_path))
+        client.sendall((json.dumps(request) + '\n').encode('utf-8'))
+        client.shutdown(socket.SHUT_WR)
+        with client.makefile('r', encoding='utf-8') as answers:
+            for line in answers:
+                yield json.loads(line)
+# ============================================================================||
+
+def parse_args(default_socket: str) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog = 'python3 si_grading_daemon.py',
+        description = """
+        NIST Security InVITE Grading Daemon Python Script [in File si_grading_daemon.py]
+
+        Runs the resident grading service (serve) or talks to it (submit, status).""",
+    )
+    parser.add_argument("mode", choices=['serve', 'submit', 'status'],
+                        help = "Run the service, submit a job, or query a job")
+    parser.add_argument("-s", "--Socket",
+                        help = "Unix socket of the service [Default ~/si/grading.sock]",
+                        default = default_socket
+                        )
+    parser.add_argument("-w", "--Workers", type=int,
+                        help = "serve: number of the jobs graded at a time [Default 4]",
+                        default = 4
+                        )
+    parser.add_argument("-wd", "--WorkDir",
+                        help = "serve: directory of the jobs DB File [Default ~/si/db]",
+                        default = '~/si/db'
+                        )
+    parser.add_argument("-db", "--Database",
+                        help = "serve: jobs database file name [Default SI_Jobs.db]",
+                        default = 'SI_Jobs.db'
+                        )
+    parser.add_argument("-u", "--User", help = "submit: the VM user", default = '')
+    parser.add_argument("-p", "--Port", help = "submit: the VM ssh port", default = '2020')
+    parser.add_argument("-k", "--Key", help = "submit: the ssh key file", default = '')
+    parser.add_argument("-hw", "--Homework", type=int, choices=range(1, 6),
+                        help = "submit: the homework to grade [Default 3]", default = 3)
+    parser.add_argument("-nw", "--NoWait", action='store_true',
+                        help = "submit: return the job id without waiting for the results")
+    parser.add_argument("-j", "--JobId", type=int, help = "status: the job id", default = 0)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args(DEFAULT_SOCKET)
+    if args.mode == 'serve':
+        with JobsDB(args.WorkDir, args.Database) as jobs_table:
+            grading = GradingService(jobs_table, args.Workers)
+            grading.start()
+            with GradingServer(args.Socket, grading) as grading_server:
+                print(f'Grading service listens on {args.Socket} with {args.Workers} workers')
+                try:
+                    grading_server.serve_forever()
+                except KeyboardInterrupt:
+                    pass
+            grading.stop()
+    elif args.mode == 'submit':
+        submission = {'user': args.User, 'port': args.Port, 'key': args.Key, 'homework': args.Homework}
+        answer = next(request_daemon(args.Socket, {'cmd': 'submit', 'job': submission}))
+        print(answer)
+        if answer.get('ok') and not args.NoWait:
+            for event in request_daemon(args.Socket, {'cmd': 'wait', 'job_id': answer['job_id']}):
+                if event['event'] == 'test':
+                    print(f'{event["record"]["result"]}: {event["record"]["test_name"]}')
+                elif event['job'] is None:
+                    print(f'Job {answer["job_id"]} is not found')
+                else:
+                    print(f'Job {answer["job_id"]}: {event["job"]["status"]} {event["job"]["message"] or ""}')
+    else:
+        print(next(request_daemon(args.Socket, {'cmd': 'status', 'job_id': args.JobId})))
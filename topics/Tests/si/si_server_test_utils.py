@@ -19,10 +19,13 @@ __status__ = "Prototype"
 from datetime import datetime
 import time
 import os
+import codecs
 import re
 import sys
 import select
 import subprocess
+import threading
+import queue
 import unittest
 from enum import IntEnum
 import traceback
@@ -37,6 +40,10 @@ THIS_MODULE.TEST_STATUS = None
 # Protect this program from accidental-or-intentional
 # over-production of data by the tested program.
 THIS_MODULE.DATA_LENGTH = 10000000
+# Shared (multiplexed) SSH connections: the control sockets live here and the
+# master connection stays up this many seconds after the last session closes
+SSH_CONTROL_DIR = '~/si/ssh'
+SSH_CONTROL_PERSIST = 600
 
 def get_test_status():
     """ Returns test results object accumulated in the module level variable
@@ -52,6 +59,22 @@ def get_location(level: int = 1) -> str:
             f' of file: {locator.f_code.co_filename} ')
 
 
+def get_ssh_multiplex_options(control_dir: str = SSH_CONTROL_DIR,
+                              control_persist: int = SSH_CONTROL_PERSIST) -> list:
+    """ SSH/SCP options that route every session to the same host:port:user
+        through one master connection (one TCP connect and key exchange)
+        The socket is named by %C (hash of the connection parameters), so all
+        the ssh/scp calls for the same VM find the same master.
+    """
+    control_dir = os.path.expanduser(control_dir)
+    if not os.path.isdir(control_dir):
+        os.makedirs(control_dir, mode=0o700, exist_ok=True)
+    return ['-o', 'ControlMaster=auto',
+            '-o', f'ControlPath={os.path.join(control_dir, "%C")}',
+            '-o', f'ControlPersist={control_persist}']
+# =============================================================================
+
+
 class ServerSI(object):
     """ ServerSI Aggregates common server operations necessary for homework testing
     """
@@ -60,8 +83,10 @@ class ServerSI(object):
                  host_address: str, tcp_port: str, key_file: str,
                  logger,
                  remote_remove_command: str = 'rm -rf ',
-                 wait_on_stop: float = 2.0):
+                 wait_on_stop: float = 2.0,
+                 multiplex: bool = True):
         """ Initializes set of common operations for the testing suites
+            multiplex - share one master SSH connection by all the ssh/scp calls
         """
         self.timeout = 1000
         self.app_to_test = app_to_test
@@ -73,21 +98,78 @@ class ServerSI(object):
         self.wait_limit = wait_on_stop  # seconds we are willing to wait for process shutdown
 
         self.remove_command = remote_remove_command
+        self.multiplex_options = get_ssh_multiplex_options() if multiplex else []
+        self.__owns_master = False
         self.ssh_params = \
            ['ssh', self.host_address,
             '-p', self.tcp_port,
             '-i', self.key_file_path,
-            '-o', 'StrictHostKeyChecking=no', '-q']
+            '-o', 'StrictHostKeyChecking=no', '-q'] + self.multiplex_options
         self.ssh_params_ext = \
            ['ssh', self.host_address,
             '-p', self.tcp_port,
             '-i', self.key_file_path,
-            '-o', 'StrictHostKeyChecking=no', '-q']
+            '-o', 'StrictHostKeyChecking=no', '-q'] + self.multiplex_options
         self.scp_params = \
-           ['scp', #'-v',
+           ['scp', '-q', #'-v',
             '-P', self.tcp_port, # Important!!! Capital P for SCP unlike for SSH
             '-i', self.key_file_path,
-            '-o', 'StrictHostKeyChecking=no']
+            '-o', 'StrictHostKeyChecking=no'] + self.multiplex_options
+    #----------------------------------------------------------------------------
+
+    def __enter__(self):
+        # Only the master this block opens is closed on exit: a warm one
+        # (e.g. kept by the grading daemon) outlives the block
+        self.__owns_master = not self.is_control_connection_open()
+        self.open_control_connection()
+        return self
+
+    def __exit__(self, *args):
+        if self.__owns_master:
+            self.close_control_connection()
+    #----------------------------------------------------------------------------
+
+    def open_control_connection(self) -> bool:
+        """ Starts the master connection in the background (ssh -f -N), so the
+            first test step does not pay for the TCP connect and the key exchange
+            and every following start/stop/copy reuses it
+        Returns:
+            bool: True when the master is up (or multiplexing is off)
+        """
+        if not self.multiplex_options:
+            return True
+        self.logger.debug(get_location())
+        if self.is_control_connection_open():
+            return True
+        try:
+            subprocess.run(self.list_add(self.ssh_params, ['-f', '-N']),
+                           stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL, timeout=30)
+        except subprocess.TimeoutExpired:
+            self.logger.critical(f'SSH master connection to {self.host_address} timed out')
+        return self.is_control_connection_open()
+    #----------------------------------------------------------------------------
+
+    def is_control_connection_open(self) -> bool:
+        """ Asks the master connection if it is alive (ssh -O check) """
+        if not self.multiplex_options:
+            return False
+        check = subprocess.run(self.list_add(self.ssh_params, ['-O', 'check']),
+                               stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+        return check.returncode == 0
+    #----------------------------------------------------------------------------
+
+    def close_control_connection(self):
+        """ Stops the master connection (ssh -O exit) instead of letting it
+            linger for ControlPersist seconds
+        """
+        if not self.multiplex_options:
+            return
+        self.logger.debug(get_location())
+        subprocess.run(self.list_add(self.ssh_params, ['-O', 'exit']),
+                       stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
     #----------------------------------------------------------------------------
 
     def verify_recreate_test_tree(self):
@@ -148,7 +230,7 @@ class ServerSI(object):
 
     def kill_remote_file(self, config_file_name):
         """Do 'rm -rf' via ssh on remote system to delete the config file."""
-        kill_command = self.list_add(self.scp_params, [self.remove_command, config_file_name])
+        kill_command = self.list_add(self.ssh_params_ext, [self.remove_command, config_file_name])
         subprocess.call(kill_command)
     # -------------------------------------------------------------------------
 
@@ -156,9 +238,15 @@ class ServerSI(object):
         """Reads from sub_proc, returning chars up to and including expected_resp...
         If expected_value doesn't exist after waiting 1000ms, return
         partial data.
+        The chunks are decoded incrementally (a UTF-8 character split between
+        two reads is not broken) and joined once at the end.
+        See si_async_session.AsyncSessionSI for the asyncio version.
         """
         self.logger.debug(get_location())
-        response_data = ''
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        chunks = []
+        data_length = 0
+        tail = ''   # the last len(expected_response_endswith) characters read
         while True:
             inputs = [sub_proc.stdout]  # a pipe
             outputs = []
@@ -170,24 +258,30 @@ class ServerSI(object):
                     msg = os.read(input_pipe.fileno(), 1024)
                     if not msg:   # means that the socket got closed
                         self.logger.debug('read_up_to: socket-got-closed')
-                        return response_data
-                    response_data += msg.decode()
+                        chunks.append(decoder.decode(b'', True))
+                        return ''.join(chunks)
+                    text = decoder.decode(msg)
+                    chunks.append(text)
+                    data_length += len(text)
+                    tail = (tail + text)[-len(expected_response_endswith):] \
+                        if expected_response_endswith else ''
 
                     # Limit how much data we will accept from the
                     # program under test. Arbitrarily limit to 10MB.
                     # Protect this program from accidental-or-intentional
                     # over-production of data by the tested program.
-                    if len(response_data) > THIS_MODULE.DATA_LENGTH:
+                    if data_length > THIS_MODULE.DATA_LENGTH:
                         self.logger.debug('read_up_to: returning BIG response_data')
-                        return response_data
+                        return ''.join(chunks)
 
-                    if response_data.endswith(expected_response_endswith):
+                    if tail.endswith(expected_response_endswith):
                         self.logger.debug('read_up_to: returning expected_response_data')
-                        return response_data
+                        return ''.join(chunks)
                 except OSError:
                     self.logger.critical('OSError thrown!')
                     sys.exit(0)
             else:
+                response_data = ''.join(chunks)
                 self.logger.critical(f'TIMEOUT({response_data}) '+
                                      f'EXPECTED({expected_response_endswith})')
                 return response_data
@@ -234,13 +328,7 @@ class ServerSI(object):
         """ Retrieve home directory from the VM """
         home_dir = ''
         self.logger.debug(get_location())
-        ssh_pwd = self.list_add(
-            ['ssh', self.host_address,
-            '-p', self.tcp_port,
-            '-i', self.key_file_path,
-            '-o', 'StrictHostKeyChecking=no', '-q'],
-            ['pwd']
-            )   
+        ssh_pwd = self.list_add(self.ssh_params, ['pwd'])
         try:
             stdout, stderr  = subprocess.Popen(ssh_pwd,
                                     stdout=subprocess.PIPE,
@@ -364,11 +452,7 @@ class ServerSI(object):
     def delete_file_on_vm(self, remote_file_name):
         """ Removes remote file """
         self.logger.debug(get_location())
-        subprocess.call(['ssh', self.host_address,
-                         '-p', self.tcp_port,
-                         '-i', self.key_file_path,
-                         '-o', 'StrictHostKeyChecking=no',
-                         '-q', 'rm', remote_file_name])
+        subprocess.call(self.list_add(self.ssh_params, ['rm', remote_file_name]))
     # -------------------------------------------------------------------------
 
     def copy_file_to_vm(self, local_file_name):
@@ -377,11 +461,9 @@ class ServerSI(object):
         """
         self.logger.debug(get_location())
         remote_file_name = local_file_name
-        subprocess.call(['scp', '-q', '-i', self.key_file_path,
-                         '-P', self.tcp_port,
-                         '-o', 'StrictHostKeyChecking=no',
-                         f'{local_file_name}',
-                         f'{self.host_address}:{remote_file_name}'])
+        subprocess.call(self.list_add(self.scp_params,
+                                      [f'{local_file_name}',
+                                       f'{self.host_address}:{remote_file_name}']))
         os.remove(local_file_name)
     # -------------------------------------------------------------------------
 # =============================================================================
@@ -415,6 +497,8 @@ class TestCaseSI(unittest.TestCase):
         """
         """
         super().__init__(*f_args, **f_kwargs)
+        # ServerSI the parallel runner assigned to this test (None - the shared one)
+        self.server_session = None
         self.level = LeniencyLevel.Ignore3CaseWhitespaceEnding
         self.whitespaces = ['\t', '\n', '\r', '\x0b', '\x0c', '\x0f']
         self.ws_regex = re.compile(r'\s+')
@@ -562,8 +646,12 @@ class TestRunnerSI(unittest.TextTestRunner):
 class TestResultsSI(unittest.TestResult):
     """ TCI Specific test result accumulation and reporting functionality
     """
-    def __init__(self, *f_args, **f_kwargs):
+    def __init__(self, *f_args, listener=None, **f_kwargs):
+        """ listener - optional callable receiving every record as it is added
+        """
         self.test_results = []
+        self.tests_recorded = []    # the test case of every test_results record
+        self.listener = listener
         super(TestResultsSI, self).__init__(*f_args, **f_kwargs)
     # -------------------------------------------------------------------------
 
@@ -582,6 +670,9 @@ class TestResultsSI(unittest.TestResult):
         sys.stdout.write('.')
         sys.stdout.flush()
         self.test_results.append(rec)
+        self.tests_recorded.append(test)
+        if self.listener:
+            self.listener(rec)
         # print(f'\n\n Appended {rec}\n Results:\n{self.test_results}\n\n')
     # -------------------------------------------------------------------------
 
@@ -620,6 +711,131 @@ class TestResultsSI(unittest.TestResult):
 # =============================================================================
 
 
+def serializable_test_record(record: dict) -> dict:
+    """ Copy of the TestResultsSI record with the error (exc_info) formatted as text
+    """
+    error = record['error']
+    return dict(record, error=error if isinstance(error, str)
+                else ''.join(traceback.format_exception(*error)))
+
+def parallel_safe(test_method):
+    """ Marks the test method as independent of the other tests: it does not
+        change the state on the VM (DB, logs, files) the other tests read, so
+        the ParallelRunnerSI may run it concurrently with the other marked ones
+    """
+    test_method.parallel_safe = True
+    return test_method
+
+def is_parallel_safe(test: unittest.TestCase) -> bool:
+    """ Checks the test method of the test case for the parallel_safe mark """
+    test_method = getattr(test, test._testMethodName, None)
+    return getattr(test_method, 'parallel_safe', False)
+
+def iterate_tests(suite):
+    """ Flattens the (nested) test suite into the test cases in order """
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            yield from iterate_tests(test)
+        else:
+            yield test
+# -----------------------------------------------------------------------------
+
+
+class ParallelRunnerSI(object):
+    """ Runs the parallel_safe tests over N concurrent ServerSI sessions and
+        the rest of the tests one by one, then merges the per-session results
+        into one TestResultsSI in the original order of the tests
+        The sessions of one VM share the multiplexed master connection the
+        caller keeps open, so their number should stay within the MaxSessions
+        of the VM's sshd (10 by default).
+    """
+    def __init__(self, session_factory, sessions: int = 4, logger=None, listener=None):
+        """ session_factory - callable returning a new ServerSI for the VM
+            sessions - number of the concurrent sessions (worker threads)
+            listener - passed to the TestResultsSI of every session
+        """
+        self.session_factory = session_factory
+        self.sessions = max(1, sessions)
+        self.logger = logger
+        self.listener = listener
+    # -------------------------------------------------------------------------
+
+    def run(self, suite) -> TestResultsSI:
+        """ Runs the suite
+        Returns:
+            TestResultsSI: the merged results (also stored as the module TEST_STATUS)
+        """
+        tests = list(iterate_tests(suite))
+        order = {id(test): index for index, test in enumerate(tests)}
+        parallel_tests = [test for test in tests if is_parallel_safe(test)]
+        serial_tests = [test for test in tests if not is_parallel_safe(test)]
+        if self.logger:
+            self.logger.debug(f'Running {len(parallel_tests)} tests on {self.sessions}'
+                              f' sessions and {len(serial_tests)} tests sequentially')
+        start_time = time.perf_counter()
+        # Sequential part keeps the state-changing tests (e.g. logins) ordered
+        serial_results = TestResultsSI(listener=self.listener)
+        unittest.TestSuite(serial_tests).run(serial_results)
+
+        pending = queue.Queue()
+        for test in parallel_tests:
+            pending.put(test)
+        session_results = [TestResultsSI(listener=self.listener)
+                           for _ in range(min(self.sessions, len(parallel_tests)))]
+        workers = [threading.Thread(target=self.__run_session__, args=(pending, results),
+                                    name=f'ServerSI-session-{index}', daemon=True)
+                   for index, results in enumerate(session_results)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        merged = self.merge_results([serial_results] + session_results, order)
+        merged.elapsed = time.perf_counter() - start_time
+        THIS_MODULE.TEST_STATUS = merged
+        return merged
+    # -------------------------------------------------------------------------
+
+    def __run_session__(self, pending: queue.Queue, results: TestResultsSI):
+        """ Worker: runs the tests off the queue on its own ServerSI session
+        """
+        # The master connection belongs to the caller's ServerSI: closing it
+        # here would cut the sessions of the other workers
+        session = self.session_factory()
+        while True:
+            try:
+                test = pending.get_nowait()
+            except queue.Empty:
+                return
+            test.server_session = session
+            try:
+                test(results)
+            finally:
+                test.server_session = None
+    # -------------------------------------------------------------------------
+
+    @staticmethod
+    def merge_results(all_results: list, order: dict) -> TestResultsSI:
+        """ Merges the per-session results, sorted by the original test order
+        """
+        merged = TestResultsSI()
+        records = []
+        for results in all_results:
+            merged.testsRun += results.testsRun
+            merged.errors.extend(results.errors)
+            merged.failures.extend(results.failures)
+            merged.skipped.extend(results.skipped)
+            merged.expectedFailures.extend(results.expectedFailures)
+            merged.unexpectedSuccesses.extend(results.unexpectedSuccesses)
+            records.extend(zip(results.tests_recorded, results.test_results))
+        records.sort(key=lambda record: order.get(id(record[0]), len(order)))
+        merged.test_results = [record for (_, record) in records]
+        merged.tests_recorded = [test for (test, _) in records]
+        return merged
+    # -------------------------------------------------------------------------
+# =============================================================================
+
+
 class TestStrings(TestCaseSI):  # unittest.TestCase,
     """ Punch-bag class to try out modes of using subclass in Echo Test
     """
@@ -304,21 +304,24 @@ class AppToExecute(Enum):
 def ensure_dir(file_path):
     """ Ensures that the directory-path exists with os tools (at least on Linux)
     """
-    directory = os.path.dirname(file_path)
-    if not os.path.exists(directory):
-        os.makedirs(directory)
+    # exist_ok: the concurrent runs (grade_roster, the grading daemon) race to create it
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
 
 
-def get_fresh_timestamped_log(server: AppToExecute, subdir='logs', ext='.log') -> str:
+def get_fresh_timestamped_log(server: AppToExecute, subdir='logs', ext='.log', tag: str = '') -> str:
     """ Refreshes timestamp used for log, input, and other timestamped files
+        tag - tells apart the files of the runs for the different VMs/users
+        The path is built in the call (the runs of the threads call it at
+        once); the module globals only keep the latest one for the old readers.
     """
     global _TIME_STAMP, VMS_TEST_LOG_PATH
     log_dir_name = server.log_dir
-    server_name = server.bare_name
-    _TIME_STAMP = get_timestamp()
-    VMS_TEST_LOG_PATH = f'{_Sec_InVITE_HOME}/{subdir}/{log_dir_name}/test-{server_name}-on-{_TIME_STAMP}{ext}'
-    ensure_dir(VMS_TEST_LOG_PATH)
-    return VMS_TEST_LOG_PATH
+    server_name = f'{server.bare_name}-{tag}' if tag else server.bare_name
+    time_stamp = get_timestamp()
+    log_path = f'{_Sec_InVITE_HOME}/{subdir}/{log_dir_name}/test-{server_name}-on-{time_stamp}{ext}'
+    ensure_dir(log_path)
+    _TIME_STAMP, VMS_TEST_LOG_PATH = time_stamp, log_path
+    return log_path
 
 
 def saved_json_test_report_ok(json_file, result) -> str:
@@ -354,8 +357,12 @@ class VmTestArguments(object):
                  port_file_name: str = '/toolchain/config/submission_port',
                  default_user: str = 'toolchain', 
                  app_defaults:AppToExecute = AppToExecute.NOOP,
+                 args: list = None,
                  ):
-        
+        """ args - the command line to parse instead of sys.argv
+            (e.g. built by grade_roster.py for each student of the roster)
+        """
+
         self.app_defaults = app_defaults
         self.port_file_name = port_file_name
         self.default_user = default_user
@@ -448,11 +455,16 @@ class VmTestArguments(object):
                             ' Ideally, for Linux -rr should be set to "rm -rf, while for\n"' +
                             ' Windows should set it to "del" in CMD context or "rm" in PowerShell')   
              
+        parser.add_argument('-pw', '--parallel', metavar='sessions', action='store',
+                            type=int, dest='parallel_sessions', default=1,
+                            help=('Number of the concurrent SSH sessions to run the'
+                                  ' parallel-safe tests on (defaults to 1, sequential).'))
+
         # TODO: Possibly remove
         parser.add_argument('--path', '-p', metavar='keys_path', dest='keys_path',
                             type=str, default='/toolchain/ssh_keys/',
                             help='Path to the keys file ending with slash. E.g. /toolchain/ssh_keys/')
-        args = parser.parse_args()
+        args = parser.parse_args(args)
         self.__args = args
         self.set_defaults()
         # Option for flipping deep tests
@@ -506,6 +518,10 @@ class VmTestArguments(object):
     def app_to_execute(self)-> AppToExecute:
         self.app_defaults
 
+    @property
+    def parallel_sessions(self) -> int:
+        return max(1, self.__args.parallel_sessions)
+
     @property
     def app_args(self) -> argparse.Namespace:
         return self.__args
@@ -541,12 +557,17 @@ class VmTestArguments(object):
             self.__vm_name = target_vm
         return self.__vm_name
 
+    @property
+    def run_tag(self) -> str:
+        """ Names the log and results files of the run after the VM user and port """
+        return re.sub(r'[^\w.-]', '_', f'{self.__args.user_name.strip("@")}-{self.__args.port_forwarding}')
+
     @ property
     def logger_file_name(self):
         """ Returns EoL break or breaks specific to a platform
         """
         if not self.__log_file_name:
-            self.__log_file_name = get_fresh_timestamped_log(self.app_defaults)
+            self.__log_file_name = get_fresh_timestamped_log(self.app_defaults, tag=self.run_tag)
         return self.__log_file_name
 
     @ property
@@ -555,7 +576,7 @@ class VmTestArguments(object):
         """
         if not self.__json_file_name:
             self.__json_file_name = get_fresh_timestamped_log(
-                self.app_defaults, 'results', '.json')
+                self.app_defaults, 'results', '.json', tag=self.run_tag)
         return self.__json_file_name
 
     @ property
@@ -563,7 +584,9 @@ class VmTestArguments(object):
         """ Returns logger
         """
         if not self.__logger:
-            self.__logger_name = f'{self.__bare_app_name}@{self.app_defaults.log_dir}'
+            # One logger per run: the runs sharing a process must not share handlers
+            self.__logger_name = (f'{self.__bare_app_name}@{self.app_defaults.log_dir}'
+                                  f':{os.path.basename(self.logger_file_name)}')
             self.__logger = create_diagnostic_logger(self.__logger_name,
                                                      self.logger_file_name,
                                                      self.logging_level)
@@ -24,19 +24,43 @@ the Oracle VM VirtualBox Programming Guide and Reference found at:
 http://download.virtualbox.org/virtualbox/SDKRef.pdf
 '''
 
+import atexit
+import functools
+import re
+import selectors
+import shlex
 import subprocess
 import sys
+import threading
 import time
 import os
+import uuid
 import si_server_utils as utils
+import si_server_vm_telemetry as telemetry
 
 __author__ = "Chris Bean, Chris Johnson, Lee Badger"
 __status__ = "Prototype"
 
 
+HOST_IP_ADDRESS = '192.168.0.5'
+# subprocess.run counting the started commands in the operation telemetry
+_run_counted = telemetry.counted(subprocess.run)
+
+
 def host_ssh(user, command, time_sec):
-    """Run the passed command as the macos user on the host."""
-    return server_ssh(user, '192.168.0.5', command, time_sec)
+    """Run the passed command as the macos user on the host, over one of
+    the kept open host channels (see HostChannelPool).
+    """
+    return get_host_channels(user).run(command, time_sec)
+
+
+def host_ssh_batch(user, commands, time_sec):
+    """Run the passed commands one after another as the macos user on the
+    host, sent together over one host channel (one round trip, e.g. for
+    the listings of a VmStateWatcher round).
+    Returns the list of the results (as host_ssh returns them).
+    """
+    return get_host_channels(user).run_batch(commands, time_sec)
 
 
 def server_ssh(user, ip_address, command, time_sec=30):
@@ -47,17 +71,17 @@ def server_ssh(user, ip_address, command, time_sec=30):
     Assumes that the file hw.pri key is in the /toolchain/ssh_keys dir.
     """
     try:
-        result = subprocess.run(['ssh',
-                                 user + '@' + ip_address,
-                                 '-i', utils.VMS_HW_KEY_PATH,
-                                 '-o', 'IdentitiesOnly=yes',
-                                 '-o', 'StrictHostKeyChecking=no',
-                                 '-q',
-                                 command],
-                                timeout=time_sec,
-                                stdin=subprocess.PIPE,
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.STDOUT)
+        result = _run_counted(['ssh',
+                               user + '@' + ip_address,
+                               '-i', utils.VMS_HW_KEY_PATH,
+                               '-o', 'IdentitiesOnly=yes',
+                               '-o', 'StrictHostKeyChecking=no',
+                               '-q',
+                               command],
+                              timeout=time_sec,
+                              stdin=subprocess.PIPE,
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT)
     except subprocess.CalledProcessError:
         return 'CalledProcessError'
     except subprocess.TimeoutExpired:
@@ -65,8 +89,169 @@ def server_ssh(user, ip_address, command, time_sec=30):
     return result
 
 
-def get_vm_home_si():
-    
+class HostChannel:
+    '''
+    One ssh session to the host running a remote "sh" that reads the
+    commands from its stdin. Every command is run in a subshell with its
+    own stdin closed and is followed by a marker line carrying its exit
+    status, so the output of the commands sent back to back can be split:
+        <output of the command>\n<marker> <exit status>\n
+    '''
+    def __init__(self, user, ip_address):
+        self.user = user
+        self.ip_address = ip_address
+        self.commands_run = 0
+        self.process = None
+        self.__pending = b''
+
+    def open(self):
+        self.process = subprocess.Popen(['ssh',
+                                         self.user + '@' + self.ip_address,
+                                         '-i', utils.VMS_HW_KEY_PATH,
+                                         '-o', 'IdentitiesOnly=yes',
+                                         '-o', 'StrictHostKeyChecking=no',
+                                         '-o', 'ServerAliveInterval=30',
+                                         '-T', '-q',
+                                         'sh'],
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT)
+        self.__pending = b''
+
+    def is_open(self):
+        return self.process is not None and self.process.poll() is None
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+            self.process.wait(2)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        self.process.stdout.close()
+        self.process = None
+
+    def run_batch(self, commands, time_sec):
+        '''
+        Send all the commands at once and collect their framed results.
+        Returns the list of CompletedProcess (stdout holds the output, stderr
+        included), or 'CalledProcessError' / 'TimeoutError' for each command
+        without the result when the session broke or time_sec ran out.
+        The channel is closed on the errors and reopened by the next call.
+        '''
+        if not self.is_open():
+            self.open()
+        telemetry.count_subprocesses(len(commands))
+        markers = [f'__SI_HOST_EXIT_{uuid.uuid4().hex}__' for _ in commands]
+        script = ''.join(f'( {command} ) </dev/null 2>&1; printf \'\\n%s %d\\n\' {marker} $?\n'
+                         for (command, marker) in zip(commands, markers))
+        results = []
+        error = None
+        try:
+            self.process.stdin.write(script.encode('utf-8'))
+            self.process.stdin.flush()
+            deadline = time.monotonic() + time_sec
+            for (command, marker) in zip(commands, markers):
+                results.append(self.__read_result(command, marker.encode(), deadline))
+        except (OSError, EOFError):
+            error = 'CalledProcessError'
+        except subprocess.TimeoutExpired:
+            error = 'TimeoutError'
+        if error:
+            self.close()
+            results.extend([error] * (len(commands) - len(results)))
+        self.commands_run += len(commands)
+        return results
+
+    def run(self, command, time_sec):
+        '''
+        Run one command (host_ssh contract: the CompletedProcess, or
+        'CalledProcessError' / 'TimeoutError')
+        '''
+        return self.run_batch([command], time_sec)[0]
+
+    def __read_result(self, command, marker, deadline):
+        frame_start = b'\n' + marker + b' '
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.process.stdout, selectors.EVENT_READ)
+            while True:
+                start = self.__pending.find(frame_start)
+                end = self.__pending.find(b'\n', start + len(frame_start)) if start >= 0 else -1
+                if end >= 0:
+                    output = self.__pending[:start]
+                    status = int(self.__pending[start + len(frame_start):end])
+                    self.__pending = self.__pending[end + 1:]
+                    return subprocess.CompletedProcess(command, status, output, None)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not selector.select(remaining):
+                    raise subprocess.TimeoutExpired(command, 0)
+                chunk = os.read(self.process.stdout.fileno(), 65536)
+                if not chunk:
+                    raise EOFError(command)
+                self.__pending += chunk
+
+
+class HostChannelPool:
+    '''
+    The open HostChannels to the host: a caller takes an idle channel (or
+    opens a new one when all are busy) and gives it back after its
+    commands, so the concurrent operations (e.g. the lab provisioning)
+    do not wait on each other while the sequential ones reuse one session
+    '''
+    def __init__(self, user, ip_address=HOST_IP_ADDRESS):
+        self.user = user
+        self.ip_address = ip_address
+        self.channels_opened = 0
+        self.__idle = []
+        self.__lock = threading.Lock()
+
+    def run_batch(self, commands, time_sec):
+        with self.__lock:
+            if self.__idle:
+                channel = self.__idle.pop()
+            else:
+                channel = HostChannel(self.user, self.ip_address)
+                self.channels_opened += 1
+        try:
+            return channel.run_batch(commands, time_sec)
+        finally:
+            with self.__lock:
+                self.__idle.append(channel)
+
+    def run(self, command, time_sec):
+        return self.run_batch([command], time_sec)[0]
+
+    def close(self):
+        with self.__lock:
+            idle, self.__idle = self.__idle, []
+        for channel in idle:
+            channel.close()
+
+
+_HOST_CHANNELS = {}
+_HOST_CHANNELS_LOCK = threading.Lock()
+
+
+def get_host_channels(user):
+    '''
+    The shared HostChannelPool of the user (closed at the exit)
+    '''
+    with _HOST_CHANNELS_LOCK:
+        if user not in _HOST_CHANNELS:
+            _HOST_CHANNELS[user] = HostChannelPool(user)
+        return _HOST_CHANNELS[user]
+
+
+@atexit.register
+def close_host_channels():
+    with _HOST_CHANNELS_LOCK:
+        pools = list(_HOST_CHANNELS.values())
+        _HOST_CHANNELS.clear()
+    for pool in pools:
+        pool.close()
+
 
 # def retrieve_macos_user():
 #     '''
@@ -80,6 +265,288 @@ def get_vm_home_si():
 #         sys.exit(1)
 
 
+def parse_vm_names(vm_listing):
+    '''
+    Parse the output of "VBoxManage list vms|runningvms" ("name" {uuid} per line)
+    into the dict of the VM names to their UUIDs
+    '''
+    vm_names = {}
+    for line in vm_listing.splitlines():
+        line = line.strip()
+        if line.startswith('"') and line.endswith('}'):
+            name, _, uuid = line[1:].rpartition('" {')
+            vm_names[name] = uuid[:-1]
+    return vm_names
+
+
+class VmWaiter:
+    '''
+    One caller waiting for a VM to (dis)appear in a listing
+    '''
+    def __init__(self, vm_name, kind, present):
+        self.vm_name = vm_name
+        self.kind = kind
+        self.present = present
+        self.reached = threading.Event()
+        # The telemetry records of the waiting thread (e.g. start_vm): the
+        # poller thread counts the listings it runs for them in their records
+        self.operations = list(telemetry.RECORDER.active())
+
+
+class VmStateWatcher:
+    '''
+    Serves all the callers waiting for the VM state changes with a single
+    poller thread: one "list runningvms" and/or "list vms" per round,
+    whatever number of the VMs is awaited, and only the listings somebody
+    waits on. The rounds start right away and back off exponentially
+    (min_interval doubling up to max_interval) while nothing changes; a
+    new waiter restarts from min_interval. The poller exits when nobody
+    waits.
+    '''
+    LISTINGS = {'running': 'list_running_vms', 'registered': 'list_vms'}
+    LIST_VERBS = {'running': 'runningvms', 'registered': 'vms'}
+
+    def __init__(self, user, virtualized, min_interval=0.5, max_interval=4.0):
+        self.user = user
+        self.virtualized = virtualized
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.polls = 0      # listings run so far (VBoxManage processes forked)
+        self.__waiters = []
+        self.__changed = threading.Condition()
+        self.__poller = None
+
+    def wait_for(self, vm_name, kind='running', present=True, timeout=60):
+        '''
+        Block until vm_name is (present=True) or is not (present=False)
+        in the running (kind='running') or registered (kind='registered')
+        VMs. Return False on timeout.
+        '''
+        waiter = VmWaiter(vm_name, kind, present)
+        with self.__changed:
+            self.__waiters.append(waiter)
+            if self.__poller is None:
+                self.__poller = threading.Thread(target=self.__poll, daemon=True,
+                                                 name=f'vm-state-{self.user}')
+                self.__poller.start()
+            self.__changed.notify()
+        try:
+            return waiter.reached.wait(timeout)
+        finally:
+            with self.__changed:
+                self.__waiters.remove(waiter)
+
+    def list_names(self, kind):
+        '''
+        The names of the running or registered VMs (None if listing failed)
+        '''
+        listing = globals()[self.LISTINGS[kind]](self.user, self.virtualized)
+        self.polls += 1
+        if listing.startswith('FAIL - '):
+            return None
+        return parse_vm_names(listing)
+
+    def list_all_names(self, kinds):
+        '''
+        The names of the VMs of every kind (None where the listing failed);
+        on the host the listings go together, in one round trip
+        '''
+        kinds = sorted(kinds)
+        if not self.virtualized or len(kinds) < 2:
+            return {kind: self.list_names(kind) for kind in kinds}
+        results = host_ssh_batch(self.user, ['/usr/local/bin/vboxmanage list '
+                                             + self.LIST_VERBS[kind] for kind in kinds], 30)
+        self.polls += len(kinds)
+        return {kind: (parse_vm_names(result.stdout.decode('utf-8'))
+                       if not isinstance(result, str) and result.returncode == 0 else None)
+                for (kind, result) in zip(kinds, results)}
+
+    def __poll(self):
+        interval = self.min_interval
+        while True:
+            with self.__changed:
+                waiters = [waiter for waiter in self.__waiters
+                           if not waiter.reached.is_set()]
+                if not waiters:
+                    self.__poller = None
+                    return
+            listings = self.list_all_names({waiter.kind for waiter in waiters})
+            for waiter in waiters:
+                telemetry.count_subprocesses(1, waiter.operations)
+                names = listings[waiter.kind]
+                if names is not None and (waiter.vm_name in names) == waiter.present:
+                    waiter.reached.set()
+            with self.__changed:
+                if self.__changed.wait(interval):
+                    interval = self.min_interval
+                else:
+                    interval = min(interval * 2, self.max_interval)
+
+
+_STATE_WATCHERS = {}
+_STATE_WATCHERS_LOCK = threading.Lock()
+
+
+def get_state_watcher(user, virtualized):
+    '''
+    The shared VmStateWatcher of the host (one per user and host kind)
+    '''
+    with _STATE_WATCHERS_LOCK:
+        return _STATE_WATCHERS.setdefault((user, bool(virtualized)),
+                                          VmStateWatcher(user, virtualized))
+
+
+_NIC_RULE = re.compile(r'NIC \d+ Rule\(\d+\):\s*name = (?P<name>[^,]*), protocol = (?P<protocol>[^,]*),'
+                       r' host ip = [^,]*, host port = (?P<host_port>\d+), guest ip = [^,]*,'
+                       r' guest port = (?P<guest_port>\d+)')
+
+
+class VmRecord:
+    '''
+    One registered VM of "VBoxManage list -l vms"
+    '''
+    def __init__(self, name, uuid='', state=''):
+        self.name = name
+        self.uuid = uuid
+        self.state = state              # e.g. 'running', 'powered off', 'saved'
+        self.forwarded_ports = {}       # NAT rule name -> (protocol, host port, guest port)
+
+    @property
+    def running(self):
+        return self.state == 'running'
+
+    def __repr__(self):
+        return f'VmRecord({self.name!r}, {self.uuid!r}, {self.state!r}, {self.forwarded_ports!r})'
+
+
+def parse_vm_inventory(vm_listing):
+    '''
+    Parse the output of "VBoxManage list -l vms" into the VmRecords.
+    A record starts at each top-level "Name:" line (the shared folder
+    lines "Name: 'folder', Host path: ..." and the indented snapshot
+    names are not VM names)
+    '''
+    records = []
+    for line in vm_listing.splitlines():
+        key, _, value = line.partition(':')
+        value = value.strip()
+        if key == 'Name' and not value.startswith("'"):
+            records.append(VmRecord(value))
+        elif not records:
+            continue
+        elif key == 'UUID' and not records[-1].uuid:
+            records[-1].uuid = value
+        elif key == 'State':
+            records[-1].state = value.split(' (since')[0]
+        else:
+            rule = _NIC_RULE.match(line)
+            if rule:
+                records[-1].forwarded_ports[rule['name']] = (
+                    rule['protocol'], int(rule['host_port']), int(rule['guest_port']))
+    return records
+
+
+class InventoryError(Exception):
+    '''
+    The VBoxManage listing of the VMs failed: the state of the host is
+    unknown (not "no VMs")
+    '''
+
+
+class VmInventory:
+    '''
+    The registered VMs of the host, parsed once from "list -l vms" and
+    indexed by name and by UUID. The snapshot is reused for ttl seconds
+    and dropped by every mutating call of this module (see
+    _invalidates_inventory), so the lab-wide lookups cost a dict access.
+    A failed listing is not cached: the lookups raise InventoryError.
+    '''
+    def __init__(self, user, virtualized, ttl=5.0):
+        self.user = user
+        self.virtualized = virtualized
+        self.ttl = ttl
+        self.refreshes = 0
+        self.__by_name = {}
+        self.__by_uuid = {}
+        self.__loaded_at = None
+        self.__lock = threading.Lock()
+
+    def invalidate(self):
+        with self.__lock:
+            self.__loaded_at = None
+
+    def __current(self):
+        with self.__lock:
+            if (self.__loaded_at is None
+                    or time.monotonic() - self.__loaded_at > self.ttl):
+                listing = _run_vboxmanage(self.user, ['list', '-l', 'vms'],
+                                          self.virtualized, 30)
+                if listing in ('CalledProcessError', 'TimeoutError'):
+                    self.__loaded_at = None
+                    raise InventoryError(f'Unable to list registered virtual machines ({listing})')
+                records = parse_vm_inventory(listing)
+                self.__by_name = {record.name: record for record in records}
+                self.__by_uuid = {record.uuid: record for record in records}
+                self.__loaded_at = time.monotonic()
+                self.refreshes += 1
+            return self.__by_name, self.__by_uuid
+
+    def get(self, name_or_uuid):
+        '''
+        The VmRecord with exactly this name or UUID (None if not registered)
+        '''
+        by_name, by_uuid = self.__current()
+        return by_name.get(name_or_uuid) or by_uuid.get(name_or_uuid)
+
+    def records(self):
+        return list(self.__current()[0].values())
+
+    def is_registered(self, vm_name):
+        return self.get(vm_name) is not None
+
+    def is_running(self, vm_name):
+        record = self.get(vm_name)
+        return record is not None and record.running
+
+    def used_host_ports(self):
+        '''
+        The host ports of all the NAT forwarding rules of the registered VMs
+        '''
+        return {host_port for record in self.records()
+                for (_, host_port, _) in record.forwarded_ports.values()}
+
+
+_INVENTORIES = {}
+_INVENTORIES_LOCK = threading.Lock()
+
+
+def get_inventory(user, virtualized):
+    '''
+    The shared VmInventory of the host (one per user and host kind)
+    '''
+    with _INVENTORIES_LOCK:
+        return _INVENTORIES.setdefault((user, bool(virtualized)),
+                                       VmInventory(user, virtualized))
+
+
+def _invalidates_inventory(vm_operation):
+    '''
+    Decorator of the operations changing the VMs of the host (the first
+    argument is the user): the inventories of the user are dropped after
+    the operation, whatever its result
+    '''
+    @functools.wraps(vm_operation)
+    def wrapper(user, *args, **kwargs):
+        try:
+            return vm_operation(user, *args, **kwargs)
+        finally:
+            for virtualized in (False, True):
+                inventory = _INVENTORIES.get((user, virtualized))
+                if inventory is not None:
+                    inventory.invalidate()
+    return wrapper
+
+
 def is_virtualized():
     '''
     Determine if code is being run in a virtual machine
@@ -88,6 +555,33 @@ def is_virtualized():
                 and os.path.isdir(utils.VMS_VIRTUAL_VBOX_DIR))
 
 
+def _run_vboxmanage(user, arguments, virtualized, timeout_in_secs):
+    '''
+    Run one VBoxManage verb (arguments: list) locally or on the host.
+    Returns the stripped output, or 'CalledProcessError' when VBoxManage
+    exits with an error and 'TimeoutError' when it takes too long
+    '''
+    if virtualized:
+        command = ' '.join(['/usr/local/bin/vboxmanage']
+                           + [shlex.quote(str(argument)) for argument in arguments])
+        results = host_ssh(user, command, timeout_in_secs)
+        if results in ('CalledProcessError', 'TimeoutError'):
+            return results
+    else:
+        try:
+            results = _run_counted(['VBoxManage'] + [str(argument) for argument in arguments],
+                                   stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT,
+                                   timeout=timeout_in_secs)
+        except subprocess.TimeoutExpired:
+            return 'TimeoutError'
+    if results.returncode != 0:
+        return 'CalledProcessError'
+    return results.stdout.decode('utf-8').strip()
+
+
+@telemetry.instrumented()
 def list_running_vms(user, virtualized):
     '''
     List running virtual machines
@@ -104,11 +598,11 @@ def list_running_vms(user, virtualized):
             took longer than %f seconds' % timeout_in_secs
     else:
         try:
-            vm_names = subprocess.run(['VBoxManage', 'list', 'runningvms'],
-                                      stdin=subprocess.PIPE,
-                                      stdout=subprocess.PIPE,
-                                      stderr=subprocess.STDOUT,
-                                      timeout=timeout_in_secs)
+            vm_names = _run_counted(['VBoxManage', 'list', 'runningvms'],
+                                    stdin=subprocess.PIPE,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT,
+                                    timeout=timeout_in_secs)
         except subprocess.CalledProcessError:
             return 'FAIL - Unable to list running virtual machines'
         except subprocess.TimeoutExpired:
@@ -119,6 +613,7 @@ def list_running_vms(user, virtualized):
     return vm_names
 
 
+@telemetry.instrumented()
 def list_vms(user, virtualized):
     '''
     List registered virtual machines
@@ -135,11 +630,11 @@ def list_vms(user, virtualized):
                     than %f seconds' % timeout_in_secs
     else:
         try:
-            vm_names = subprocess.run(['VBoxManage', 'list', 'vms'],
-                                      stdin=subprocess.PIPE,
-                                      stdout=subprocess.PIPE,
-                                      stderr=subprocess.STDOUT,
-                                      timeout=timeout_in_secs)
+            vm_names = _run_counted(['VBoxManage', 'list', 'vms'],
+                                    stdin=subprocess.PIPE,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT,
+                                    timeout=timeout_in_secs)
         except subprocess.CalledProcessError:
             return 'FAIL - FAIL - Unable to list registered virtual machines.'
         except subprocess.TimeoutExpired:
@@ -150,6 +645,7 @@ def list_vms(user, virtualized):
     return vm_names
 
 
+@telemetry.instrumented()
 def dry_run_import(user, ova_file, virtualized):
     '''
     Perform a dry-run import of the virtual appliance (.ova)
@@ -166,12 +662,12 @@ def dry_run_import(user, ova_file, virtualized):
             seconds' % timeout_in_secs
     else:
         try:
-            import_result = subprocess.run(['VBoxManage', 'import',
-                                            '-n', ova_file],
-                                           stdin=subprocess.PIPE,
-                                           stdout=subprocess.PIPE,
-                                           stderr=subprocess.STDOUT,
-                                           timeout=timeout_in_secs)
+            import_result = _run_counted(['VBoxManage', 'import',
+                                          '-n', ova_file],
+                                         stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE,
+                                         stderr=subprocess.STDOUT,
+                                         timeout=timeout_in_secs)
         except subprocess.CalledProcessError:
             return 'FAIL - Dry-run import could not be completed.'
         except subprocess.TimeoutExpired:
@@ -182,13 +678,18 @@ def dry_run_import(user, ova_file, virtualized):
     return import_result
 
 
-def full_import(user, ova_file, virtualized):
+@telemetry.instrumented()
+@_invalidates_inventory
+def full_import(user, ova_file, virtualized, vm_name=None):
     '''
-    Perform a full import of the virtual appliance file (.ova)
+    Perform a full import of the virtual appliance file (.ova), optionally
+    naming the imported virtual machine (no rename_vm round trip needed)
     '''
     timeout_in_secs = 300
+    name_options = ['--vsys', '0', '--vmname', vm_name] if vm_name else []
     if virtualized:
-        import_command = '/usr/local/bin/vboxmanage import ' + ova_file
+        import_command = ' '.join(['/usr/local/bin/vboxmanage import', ova_file]
+                                  + name_options)
         full_results = host_ssh(user, import_command, timeout_in_secs)
         if full_results == 'CalledProcessError':
             return 'FAIL - Full import of vm could not be completed.'
@@ -197,11 +698,12 @@ def full_import(user, ova_file, virtualized):
             seconds' % timeout_in_secs
     else:
         try:
-            full_results = subprocess.run(['VBoxManage', 'import', ova_file],
-                                          stdin=subprocess.PIPE,
-                                          stdout=subprocess.PIPE,
-                                          stderr=subprocess.STDOUT,
-                                          timeout=timeout_in_secs)
+            full_results = _run_counted(['VBoxManage', 'import', ova_file]
+                                        + name_options,
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT,
+                                        timeout=timeout_in_secs)
         except subprocess.CalledProcessError:
             return 'FAIL - Full import of vm could not be completed.'
         except subprocess.TimeoutExpired:
@@ -212,6 +714,8 @@ def full_import(user, ova_file, virtualized):
     return full_results
 
 
+@telemetry.instrumented()
+@_invalidates_inventory
 def delete_forwarding_port(user, vm_name, port_name, virtualized):
     '''
     Delete forwarding port in virtual machine
@@ -229,12 +733,12 @@ def delete_forwarding_port(user, vm_name, port_name, virtualized):
         %f seconds' % timeout_in_secs
     else:
         try:
-            results = subprocess.run(['VBoxManage', 'modifyvm', vm_name,
-                                      '--natpf1', 'delete', port_name],
-                                     stdin=subprocess.PIPE,
-                                     stdout=subprocess.PIPE,
-                                     stderr=subprocess.STDOUT,
-                                     timeout=timeout_in_secs)
+            results = _run_counted(['VBoxManage', 'modifyvm', vm_name,
+                                    '--natpf1', 'delete', port_name],
+                                   stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT,
+                                   timeout=timeout_in_secs)
         except subprocess.CalledProcessError:
             return 'FAIL - Forwarding port could not be deleted.'
         except subprocess.TimeoutExpired:
@@ -245,6 +749,8 @@ def delete_forwarding_port(user, vm_name, port_name, virtualized):
     return results
 
 
+@telemetry.instrumented()
+@_invalidates_inventory
 def create_port_forward_rule(user, vm_name, tcp_port, virtualized):
     '''
     Add port forwarding rule in virtual machine
@@ -262,11 +768,11 @@ def create_port_forward_rule(user, vm_name, tcp_port, virtualized):
         %f seconds' % timeout_in_secs
     else:
         try:
-            results = subprocess.run(['VBoxManage', 'modifyvm',
-                                      vm_name, '--natpf1',
-                                      f'ssh2,tcp,,{tcp_port},,22'],
-                                     stdout=subprocess.PIPE,
-                                     stderr=subprocess.STDOUT)
+            results = _run_counted(['VBoxManage', 'modifyvm',
+                                    vm_name, '--natpf1',
+                                    f'ssh2,tcp,,{tcp_port},,22'],
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT)
         except subprocess.CalledProcessError:
             return 'FAIL - Forwarding port rule could not be created.'
         except subprocess.TimeoutExpired:
@@ -277,6 +783,8 @@ def create_port_forward_rule(user, vm_name, tcp_port, virtualized):
     return results
 
 
+@telemetry.instrumented()
+@_invalidates_inventory
 def rename_vm(user, vm_name, new_vm_name, virtualized):
     '''
     Rename the virtual machine
@@ -294,12 +802,12 @@ def rename_vm(user, vm_name, new_vm_name, virtualized):
         seconds' % timeout_in_secs
     else:
         try:
-            subprocess.run(['VBoxManage', 'modifyvm',
-                            vm_name, '--name', new_vm_name],
-                           stdin=subprocess.PIPE,
-                           stdout=subprocess.PIPE,
-                           stderr=subprocess.STDOUT,
-                           timeout=timeout_in_secs)
+            _run_counted(['VBoxManage', 'modifyvm',
+                          vm_name, '--name', new_vm_name],
+                         stdin=subprocess.PIPE,
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.STDOUT,
+                         timeout=timeout_in_secs)
         except subprocess.CalledProcessError:
             return 'FAIL - Virtual machine could not be renamed.'
         except subprocess.TimeoutExpired:
@@ -308,15 +816,19 @@ def rename_vm(user, vm_name, new_vm_name, virtualized):
     return 'SUCCESS - Virtual machine successfully renamed.'
 
 
+@telemetry.instrumented()
+@_invalidates_inventory
 def start_vm(user, vm_name, virtualized):
     '''
     Start the virtual machine.
     '''
     timeout_in_secs = 60
 
-    vms = list_vms(user, virtualized)
-
-    if vm_name in vms:
+    try:
+        registered = get_inventory(user, virtualized).is_registered(vm_name)
+    except InventoryError:
+        return 'FAIL - Unable to list registered virtual machines'
+    if registered:
         if virtualized:
             command = ('/usr/local/bin/vboxmanage startvm --type headless '
                        + vm_name)
@@ -328,29 +840,28 @@ def start_vm(user, vm_name, virtualized):
                 seconds' % timeout_in_secs
         else:
             try:
-                subprocess.run(['VBoxManage', 'startvm',
-                                '--type', 'headless',
-                                vm_name],
-                               stdin=subprocess.PIPE,
-                               stdout=subprocess.PIPE,
-                               stderr=subprocess.STDOUT,
-                               timeout=timeout_in_secs)
+                _run_counted(['VBoxManage', 'startvm',
+                              '--type', 'headless',
+                              vm_name],
+                             stdin=subprocess.PIPE,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.STDOUT,
+                             timeout=timeout_in_secs)
             except subprocess.CalledProcessError:
                 return 'FAIL - Virtual machine could not be started.'
             except subprocess.TimeoutExpired:
                 return 'FAIL - VM startup took longer than %f \
                 seconds' % timeout_in_secs
-        while ((vm_name not in list_running_vms(user, virtualized)) and
-               timeout_in_secs > 0):
-            time.sleep(1)
-            timeout_in_secs -= 1
-            if timeout_in_secs == 0:
-                return 'FAIL - Virtual machine could not be started.'
+        if not get_state_watcher(user, virtualized).wait_for(
+                vm_name, 'running', True, timeout_in_secs):
+            return 'FAIL - Virtual machine could not be started.'
         return 'SUCCESS - Virtual machine successfully started.'
     else:
         return 'FAIL - Virtual machine not found'
 
 
+@telemetry.instrumented()
+@_invalidates_inventory
 def stop_vm(user, vm_name, virtualized):
     '''
     Shutdown the virtual machine.
@@ -359,9 +870,11 @@ def stop_vm(user, vm_name, virtualized):
 
     vbox_path = utils.VMS_VBOXMANAGE_PATH
 
-    running_vms = list_running_vms(user, virtualized)
-
-    if vm_name in running_vms:
+    try:
+        running = get_inventory(user, virtualized).is_running(vm_name)
+    except InventoryError:
+        return 'FAIL - Unable to list registered virtual machines'
+    if running:
         if virtualized:
             stop_command = vbox_path + ' controlvm ' + vm_name + ' poweroff'
             results = host_ssh(user, stop_command, timeout_in_secs)
@@ -372,28 +885,27 @@ def stop_vm(user, vm_name, virtualized):
                 seconds' % timeout_in_secs
         else:
             try:
-                subprocess.run(['VBoxManage', 'controlvm',
-                                vm_name, 'poweroff'],
-                               stdin=subprocess.PIPE,
-                               stdout=subprocess.PIPE,
-                               stderr=subprocess.STDOUT,
-                               timeout=timeout_in_secs)
+                _run_counted(['VBoxManage', 'controlvm',
+                              vm_name, 'poweroff'],
+                             stdin=subprocess.PIPE,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.STDOUT,
+                             timeout=timeout_in_secs)
             except subprocess.CalledProcessError:
                 return 'FAIL - Virtual machine could not be shutdown.'
             except subprocess.TimeoutExpired:
                 return 'FAIL - VM shutdown took longer than %f \
                 seconds' % timeout_in_secs
-        while ((vm_name in list_running_vms(user, virtualized)) and
-               timeout_in_secs > 0):
-            time.sleep(1)
-            timeout_in_secs -= 1
-            if timeout_in_secs == 0:
-                return 'FAIL - Virtual machine could not be shutdown.'
+        if not get_state_watcher(user, virtualized).wait_for(
+                vm_name, 'running', False, timeout_in_secs):
+            return 'FAIL - Virtual machine could not be shutdown.'
         return 'SUCCESS - Virtual machine successfully shutdown.'
     else:
         return 'SUCCESS - Virtual machine already shutdown'
 
 
+@telemetry.instrumented()
+@_invalidates_inventory
 def delete_vm(user, vm_name, virtualized):
     '''
     Deletes the virtual machine -- this is a hard delete where all the virtual
@@ -403,9 +915,11 @@ def delete_vm(user, vm_name, virtualized):
 
     vbox = utils.VMS_VBOXMANAGE_PATH
 
-    registered_vms = list_vms(user, virtualized)
-
-    if vm_name in registered_vms:
+    try:
+        registered = get_inventory(user, virtualized).is_registered(vm_name)
+    except InventoryError:
+        return 'FAIL - Unable to list registered virtual machines'
+    if registered:
         if virtualized:
             delete_command = vbox + ' unregistervm ' + vm_name + ' --delete'
             results = host_ssh(user, delete_command, timeout_in_secs)
@@ -416,25 +930,24 @@ def delete_vm(user, vm_name, virtualized):
                 seconds' % timeout_in_secs
         else:
             try:
-                subprocess.run(['VBoxManage', 'unregistervm',
-                                vm_name, '--delete'],
-                               stdin=subprocess.PIPE,
-                               stdout=subprocess.PIPE,
-                               stderr=subprocess.STDOUT,
-                               timeout=timeout_in_secs)
+                _run_counted(['VBoxManage', 'unregistervm',
+                              vm_name, '--delete'],
+                             stdin=subprocess.PIPE,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.STDOUT,
+                             timeout=timeout_in_secs)
             except subprocess.CalledProcessError:
                 return 'FAIL - Virtual machine could not be deleted.'
             except subprocess.TimeoutExpired:
                 return 'FAIL - VM deletion took longer than %f \
                 seconds' % timeout_in_secs
-        while ((vm_name in list_vms(user, virtualized)) and
-               timeout_in_secs > 0):
-            time.sleep(1)
-            timeout_in_secs -= 1
-            if timeout_in_secs == 0:
-                return 'FAIL - Virtual machine could not be deleted.'
+        if not get_state_watcher(user, virtualized).wait_for(
+                vm_name, 'registered', False, timeout_in_secs):
+            return 'FAIL - Virtual machine could not be deleted.'
     return 'SUCCESS - Virtual machine successfully deleted.'
 
+@telemetry.instrumented()
+@_invalidates_inventory
 def delete_vm_group(user, vm_name, virtualized):
     '''
     Delete groups from virtual machine
@@ -452,12 +965,12 @@ def delete_vm_group(user, vm_name, virtualized):
         %f seconds' % timeout_in_secs
     else:
         try:
-            results = subprocess.run('VBoxManage modifyvm ' + vm_name +
-                                      ' --groups ""', shell=True,
-                                     stdin=subprocess.PIPE,
-                                     stdout=subprocess.PIPE,
-                                     stderr=subprocess.STDOUT,
-                                     timeout=timeout_in_secs)
+            results = _run_counted('VBoxManage modifyvm ' + vm_name +
+                                    ' --groups ""', shell=True,
+                                   stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT,
+                                   timeout=timeout_in_secs)
         except subprocess.CalledProcessError:
             return 'FAIL - VM group could not be deleted.'
         except subprocess.TimeoutExpired:
@@ -468,5 +981,88 @@ def delete_vm_group(user, vm_name, virtualized):
     return results
 
 
+BASELINE_SNAPSHOT = 'si-baseline'
+
+
+@telemetry.instrumented()
+@_invalidates_inventory
+def take_snapshot(user, vm_name, virtualized, snapshot_name=BASELINE_SNAPSHOT):
+    '''
+    Take a snapshot of the virtual machine (the baseline to reset to or
+    to clone linked virtual machines from)
+    '''
+    timeout_in_secs = 120
+
+    results = _run_vboxmanage(user, ['snapshot', vm_name, 'take', snapshot_name],
+                              virtualized, timeout_in_secs)
+    if results == 'CalledProcessError':
+        return 'FAIL - Snapshot could not be taken.'
+    if results == 'TimeoutError':
+        return 'FAIL - Snapshot took longer than %f seconds' % timeout_in_secs
+    return 'SUCCESS - Snapshot successfully taken.'
+
+
+@telemetry.instrumented()
+@_invalidates_inventory
+def restore_snapshot(user, vm_name, virtualized, snapshot_name=BASELINE_SNAPSHOT):
+    '''
+    Revert the (powered off) virtual machine to the snapshot -- only the
+    differencing disk is discarded, nothing is copied
+    '''
+    timeout_in_secs = 60
+
+    results = _run_vboxmanage(user, ['snapshot', vm_name, 'restore', snapshot_name],
+                              virtualized, timeout_in_secs)
+    if results == 'CalledProcessError':
+        return 'FAIL - Snapshot could not be restored.'
+    if results == 'TimeoutError':
+        return 'FAIL - Snapshot restore took longer than %f \
+        seconds' % timeout_in_secs
+    return 'SUCCESS - Snapshot successfully restored.'
+
+
+@telemetry.instrumented()
+@_invalidates_inventory
+def clone_linked_vm(user, vm_name, new_vm_name, virtualized,
+                    snapshot_name=BASELINE_SNAPSHOT):
+    '''
+    Create and register a linked clone of the virtual machine snapshot: the
+    clone shares the base disk image and only gets its own differencing disk
+    '''
+    timeout_in_secs = 120
+
+    results = _run_vboxmanage(user, ['clonevm', vm_name,
+                                     '--snapshot', snapshot_name,
+                                     '--options', 'link',
+                                     '--name', new_vm_name,
+                                     '--register'],
+                              virtualized, timeout_in_secs)
+    if results == 'CalledProcessError':
+        return 'FAIL - Linked clone could not be created.'
+    if results == 'TimeoutError':
+        return 'FAIL - Linked clone took longer than %f seconds' % timeout_in_secs
+    return 'SUCCESS - Linked clone successfully created.'
+
+
+@telemetry.instrumented()
+def reset_vm(user, vm_name, virtualized, snapshot_name=BASELINE_SNAPSHOT,
+             start=True):
+    '''
+    Reset the virtual machine to a clean state: power it off, revert it to
+    the snapshot, and (optionally) start it again. Replaces delete_vm and
+    full_import of the OVA between the gradings.
+    '''
+    results = stop_vm(user, vm_name, virtualized)
+    if results.startswith('FAIL'):
+        return results
+    results = restore_snapshot(user, vm_name, virtualized, snapshot_name)
+    if results.startswith('FAIL') or not start:
+        return results
+    results = start_vm(user, vm_name, virtualized)
+    if results.startswith('FAIL'):
+        return results
+    return 'SUCCESS - Virtual machine successfully reset.'
+
+
 if __name__ == '__main__':
     pass
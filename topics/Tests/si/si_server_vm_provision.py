@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+""" The module stands up a whole lab of the student VMs at once: the OVA
+    imports run concurrently under a disk I/O cap, every VM gets its own
+    forwarding port, and each VM goes on to the port-forward and the start
+    stages as soon as its own import is done
+# =============================================================================
+    This software was developed at the National Institute of Standards
+    and Technology by employees of the Federal Government in the course
+    of their official duties.  Pursuant to title 17 Section 105 of the
+    United States Code this software is not subject to copyright
+    protection and is in the public domain.  NIST assumes no
+    responsibility whatsoever for its use by other parties, and makes
+    no guarantees, expressed or implied, about its quality,
+    reliability, or any other characteristic.
+# =============================================================================
+    We would appreciate acknowledgement if the software is used.
+"""
+__author__ = "Dmitry Cousin"
+__status__ = "Prototype"
+
+import os
+import argparse
+import csv
+import threading
+import time
+from concurrent import futures
+
+import si_server_utils as utils
+import si_server_vm_manage as vm_manage
+import si_server_vm_telemetry as telemetry
+
+# import (or clone), port-forward, start - in the order every VM goes through them
+PROVISION_STAGES = ('import', 'clone', 'forward', 'start')
+# ============================================================================||
+
+
+def stage_failed(result: str) -> bool:
+    """ vm_manage returns 'FAIL - ...' on its own errors and the VBoxManage
+        output (with 'error:' lines) on the command errors
+    """
+    return result.startswith('FAIL') or 'error:' in result
+# ------------------------------------------------------------------------|
+
+
+class ProvisionJob(object):
+    """ One VM of the lab: what to import, the name and port it gets,
+        and how long each of its stages took
+    """
+
+    def __init__(self, ova_file: str, vm_name: str, tcp_port: int = 0):
+        self.ova_file = ova_file
+        self.vm_name = vm_name
+        self.tcp_port = tcp_port
+        self.status = 'PENDING'
+        self.message = ''
+        self.stages = {}    # stage name -> seconds
+    # ------------------------------------------------------------------------|
+
+    def as_dict(self) -> dict:
+        return {'vm': self.vm_name, 'ova': self.ova_file, 'port': self.tcp_port,
+                'status': self.status, 'message': self.message, 'stages': dict(self.stages)}
+    # ------------------------------------------------------------------------|
+# ============================================================================||
+
+
+class LabProvisioner(object):
+    """ Provisions the ProvisionJobs over a pool of worker threads
+        Only import_limit imports run at a time (they are disk I/O bound);
+        the port-forward and the start stages are not capped, so they
+        overlap with the imports still running.
+        With a base_vm the VMs are linked clones of its baseline snapshot
+        instead of the full imports of the OVA.
+    """
+
+    def __init__(self, user: str, virtualized: bool, import_limit: int = 4,
+                 workers: int = 8, base_vm: str = ''):
+        self.user = user
+        self.virtualized = virtualized
+        self.base_vm = base_vm
+        self.workers = max(1, workers)
+        self.import_slots = threading.Semaphore(max(1, import_limit))
+        self.elapsed = 0.0
+        self.__ports = set()
+        self.__ports_lock = threading.Lock()
+    # ------------------------------------------------------------------------|
+
+    def allocate_port(self, tcp_port: int = 0) -> int:
+        """ Reserves the given port, or the next unused local TCP port, for
+            one VM; a port is never handed out twice in the lab
+        Raises:
+            ValueError: the given port is already taken by another VM
+        """
+        with self.__ports_lock:
+            if tcp_port:
+                if tcp_port in self.__ports:
+                    raise ValueError(f'Port {tcp_port} is assigned twice')
+            else:
+                tcp_port = utils.get_next_unused_local_tcp_port()
+                while tcp_port in self.__ports:
+                    tcp_port = utils.get_next_unused_local_tcp_port()
+            self.__ports.add(tcp_port)
+            return tcp_port
+    # ------------------------------------------------------------------------|
+
+    def prepare_base(self, ova_file: str) -> str:
+        """ Imports the OVA as the base_vm (unless it is registered already)
+            and takes its baseline snapshot for the linked clones
+        Returns:
+            str: the vm_manage result
+        """
+        try:
+            if vm_manage.get_inventory(self.user, self.virtualized).is_registered(self.base_vm):
+                return 'SUCCESS - Base virtual machine already registered.'
+        except vm_manage.InventoryError as ex:
+            return f'FAIL - {ex}'
+        result = vm_manage.full_import(self.user, ova_file, self.virtualized, self.base_vm)
+        if stage_failed(result):
+            return result
+        return vm_manage.take_snapshot(self.user, self.base_vm, self.virtualized)
+    # ------------------------------------------------------------------------|
+
+    def provision(self, job: ProvisionJob) -> ProvisionJob:
+        """ Imports (or clones), port-forwards, and starts the VM of the job,
+            stopping at the first failed stage
+        """
+        if self.base_vm:
+            create = ('clone', lambda: vm_manage.clone_linked_vm(
+                          self.user, self.base_vm, job.vm_name, self.virtualized))
+        else:
+            create = ('import', lambda: vm_manage.full_import(
+                          self.user, job.ova_file, self.virtualized, job.vm_name))
+        stages = (create,
+                  ('forward', lambda: vm_manage.create_port_forward_rule(
+                       self.user, job.vm_name, job.tcp_port, self.virtualized)),
+                  ('start', lambda: vm_manage.start_vm(
+                       self.user, job.vm_name, self.virtualized)))
+        for (stage, run_stage) in stages:
+            job.status = stage.upper()
+            if stage in ('import', 'clone'):
+                with self.import_slots:     # the wait for the slot is not import time
+                    start = time.perf_counter()
+                    result = run_stage()
+            else:
+                start = time.perf_counter()
+                result = run_stage()
+            job.stages[stage] = time.perf_counter() - start
+            if stage_failed(result):
+                job.status = 'FAILED'
+                job.message = f'{stage}: {result}'
+                return job
+        job.status = 'READY'
+        return job
+    # ------------------------------------------------------------------------|
+
+    def run(self, jobs: list) -> list:
+        """ Provisions all the jobs (the ports are allocated before anything
+            starts, skipping the ports forwarded to the registered VMs)
+            A job whose port can not be allocated is FAILED, the others go on;
+            without the inventory (the ports in use unknown) all of them fail.
+        Returns:
+            list: the jobs in the given order
+        """
+        try:
+            used_ports = vm_manage.get_inventory(self.user, self.virtualized).used_host_ports()
+        except vm_manage.InventoryError as ex:
+            for job in jobs:
+                job.status = 'FAILED'
+                job.message = f'inventory: {ex}'
+            print(f'{len(jobs)} VMs FAILED: {ex}')
+            return jobs
+        with self.__ports_lock:
+            self.__ports.update(used_ports)
+        (queued, done_count) = ([], 0)
+        for job in jobs:
+            try:
+                job.tcp_port = self.allocate_port(job.tcp_port)
+                queued.append(job)
+            except ValueError as ex:
+                job.status = 'FAILED'
+                job.message = f'port: {ex}'
+                done_count += 1
+                print(f'[{done_count}/{len(jobs)}] {job.vm_name}:{job.tcp_port}'
+                      f' {job.status} {job.message}')
+        start = time.perf_counter()
+        with futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            done_jobs = {executor.submit(self.provision, job): job for job in queued}
+            for done in futures.as_completed(done_jobs):
+                job = done_jobs[done]
+                done_count += 1
+                try:
+                    done.result()
+                except Exception as ex:
+                    job.status = 'FAILED'
+                    job.message = f'{type(ex).__name__}: {ex}'
+                print(f'[{done_count}/{len(jobs)}] {job.vm_name}:{job.tcp_port}'
+                      f' {job.status} {job.message}')
+        self.elapsed = time.perf_counter() - start
+        return jobs
+    # ------------------------------------------------------------------------|
+
+    def report(self, jobs: list) -> str:
+        """ Per-stage timings of the run (count, total, mean, max seconds)
+            and the wall-clock time of the whole lab
+        """
+        lines = [f'{"stage":<10}{"count":>7}{"total s":>10}{"mean s":>10}{"max s":>10}']
+        for stage in PROVISION_STAGES:
+            times = [job.stages[stage] for job in jobs if stage in job.stages]
+            if times:
+                lines.append(f'{stage:<10}{len(times):>7}{sum(times):>10.1f}'
+                             f'{sum(times) / len(times):>10.1f}{max(times):>10.1f}')
+        ready = sum(1 for job in jobs if job.status == 'READY')
+        lines.append(f'{ready}/{len(jobs)} VMs ready in {self.elapsed:.1f} s'
+                     f' (serial stage time {sum(sum(job.stages.values()) for job in jobs):.1f} s)')
+        return '\n'.join(lines)
+    # ------------------------------------------------------------------------|
+
+    @staticmethod
+    def export_roster(jobs: list, roster_file: str) -> str:
+        """ Writes the ready VMs as a grade_roster.py roster (user, port, vm)
+        Returns:
+            str: the written file
+        """
+        roster_file = os.path.expanduser(roster_file)
+        os.makedirs(os.path.dirname(os.path.abspath(roster_file)), exist_ok=True)
+        with open(roster_file, 'w', encoding='utf-8', newline='') as roster_data:
+            writer = csv.writer(roster_data)
+            writer.writerow(('user', 'port', 'vm'))
+            for job in jobs:
+                if job.status == 'READY':
+                    writer.writerow((job.vm_name, job.tcp_port, job.vm_name))
+        return roster_file
+    # ------------------------------------------------------------------------|
+# ============================================================================||
+
+
+def load_lab(lab_file: str, default_ova: str) -> list:
+    """ Reads the lab CSV (header: vm[,ova][,port]) into the ProvisionJobs """
+    with open(os.path.expanduser(lab_file), 'r', encoding='utf-8', newline='') as lab_data:
+        return [ProvisionJob(row.get('ova') or default_ova, row['vm'].strip(),
+                             int(row.get('port') or 0))
+                for row in csv.DictReader(lab_data) if row.get('vm')]
+# ------------------------------------------------------------------------|
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog = 'python3 si_server_vm_provision.py',
+        description = """
+        NIST Security InVITE Lab Provisioning Python Script [in File si_server_vm_provision.py]
+
+        Imports the OVA once per student VM, adds the ssh port forwarding rule
+        with a unique port, and starts the VMs, running the VMs concurrently.""",
+    )
+    parser.add_argument("-ov", "--Ova",
+                        help = "The OVA to import for the VMs without their own one",
+                        default = ''
+                        )
+    parser.add_argument("-vm", "--VMs", nargs='+', default=[],
+                        help = "Names of the VMs to create (e.g. student1 student2)"
+                        )
+    parser.add_argument("-lb", "--Lab",
+                        help = "CSV of the lab VMs: vm[, ova][, port]",
+                        default = ''
+                        )
+    parser.add_argument("-bs", "--Base",
+                        help = "Create the VMs as linked clones of this base VM snapshot"
+                               " (imported from the OVA if not registered)",
+                        default = ''
+                        )
+    parser.add_argument("-u", "--User",
+                        help = "The host user running VBoxManage [Default $USER]",
+                        default = os.environ.get('USER', '')
+                        )
+    parser.add_argument("-ic", "--Imports", type=int,
+                        help = "Number of the concurrent imports [Default 4]",
+                        default = 4
+                        )
+    parser.add_argument("-w", "--Workers", type=int,
+                        help = "Number of the VMs provisioned at a time [Default 8]",
+                        default = 8
+                        )
+    parser.add_argument("-tm", "--Telemetry",
+                        help = "Also store the VM operations telemetry in this DB file of ~/si/db",
+                        default = ''
+                        )
+    parser.add_argument("-rs", "--Roster",
+                        help = "Write the ready VMs as a grade_roster.py roster CSV",
+                        default = ''
+                        )
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    lab_jobs = load_lab(args.Lab, args.Ova) if args.Lab else []
+    lab_jobs.extend(ProvisionJob(args.Ova, vm_name) for vm_name in args.VMs)
+    if not lab_jobs or not (args.Base or all(job.ova_file for job in lab_jobs)):
+        raise SystemExit('Give the VMs (-vm or -lb) and the OVA of each of them (-ov)')
+    if args.Telemetry:
+        telemetry.RECORDER.store_in(telemetry.VmOperationsDB('~/si/db', args.Telemetry))
+    provisioner = LabProvisioner(args.User, vm_manage.is_virtualized(), args.Imports, args.Workers,
+                                 args.Base)
+    if args.Base:
+        base_result = provisioner.prepare_base(args.Ova)
+        print(f'Base VM {args.Base}: {base_result}')
+        if stage_failed(base_result):
+            raise SystemExit(1)
+    provisioner.run(lab_jobs)
+    print(provisioner.report(lab_jobs))
+    print(telemetry.summarize([record.as_dict() for record in telemetry.RECORDER.records]))
+    if args.Roster:
+        print(f'Roster saved to {provisioner.export_roster(lab_jobs, args.Roster)}')
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+""" The module records how the VM lifecycle operations of si_server_vm_manage
+    went: when each one started and ended, how long it took, how many
+    VBoxManage commands it ran (those of the state polls it waited on
+    included), and its outcome. The records are kept in memory, optionally
+    stored in the Vm_Operations table, and exported as CSV or JSON.
+# =============================================================================
+    This software was developed at the National Institute of Standards
+    and Technology by employees of the Federal Government in the course
+    of their official duties.  Pursuant to title 17 Section 105 of the
+    United States Code this software is not subject to copyright
+    protection and is in the public domain.  NIST assumes no
+    responsibility whatsoever for its use by other parties, and makes
+    no guarantees, expressed or implied, about its quality,
+    reliability, or any other characteristic.
+# =============================================================================
+    We would appreciate acknowledgement if the software is used.
+"""
+__author__ = "Dmitry Cousin"
+__status__ = "Prototype"
+
+import os
+import argparse
+import collections
+import csv
+import functools
+import inspect
+import json
+import threading
+import time
+from datetime import datetime
+from enum import Enum
+
+import db_base as dbBase
+
+# The stamp of this process' run in the stored records
+RUN_STAMP = datetime.now().strftime('%Y-%m-%d-@-%Hh-%Mm-%Ss')
+# The number of the latest records kept in memory
+RECORDS_KEPT = 10000
+RECORD_FIELDS = ('run_stamp', 'operation', 'vm_name', 'user_name', 'started', 'finished',
+                 'duration', 'subprocesses', 'retries', 'outcome', 'message')
+# ============================================================================||
+
+
+class OperationOutcome(Enum):
+    """ How a VM operation ended """
+    SUCCESS = 'SUCCESS'
+    FAILED = 'FAILED'       # 'FAIL - ...' or VBoxManage 'error:' output
+    TIMEOUT = 'TIMEOUT'     # 'FAIL - ... took longer than ...'
+    ERROR = 'ERROR'         # the operation raised
+
+    @classmethod
+    def of_result(cls, result) -> 'OperationOutcome':
+        """ Classifies the string result of a vm_manage operation """
+        text = str(result)
+        if text.startswith('FAIL'):
+            return cls.TIMEOUT if 'took longer than' in text else cls.FAILED
+        if 'error:' in text:
+            return cls.FAILED
+        return cls.SUCCESS
+# ============================================================================||
+
+
+class OperationRecord(object):
+    """ Telemetry of one call of an instrumented operation """
+
+    def __init__(self, operation: str, vm_name: str = '', user_name: str = ''):
+        self.operation = operation
+        self.vm_name = vm_name
+        self.user_name = user_name
+        self.started = datetime.now()
+        self.finished = None
+        self.duration = 0.0
+        self.subprocesses = 0
+        self.retries = 0        # no operation reruns itself yet (a Vm_Operations column)
+        self.outcome = None
+        self.message = ''
+    # ------------------------------------------------------------------------|
+
+    def as_dict(self) -> dict:
+        return {'run_stamp': RUN_STAMP, 'operation': self.operation,
+                'vm_name': self.vm_name, 'user_name': self.user_name,
+                'started': self.started.isoformat(),
+                'finished': self.finished.isoformat() if self.finished else '',
+                'duration': self.duration, 'subprocesses': self.subprocesses,
+                'retries': self.retries,
+                'outcome': self.outcome.value if self.outcome else '',
+                'message': self.message}
+    # ------------------------------------------------------------------------|
+# ============================================================================||
+
+
+class VmOperationsDB(dbBase.BaseDB):
+    """ Vm_Operations table: one row per instrumented operation call
+    """
+
+    def __init__(self, db_path: str = '', db_name: str = ''):
+        super().__init__(db_path, db_name, must_create_db=False)
+        self.__execute__(""" CREATE TABLE IF NOT EXISTS
+                            "Vm_Operations" (
+                            "id"	INTEGER NOT NULL UNIQUE,
+                            "run_stamp"	TEXT NOT NULL,
+                            "operation"	TEXT NOT NULL,
+                            "vm_name"	TEXT,
+                            "user_name"	TEXT,
+                            "started"	TEXT NOT NULL,
+                            "finished"	TEXT,
+                            "duration"	REAL,
+                            "subprocesses"	INTEGER DEFAULT 0,
+                            "retries"	INTEGER DEFAULT 0,
+                            "outcome"	TEXT NOT NULL,
+                            "message"	TEXT,
+                            PRIMARY KEY("id" AUTOINCREMENT));"""
+                         )
+    # ------------------------------------------------------------------------|
+
+    def store_record(self, record: OperationRecord):
+        row = record.as_dict()
+        self.__insert__(f""" INSERT INTO Vm_Operations ( {", ".join(RECORD_FIELDS)} )
+                             VALUES ({", ".join("?" * len(RECORD_FIELDS))})""",
+                        tuple(row[field] for field in RECORD_FIELDS))
+    # ------------------------------------------------------------------------|
+
+    def operations(self, run_stamp: str = '') -> list:
+        """ The stored records (of one run or of all of them) as dicts """
+        query = f'SELECT {", ".join(RECORD_FIELDS)} FROM Vm_Operations'
+        values = ()
+        if run_stamp:
+            query += ' WHERE run_stamp = ?'
+            values = (run_stamp,)
+        return [dict(zip(RECORD_FIELDS, row))
+                for row in self.get_connection().execute(query + ' ORDER BY id', values)]
+    # ------------------------------------------------------------------------|
+# ============================================================================||
+
+
+class TelemetryRecorder(object):
+    """ Collects the OperationRecords of the process: the latest RECORDS_KEPT
+        in memory and, after store_in(), all of them in the Vm_Operations table
+        The operations running on a thread are kept on its stack, so the
+        subprocesses of a nested operation (e.g. stop_vm in reset_vm) count
+        for the outer ones too.
+    """
+
+    def __init__(self):
+        self.records = collections.deque(maxlen=RECORDS_KEPT)
+        self.operations_db = None
+        self.__active = threading.local()
+        self.__lock = threading.Lock()
+    # ------------------------------------------------------------------------|
+
+    def store_in(self, operations_db: VmOperationsDB):
+        self.operations_db = operations_db
+    # ------------------------------------------------------------------------|
+
+    def active(self) -> list:
+        if not hasattr(self.__active, 'stack'):
+            self.__active.stack = []
+        return self.__active.stack
+    # ------------------------------------------------------------------------|
+
+    def count_subprocesses(self, count: int = 1, records: list = None):
+        """ Adds the started commands to the operations running on this thread
+            (or to the given records, e.g. of the threads waiting on a poller)
+        """
+        for record in (self.active() if records is None else records):
+            record.subprocesses += count
+    # ------------------------------------------------------------------------|
+
+    def finish(self, record: OperationRecord):
+        record.finished = datetime.now()
+        with self.__lock:
+            self.records.append(record)
+            if self.operations_db is not None:
+                self.operations_db.store_record(record)
+    # ------------------------------------------------------------------------|
+# ============================================================================||
+
+
+RECORDER = TelemetryRecorder()
+
+
+def count_subprocesses(count: int = 1, records: list = None):
+    RECORDER.count_subprocesses(count, records)
+
+
+def counted(run_command):
+    """ Wraps subprocess.run (or alike) to count its calls in the telemetry """
+    @functools.wraps(run_command)
+    def wrapper(*args, **kwargs):
+        RECORDER.count_subprocesses()
+        return run_command(*args, **kwargs)
+    return wrapper
+# ------------------------------------------------------------------------|
+
+
+def instrumented(operation: str = ''):
+    """ Decorator of a VM operation: records an OperationRecord per call
+        The vm_name (or ova_file) and user arguments name the record. The
+        operation is called once, as it is; the decorator only observes it.
+    """
+    def decorator(vm_operation):
+        signature = inspect.signature(vm_operation)
+        name = operation if operation else vm_operation.__name__
+
+        @functools.wraps(vm_operation)
+        def wrapper(*args, **kwargs):
+            arguments = signature.bind_partial(*args, **kwargs).arguments
+            record = OperationRecord(name,
+                                     str(arguments.get('vm_name') or arguments.get('ova_file') or ''),
+                                     str(arguments.get('user', '')))
+            active = RECORDER.active()
+            active.append(record)
+            start = time.perf_counter()
+            try:
+                result = vm_operation(*args, **kwargs)
+                record.outcome = OperationOutcome.of_result(result)
+                if record.outcome != OperationOutcome.SUCCESS:
+                    record.message = str(result)[:500]
+                return result
+            except Exception as ex:
+                record.outcome = OperationOutcome.ERROR
+                record.message = f'{type(ex).__name__}: {ex}'
+                raise
+            finally:
+                record.duration = time.perf_counter() - start
+                active.pop()
+                RECORDER.finish(record)
+        return wrapper
+    return decorator
+# ============================================================================||
+
+
+def export_csv(records: list, csv_file: str) -> str:
+    """ Writes the records (dicts of RECORD_FIELDS) as CSV
+    Returns:
+        str: the written file
+    """
+    csv_file = os.path.expanduser(csv_file)
+    os.makedirs(os.path.dirname(os.path.abspath(csv_file)), exist_ok=True)
+    with open(csv_file, 'w', encoding='utf-8', newline='') as csv_data:
+        writer = csv.DictWriter(csv_data, fieldnames=RECORD_FIELDS)
+        writer.writeheader()
+        writer.writerows(records)
+    return csv_file
+
+
+def export_json(records: list, json_file: str) -> str:
+    """ Writes the records (dicts of RECORD_FIELDS) as JSON
+    Returns:
+        str: the written file
+    """
+    json_file = os.path.expanduser(json_file)
+    os.makedirs(os.path.dirname(os.path.abspath(json_file)), exist_ok=True)
+    with open(json_file, 'w', encoding='utf-8') as json_data:
+        json.dump(records, json_data, indent=1)
+    return json_file
+
+
+def summarize(records: list) -> str:
+    """ Per-operation count, total/mean/max seconds, subprocesses, retries and
+        the non-successful outcomes, the operation taking most time first
+    """
+    operations = {}
+    for record in records:
+        operations.setdefault(record['operation'], []).append(record)
+    lines = [f'{"operation":<26}{"count":>7}{"total s":>10}{"mean s":>9}{"max s":>9}'
+             f'{"procs":>7}{"retries":>8}  outcomes']
+    for (name, calls) in sorted(operations.items(),
+                                key=lambda item: -sum(call['duration'] for call in item[1])):
+        durations = [call['duration'] for call in calls]
+        outcomes = collections.Counter(call['outcome'] for call in calls)
+        lines.append(f'{name:<26}{len(calls):>7}{sum(durations):>10.1f}'
+                     f'{sum(durations) / len(calls):>9.2f}{max(durations):>9.2f}'
+                     f'{sum(call["subprocesses"] for call in calls):>7}'
+                     f'{sum(call["retries"] for call in calls):>8}  '
+                     + ', '.join(f'{outcome}={count}' for (outcome, count) in outcomes.items()))
+    return '\n'.join(lines)
+# ============================================================================||
+
+
+def parse_args(default_wd: str, default_db: str) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog = 'python3 si_server_vm_telemetry.py',
+        description = """
+        NIST Security InVITE VM Telemetry Python Script [in File si_server_vm_telemetry.py]
+
+        Summarizes and exports the recorded VM lifecycle operations.""",
+    )
+    parser.add_argument("-wd", "--WorkDir",
+                        help = "Directory of the telemetry DB File [Default ~/si/db]",
+                        default = default_wd
+                        )
+    parser.add_argument("-db", "--Database",
+                        help = "Telemetry database file name [Default SI_VM_Telemetry.db]",
+                        default = default_db
+                        )
+    parser.add_argument("-rn", "--Run",
+                        help = "Only the records of this run stamp [Default all the runs]",
+                        default = ''
+                        )
+    parser.add_argument("-csv", "--Csv",
+                        help = "Export the records to this CSV file",
+                        default = ''
+                        )
+    parser.add_argument("-js", "--Json",
+                        help = "Export the records to this JSON file",
+                        default = ''
+                        )
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args('~/si/db', 'SI_VM_Telemetry.db')
+    with VmOperationsDB(args.WorkDir, args.Database) as telemetry_db:
+        stored_records = telemetry_db.operations(args.Run)
+    print(summarize(stored_records))
+    if args.Csv:
+        print(f'Records saved to {export_csv(stored_records, args.Csv)}')
+    if args.Json:
+        print(f'Records saved to {export_json(stored_records, args.Json)}')
@@ -31,6 +31,7 @@ used) but are unused, are prefixed by '_'; this suppresses some
 warnings from the pylint code scanner.
 """
 import datetime
+import functools
 import json
 import logging
 import os
@@ -95,62 +96,91 @@ def main():
           ...]
     """
     # Create a tested Server for SI
-    TestContext.init_context( utils.VmTestArguments() )
+    context = TestContext( utils.VmTestArguments() )
 
-    run_report_tests(TestContext.get_test_type())
+    run_report_tests(context)
+    context.close()
 
 
     # Local to this file DEMO testing
-    # if 'hw3' in TestContext.INPUT_ARGS.app_to_run:
-    #     run_report_tests(Homework3)
+    # if 'hw3' in context.INPUT_ARGS.app_to_run:
+    #     run_report_tests(context, Homework3)
 
-    # if 'hw4' in TestContext.INPUT_ARGS.app_to_run:
-    #     run_report_tests(Homework4)
+    # if 'hw4' in context.INPUT_ARGS.app_to_run:
+    #     run_report_tests(context, Homework4)
 #------------------------------------------------------------------------------------------------------------------
 
-def run_report_tests(test_suite_to_use: TestHomeworkBase):
+def create_server_session(context: TestContext) -> test_utils.ServerSI:
+    """ Creates ServerSI for the VM of the context (one per parallel session)
+    """
+    return test_utils.ServerSI(
+                               app_to_test=context.APP_TO_TEST,
+                               host_address=context.USER_OF_SERVER,
+                               tcp_port=str(context.TCP_PORT), # blows up if not a STRING
+                               key_file=context.KEY_FILE_PATH,
+                               logger=context.LOGGER)
+#------------------------------------------------------------------------------------------------------------------
 
-    TestContext.SERVER_TO_TEST = test_utils.ServerSI(
-                               app_to_test=TestContext.APP_TO_TEST,
-                               host_address=TestContext.USER_OF_SERVER,
-                               tcp_port=str(TestContext.TCP_PORT), # blows up if not a STRING
-                               key_file=TestContext.KEY_FILE_PATH,
-                               logger=TestContext.LOGGER)
-    
-    TestContext.SERVER_TO_TEST.verify_recreate_test_tree()
+def run_report_tests(context: TestContext,
+                     test_suite_to_use: TestHomeworkBase = None,
+                     listener=None) -> test_utils.TestResultsSI:
+    """ Runs the suite (defaults to the one of the context's homework) against
+        the VM of the context and reports the results
+        The ServerSI of the context is reused when it is already there (a warm
+        context of the grading daemon), listener receives every test record.
+    """
+    test_suite_to_use = test_suite_to_use if test_suite_to_use else context.get_test_type()
+    if not context.SERVER_TO_TEST:
+        context.SERVER_TO_TEST = create_server_session(context)
+
+    context.SERVER_TO_TEST.verify_recreate_test_tree()
     
-    TestContext.LOGGER.debug("Beginning loading tests.")
+    context.LOGGER.debug("Beginning loading tests.")
 
-    suite = unittest.TestLoader().loadTestsFromTestCase(test_suite_to_use)
+    suite = test_suites.load_context_tests(test_suite_to_use, context)
     # suite = unittest.TestLoader().loadTestsFromTestCase(TestHomework)
-    TestContext.LOGGER.debug("Creating tests runner.")
+    context.LOGGER.debug("Creating tests runner.")
     
     
     # Normal TestRunner
     # runner = unittest.TextTestRunner(resultclass=test_utils.TestResultsSI) # resultclass=HomeworkTestResult
     # Verbose TestRunner
-    runner = unittest.TextTestRunner(verbosity=2, resultclass=test_utils.TestResultsSI) # resultclass=HomeworkTestResult
+    runner = unittest.TextTestRunner(verbosity=2, # resultclass=HomeworkTestResult
+                                     resultclass=functools.partial(test_utils.TestResultsSI,
+                                                                   listener=listener))
 
     print(f'#{"="*80}')
-    TestContext.LOGGER.critical(f'Beginning running of the test suite in context Homework #{TestContext.HOMEWORK}.')
+    context.LOGGER.critical(f'Beginning running of the test suite in context Homework #{context.HOMEWORK}.')
 
-    print_if(f"VM's Home-Dir is : '{TestContext.SERVER_TO_TEST.get_home_on_vm()}'")
-    # Here the whole Testing Work Happens!!!
-    res = runner.run(suite)
+    # One master SSH connection carries every ssh/scp of the run
+    with context.SERVER_TO_TEST:
+        print_if(f"VM's Home-Dir is : '{context.SERVER_TO_TEST.get_home_on_vm()}'")
+        # Here the whole Testing Work Happens!!!
+        if context.PARALLEL_SESSIONS > 1:
+            parallel_runner = test_utils.ParallelRunnerSI(lambda: create_server_session(context),
+                                                          context.PARALLEL_SESSIONS,
+                                                          context.LOGGER,
+                                                          listener)
+            res = parallel_runner.run(suite)
+            print(f'\nRan {res.testsRun} tests on {context.PARALLEL_SESSIONS}'
+                  f' sessions in {res.elapsed:.3f}s')
+        else:
+            res = runner.run(suite)
 
-    TestContext.LOGGER.debug('After running test suite.')
+    context.LOGGER.debug('After running test suite.')
 
-    TestContext.SERVER_TO_TEST.report_test_results(test_utils.get_test_status())
+    context.SERVER_TO_TEST.report_test_results(res)
 
 
     # TODO: Implement JSON and SQLite output of the test results
     if res.test_results:
         #print(json.dumps(res.test_results, indent=1))
-        json_status = utils.saved_json_test_report_ok(TestContext.JSON_FILE, res)
+        json_status = utils.saved_json_test_report_ok(context.JSON_FILE, res)
         if json_status:
-            TestContext.LOGGER.debug(f'Failed to save JSON-results: {json_status}')
+            context.LOGGER.debug(f'Failed to save JSON-results: {json_status}')
     else:
         print('No Results')
+    return res
 #------------------------------------------------------------------------------------------------------------------
     
 
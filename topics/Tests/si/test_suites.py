@@ -19,6 +19,7 @@ warnings from the pylint code scanner.
 """
 __author__ = "Dmitry Cousin"
 __status__ = "Prototype"
+import functools
 import os
 import subprocess
 import sys
@@ -34,36 +35,40 @@ def print_if(line:str):
 #---------------------------------------------------------------------------------------------
 
 class VMHomeResolver:
-    
-    VM_HOME = None
+    """ Resolves ~/ of the paths to the home directory of the user on the VM
+        The home is cached per resolver (one per TestContext), so the runs for
+        the different VMs/users never see each other's home
+    """
 
     def __init__(self, host_address: str, tcp_port: str, key_file_path: str,):
         self.host_address = host_address
         self.tcp_port = tcp_port
         self.key_file_path = key_file_path
+        self.vm_home = None
 
     def get_home_on_vm(self, ):
         """ Retrieve home directory from the VM 
         """
-        if not VMHomeResolver.VM_HOME:
+        if not self.vm_home:
             print_if(test_utils.get_location())
             ssh_pwd = [ 'ssh', self.host_address,
                         '-p', self.tcp_port,
                         '-i', self.key_file_path,
                         '-o', 'StrictHostKeyChecking=no', '-q',
+                        *test_utils.get_ssh_multiplex_options(),
                         'pwd']
             try:
                 stdout, stderr  = subprocess.Popen(ssh_pwd,
                                         stdout=subprocess.PIPE,
                                         stderr=subprocess.STDOUT
                                         ).communicate()
-                VMHomeResolver.VM_HOME = stdout.decode('utf-8').strip()
+                self.vm_home = stdout.decode('utf-8').strip()
             except subprocess.CalledProcessError:
                 print_if('subprocess.Popen of ssh returned error!')
             finally:
-                return VMHomeResolver.VM_HOME
+                return self.vm_home
         else:
-            return VMHomeResolver.VM_HOME
+            return self.vm_home
     # -------------------------------------------------------------------------
     def resolve_hw_vm_home(self, path:str) :
         return path.replace('~/', f"{self.get_home_on_vm()}/")
@@ -71,72 +76,110 @@ class VMHomeResolver:
 
 
 class TestContext:
-    INPUT_ARGS = None
-    TESTED_SERVER = None
-    LOGGER = None
-    LOG_NAME = None
-    HOMEWORK = 3
-    APP_TO_TEST = 'python3 hw3.py'
-    KEY_FILE_PATH = ''
-    SSH_TARGET = None
-    SERVER_TO_TEST = None
-    SKIP_SLOW_TESTS = False
-    CONTEXT = 1
-    TCP_PORT = None
-    USER_OF_SERVER = ''
-    JSON_FILE = ''
-    APP_DEFAULT = utils.AppToExecute.NOOP
-    
-
-    @classmethod
-    def init_context(cls, setup_args: utils.VmTestArguments):
-        cls.INPUT_ARGS = setup_args.app_args
-        cls.HOMEWORK = setup_args.homework_number
-        cls.LOG_NAME = setup_args.logger_file_name
-        cls.LOGGER = setup_args.logger
-        cls.SSH_TARGET = setup_args.user_at_address
-        cls.KEY_FILE_PATH = setup_args.key_file_path
-        cls.SKIP_SLOW_TESTS = not setup_args.deep_test_level <= 0
-        cls.TCP_PORT = setup_args.tcp_port
-        cls.APP_TO_TEST = setup_args.app_to_run
-        cls.USER_OF_SERVER = setup_args.user_at_address
-        cls.JSON_FILE = setup_args.json_file_name
-        cls.APP_DEFAULT = setup_args.app_defaults
-        cls.ADDRESS =  setup_args.ssh_address
-
-        cls.HomeResolver = VMHomeResolver(cls.USER_OF_SERVER, cls.TCP_PORT, cls.KEY_FILE_PATH)
+    """ Settings and shared objects of one grading run (one student VM)
+        The instance is handed to the test cases by load_context_tests, so
+        any number of runs can coexist in one process
+    """
+
+    def __init__(self, setup_args: utils.VmTestArguments = None):
+        self.INPUT_ARGS = None
+        self.LOGGER = None
+        self.LOG_NAME = None
+        self.HOMEWORK = 3
+        self.APP_TO_TEST = 'python3 hw3.py'
+        self.KEY_FILE_PATH = ''
+        self.SSH_TARGET = None
+        self.SERVER_TO_TEST = None
+        self.SKIP_SLOW_TESTS = False
+        self.TCP_PORT = None
+        self.USER_OF_SERVER = ''
+        self.JSON_FILE = ''
+        self.APP_DEFAULT = utils.AppToExecute.NOOP
+        self.PARALLEL_SESSIONS = 1
+        self.ADDRESS = ''
+        self.HomeResolver = None
+        if setup_args is not None:
+            self.init_context(setup_args)
+
+    def init_context(self, setup_args: utils.VmTestArguments):
+        self.INPUT_ARGS = setup_args.app_args
+        self.HOMEWORK = setup_args.homework_number
+        self.LOG_NAME = setup_args.logger_file_name
+        self.LOGGER = setup_args.logger
+        self.SSH_TARGET = setup_args.user_at_address
+        self.KEY_FILE_PATH = setup_args.key_file_path
+        self.SKIP_SLOW_TESTS = not setup_args.deep_test_level <= 0
+        self.TCP_PORT = setup_args.tcp_port
+        self.APP_TO_TEST = setup_args.app_to_run
+        self.USER_OF_SERVER = setup_args.user_at_address
+        self.JSON_FILE = setup_args.json_file_name
+        self.APP_DEFAULT = setup_args.app_defaults
+        self.ADDRESS =  setup_args.ssh_address
+        self.PARALLEL_SESSIONS = setup_args.parallel_sessions
+
+        self.HomeResolver = VMHomeResolver(self.USER_OF_SERVER, self.TCP_PORT, self.KEY_FILE_PATH)
         # TODO: For now ignore Database-Based Scoring, maybe will re-add it later
         # ------------------------------------------------------------------------    
         # score_init.prepare_scoring_information(input_args=THIS_MODULE.INPUT_ARGS,
         #                                         test_file=os.path.join(os.getcwd(), __file__),
         #                                         test_type=ScoreSuffix.EVENT)
-        if ((not cls.KEY_FILE_PATH)
-                or (not os.path.isfile(cls.KEY_FILE_PATH))):
-            cls.LOGGER.critical(f'Error: SSH key file\n\t[{cls.KEY_FILE_PATH}]\n'
+        if ((not self.KEY_FILE_PATH)
+                or (not os.path.isfile(self.KEY_FILE_PATH))):
+            self.LOGGER.critical(f'Error: SSH key file\n\t[{self.KEY_FILE_PATH}]\n'
                                         f'does not exist')
             sys.exit()
         else:
-            cls.LOGGER.debug(f'SSH key resolved to: [{cls.KEY_FILE_PATH}]')
-        
-    @classmethod
-    def get_test_type(cls)->type:
-        if cls.HOMEWORK == 1:
+            self.LOGGER.debug(f'SSH key resolved to: [{self.KEY_FILE_PATH}]')
+
+    def get_test_type(self)->type:
+        if self.HOMEWORK == 1:
             return TestHomeworkOne
-        elif cls.HOMEWORK == 2:
+        elif self.HOMEWORK == 2:
             return TestHomeworkTwo
-        elif cls.HOMEWORK == 3:
+        elif self.HOMEWORK == 3:
             return TestHomeworkThree
-        elif cls.HOMEWORK == 4:
+        elif self.HOMEWORK == 4:
             return TestHomeworkFour
-        # elif cls.HOMEWORK == 5:
+        # elif self.HOMEWORK == 5:
         #     return TestHomeworkFive
-        # elif cls.HOMEWORK == 6:
+        # elif self.HOMEWORK == 6:
         #     return TestHomeworkSix
-        
+
+    def close(self):
+        """ Releases the log files of the run (a long-lived process grades
+            many runs and would otherwise keep all their handlers open)
+        """
+        if self.LOGGER:
+            for handler in list(self.LOGGER.handlers):
+                self.LOGGER.removeHandler(handler)
+                handler.close()
     #-----------------------------------------------------------------------------------------
 #=============================================================================================
 
 
+def load_context_tests(test_case_class: type, context: TestContext) -> unittest.TestSuite:
+    """ Loads the tests of the suite class and hands them the context of the run
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_case_class)
+    for test in test_utils.iterate_tests(suite):
+        test.context = context
+    return suite
+
+def requires_homework(homework_number: int, reason: str):
+    """ Skips the test when the homework of the run's context is below homework_number
+        (decided at run time, the context is not known when the suites are imported)
+    """
+    def decorator(test_method):
+        @functools.wraps(test_method)
+        def wrapper(self, *f_args, **f_kwargs):
+            if self.context.HOMEWORK < homework_number:
+                self.skipTest(reason)
+            return test_method(self, *f_args, **f_kwargs)
+        return wrapper
+    return decorator
+#---------------------------------------------------------------------------------------------
+
+
 
 class HWSettings:
 
@@ -222,6 +265,10 @@ class HWSettings:
 class TestHomeworkBase(test_utils.TestCaseSI):
     """Test Suite for a program satisfying the homeworks.md specification."""
     #pylint: disable=too-many-public-methods
+    context = None  # TestContext of the run, handed out by load_context_tests
+    # The @test_utils.parallel_safe tests only start the app and read its stdout
+    # (the app log on the VM is written, but no test reads it back)
+
     @classmethod
     def setUpClass(cls):
         pass
@@ -232,11 +279,10 @@ class TestHomeworkBase(test_utils.TestCaseSI):
         # THIS_MODULE.SERVER_TO_TEST.kill_remote_file('conf')
         pass
 
-    @classmethod
-    def dump_info_out(cls, file_name, text):
-        """ The class method to write down a file
+    def dump_info_out(self, file_name, text):
+        """ The method to write down a file
         """
-        TestContext.LOGGER.debug(f'Writing information out to file: {file_name}')
+        self.context.LOGGER.debug(f'Writing information out to file: {file_name}')
         with open(file_name, "w+") as f:
             f.write(text)
             
@@ -254,9 +300,16 @@ class TestHomeworkBase(test_utils.TestCaseSI):
         print(response)
         print(f"\nEND\n{'='*80}\n:")
 
+    @property
+    def server(self) -> test_utils.ServerSI:
+        """ The ServerSI session of this test: the one the parallel runner
+            assigned or the shared one of the run's context
+        """
+        return self.server_session if self.server_session else self.context.SERVER_TO_TEST
+
     def get_vm_config(self, conf_list:list):
         print_if(conf_list)
-        resolved = [TestContext.HomeResolver.resolve_hw_vm_home(chunk) if '_FILE: ' in chunk else chunk
+        resolved = [self.context.HomeResolver.resolve_hw_vm_home(chunk) if '_FILE: ' in chunk else chunk
                     for chunk in conf_list]
         print_if(conf_list)
         return resolved
@@ -271,26 +324,26 @@ class TestHomeworkBase(test_utils.TestCaseSI):
         """ Create clean datastore, config, and start the Homework.
         """
         # pylint: disable=invalid-name
-        TestContext.LOGGER.debug(f'{"!"*68}\nAbout to run {self.id}\n{"!"*68}')
+        self.context.LOGGER.debug(f'{"!"*68}\nAbout to run {self.id}\n{"!"*68}')
         self.maxDiff = None  #Allow long messages from assert() methods.
         # THIS_MODULE.SERVER_TO_TEST.push_remote_file('conf', DEFAULT_CONFIG)
-        self.hw_number = TestContext.HOMEWORK
+        self.hw_number = self.context.HOMEWORK
 
         try:
             pass
-            # TestContext.SERVER_TO_TEST.reset_server('conf')
+            # self.server.reset_server('conf')
         except Exception as ex:
             self.fail(ex)
     #--------------------------------------------------------------------------------------------------------------
 
     def get_context_menu(self):
-        if TestContext.HOMEWORK==1:
+        if self.context.HOMEWORK==1:
             CURRENT_MENU = HWSettings.MAIN_MENU_HW1
-        elif TestContext.HOMEWORK==2:
+        elif self.context.HOMEWORK==2:
             CURRENT_MENU = HWSettings.MAIN_MENU_HW2
-        elif TestContext.HOMEWORK==3:
+        elif self.context.HOMEWORK==3:
             CURRENT_MENU = HWSettings.MAIN_MENU_HW3
-        elif TestContext.HOMEWORK==4:
+        elif self.context.HOMEWORK==4:
             CURRENT_MENU = HWSettings.MAIN_MENU_HW4
         return CURRENT_MENU
     #--------------------------------------------------------------------------------------------------------------
@@ -303,90 +356,93 @@ class TestHomeworkOne(TestHomeworkBase):
         pass
     # @unittest.parameterized.expand([ tuple(['']),tuple(['open sesame']),tuple(['git']),
     #     tuple(['exit only']), tuple(['logins']), tuple(['setting and other stuff'])]) 
-    @unittest.skipIf(TestContext.HOMEWORK < 1, 'No Menus for Homeworks Less Than 3')
+    @requires_homework(1, 'No Menus for Homeworks Less Than 3')
+    @test_utils.parallel_safe
     def test_func_main_menu_wrong(self):
         """ Verifies that the message [Input 'Value of the Input' is unknown!] is shown for the incorrect inputs
         """
         CURRENT_MENU = self.get_context_menu()
         print_if('\n!!!\tEntering test_func_main_menu')
-        TestContext.LOGGER.debug('test_func_main_menu')
+        self.context.LOGGER.debug('test_func_main_menu')
         wrong_commands = ['', 'open sesame', 'git', 'exit only', 'logins', 'setting and other stuff']
         proc = None
         try:
-            proc, response = TestContext.SERVER_TO_TEST.start_server_ext(expected_response_endswith=CURRENT_MENU)
+            proc, response = self.server.start_server_ext(expected_response_endswith=CURRENT_MENU)
             self.assertEqual(CURRENT_MENU, response)
             for surprise_string in wrong_commands:
-                response = TestContext.SERVER_TO_TEST.type_to_server_ext(proc, surprise_string , response_end=CURRENT_MENU)
+                response = self.server.type_to_server_ext(proc, surprise_string , response_end=CURRENT_MENU)
                 self.assertEqual(f"Input '{surprise_string}' is unknown!\n{CURRENT_MENU}", response)
         except AssertionError as ae:
-            TestContext.LOGGER.exception(ae, exc_info=True)
+            self.context.LOGGER.exception(ae, exc_info=True)
             self.fail( self.get_error_details(ae))
         except Exception as ex:
-            TestContext.LOGGER.exception(ex, exc_info=True)
+            self.context.LOGGER.exception(ex, exc_info=True)
             self.fail(self.get_error_details(ex))
         finally:
             print_if('Finally!')
             if proc:
-                TestContext.SERVER_TO_TEST.stop_server(proc)
+                self.server.stop_server(proc)
     #--------------------------------------------------------------------------------------------------------------
 
-    @unittest.skipIf(TestContext.HOMEWORK<1, 'No Menus for Homeworks Less Than 3') 
+    @requires_homework(1, 'No Menus for Homeworks Less Than 3')
+    @test_utils.parallel_safe
     def test_func_main_menu(self):
         """ Makes sure that the main menu for the app shows up 
         """
         CURRENT_MENU = self.get_context_menu()
         print_if('\n!!!\tEntering test_func_main_menu')
-        TestContext.LOGGER.debug('test_func_exit_command')
+        self.context.LOGGER.debug('test_func_exit_command')
         proc = None
         try:
-            proc, response = TestContext.SERVER_TO_TEST.start_server_ext(expected_response_endswith=CURRENT_MENU)
+            proc, response = self.server.start_server_ext(expected_response_endswith=CURRENT_MENU)
             print_if(f'Pre-Menu3 test_func_quit_command\n\t {response}')
             self.assertEqual(CURRENT_MENU, response)
-            response = TestContext.SERVER_TO_TEST.type_to_server_ext(proc, '0' , response_end=HWSettings.MSG_EXIT_BYE)
+            response = self.server.type_to_server_ext(proc, '0' , response_end=HWSettings.MSG_EXIT_BYE)
         except AssertionError as ae:
-            TestContext.LOGGER.exception(ae, exc_info=True)
+            self.context.LOGGER.exception(ae, exc_info=True)
             self.fail( self.get_error_details(ae))
         except Exception as ex:
-            TestContext.LOGGER.exception(ex, exc_info=True)
+            self.context.LOGGER.exception(ex, exc_info=True)
             self.fail(self.get_error_details(ex))
         finally:
             print_if('Finally!')
             if proc:
-                TestContext.SERVER_TO_TEST.stop_server(proc)
+                self.server.stop_server(proc)
     #--------------------------------------------------------------------------------------------------------------
 
-    @unittest.skipIf(TestContext.HOMEWORK<1, 'No Menus for Homeworks Less Than 3')
+    @requires_homework(1, 'No Menus for Homeworks Less Than 3')
+    @test_utils.parallel_safe
     def test_func_exit_options_array(self):
         """Homework must exit if either option ['0', 'e', 'E', 'Exit', 'ExIt', 'EXIT', 'exit']
           is entered for Main Menu right after start
         """
         CURRENT_MENU = self.get_context_menu()
         print_if('\n!!!\tEntering test_func_exit_options')
-        TestContext.LOGGER.debug('test_func_exit_command')
+        self.context.LOGGER.debug('test_func_exit_command')
         proc = None
         for inputX in ['0', 'e', 'E', 'Exit', 'ExIt', 'EXIT', 'exit']:
             try:
-                proc, response = TestContext.SERVER_TO_TEST.start_server_ext(expected_response_endswith=CURRENT_MENU)
+                proc, response = self.server.start_server_ext(expected_response_endswith=CURRENT_MENU)
                 print_if(f'Pre-Menu3 test_func_quit_command\n\t {response}')
                 self.assertEqual(CURRENT_MENU, response)
-                response = TestContext.SERVER_TO_TEST.type_to_server_ext(proc, inputX , response_end=HWSettings.MSG_EXIT_BYE)
+                response = self.server.type_to_server_ext(proc, inputX , response_end=HWSettings.MSG_EXIT_BYE)
                 self.assertEqual('Bye!\n', response)
-                TestContext.SERVER_TO_TEST.stop_server(proc)
+                self.server.stop_server(proc)
                 print_if(f'Post Bye! test_func_quit_command\n{response}\tAfter TYPING: "{inputX}"\n\n')
             except AssertionError as ae:
                 details = self.get_error_details(ae)
                 print_if(f'{details}\n{ae}')
-                TestContext.LOGGER.exception(f'{details}\n{ae}', exc_info=True)
+                self.context.LOGGER.exception(f'{details}\n{ae}', exc_info=True)
                 self.fail(details)
             except Exception as ex:
                 details = self.get_error_details(ex)
                 print_if(f'{details}\n{ex}')
-                TestContext.LOGGER.exception(f'{details}\n{ex}', exc_info=True)
+                self.context.LOGGER.exception(f'{details}\n{ex}', exc_info=True)
                 self.fail(details)
             finally:
                 print_if('Finally!')
                 if proc:
-                    TestContext.SERVER_TO_TEST.stop_server(proc)
+                    self.server.stop_server(proc)
     #--------------------------------------------------------------------------------------------------------------
 
     # TODO: Add Good User-Input => No Logs verification test
@@ -404,26 +460,27 @@ class TestHomeworkTwo(TestHomeworkOne):
     #--------------------------------------------------------------------------------------------------------------
 
  
-    @unittest.skipIf(TestContext.HOMEWORK<2, 'No Config reading for Homeworks Less Than 2') 
+    @requires_homework(2, 'No Config reading for Homeworks Less Than 2')
+    @test_utils.parallel_safe
     def test_func_bad_config(self):
         """ Makes sure that invalid YAML settings file stops the application
         """
         print_if('\n!!!\tEntering test_func_main_menu')
-        TestContext.LOGGER.debug('test_func_exit_command')
+        self.context.LOGGER.debug('test_func_exit_command')
         proc = None
         try:
-            proc, response = TestContext.SERVER_TO_TEST.start_server_ext(conf = ' -config ~/si/set/settings-broken.yaml', expected_response_endswith=HWSettings.MSG_EXIT_BAD_CONFIG)
+            proc, response = self.server.start_server_ext(conf = ' -config ~/si/set/settings-broken.yaml', expected_response_endswith=HWSettings.MSG_EXIT_BAD_CONFIG)
             self.assertEqual(HWSettings.MSG_EXIT_BAD_CONFIG, response)
         except AssertionError as ae:
-            TestContext.LOGGER.exception(ae, exc_info=True)
+            self.context.LOGGER.exception(ae, exc_info=True)
             self.fail( self.get_error_details(ae))
         except Exception as ex:
-            TestContext.LOGGER.exception(ex, exc_info=True)
+            self.context.LOGGER.exception(ex, exc_info=True)
             self.fail(self.get_error_details(ex))
         finally:
             print_if('Finally!')
             if proc:
-                TestContext.SERVER_TO_TEST.stop_server(proc)
+                self.server.stop_server(proc)
     #--------------------------------------------------------------------------------------------------------------
     # TODO: Add Broken User-Name => Log-Content test
     # TODO: Add Broken Table-Name => Log-Content test
@@ -435,25 +492,26 @@ class TestHomeworkThree(TestHomeworkTwo):
 
     #--------------------------------------------------------------------------------------------------------------
 
-    @unittest.skipIf(TestContext.HOMEWORK<3, 'No Menus for Homeworks Less Than 3')
+    @requires_homework(3, 'No Menus for Homeworks Less Than 3')
+    @test_utils.parallel_safe
     def test_func_settings_data_once(self):
         """Homework must match reproduced and ~/ resolved to /home/<user-name> sorted default settings multiline text
         """
         CURRENT_MENU = self.get_context_menu()
         print_if('\n!!!\tEntering test_func_settings_data')
-        TestContext.LOGGER.debug('test_func_exit_command')
+        self.context.LOGGER.debug('test_func_exit_command')
         # set_str = HW_Settings.DEFAULT_CONFIG_STRING[:]
         # set_str.append(CURRENT_MENU)
         # print_if(f'\n\tSet: {set_str}, \n\tType: {type(set_str)}')
         # MATCH_SETTINGS =  '\n'.join(set_str)
-        list_conf = list( HWSettings.get_config_string(TestContext.HOMEWORK) )
+        list_conf = list( HWSettings.get_config_string(self.context.HOMEWORK) )
         vm_config = self.get_vm_config(list_conf)
         MATCH_SETTINGS =  HWSettings.shape_output(vm_config, CURRENT_MENU) # 
         proc = None
         try:
-            proc, response = TestContext.SERVER_TO_TEST.start_server_ext(expected_response_endswith=CURRENT_MENU)
+            proc, response = self.server.start_server_ext(expected_response_endswith=CURRENT_MENU)
             self.assertEqual(CURRENT_MENU, response)
-            response = TestContext.SERVER_TO_TEST.type_to_server_ext(proc, 'Settings' , response_end=CURRENT_MENU)
+            response = self.server.type_to_server_ext(proc, 'Settings' , response_end=CURRENT_MENU)
 
             print_if(f'\nResponse:\n{response}')
             print_if(f'\nDefault:\n{MATCH_SETTINGS}')
@@ -469,37 +527,38 @@ class TestHomeworkThree(TestHomeworkTwo):
         except AssertionError as ae:
             details = self.get_error_details(ae)
             print_if(f'{details}\n{ae}')
-            TestContext.LOGGER.error(f'{details}\n{ae}', exc_info=True)
+            self.context.LOGGER.error(f'{details}\n{ae}', exc_info=True)
             self.fail(details)
         except Exception as ex:
             details = self.get_error_details(ex)
             print_if(f'{details}\n{ex}')
-            TestContext.LOGGER.exception(f'{details}\n{ex}', exc_info=True)
+            self.context.LOGGER.exception(f'{details}\n{ex}', exc_info=True)
             self.fail(details)
         finally:
             print_if('Finally!')
             if proc:
-                TestContext.SERVER_TO_TEST.stop_server(proc)
+                self.server.stop_server(proc)
     #--------------------------------------------------------------------------------------------------------------
 
-    @unittest.skipIf(TestContext.HOMEWORK<3 , 'No Menus for Homeworks Less Than 3')
+    @requires_homework(3, 'No Menus for Homeworks Less Than 3')
+    @test_utils.parallel_safe
     def test_func_settings_data_options_array(self):
         """ Array of possibilities for choosing settings ['1', 's', 'S', 'Settings', 'SeTtinGS', 'SETTINGS', 'settings']
             Homework must match reproduced and ~/ resolved to /home/<user-name> sorted default settings multiline text
         """
         print_if('\n!!!\tEntering test_func_settings_data')
-        TestContext.LOGGER.debug('test_func_exit_command')
+        self.context.LOGGER.debug('test_func_exit_command')
 
         CURRENT_MENU = self.get_context_menu()
-        str_conf = list( HWSettings.get_config_string(TestContext.HOMEWORK) )
+        str_conf = list( HWSettings.get_config_string(self.context.HOMEWORK) )
         vm_config = self.get_vm_config(str_conf)
         MATCH_SETTINGS =  HWSettings.shape_output(vm_config, CURRENT_MENU) # 
         proc = None
         for inputX in ['1', 's', 'S', 'Settings', 'SeTtinGS', 'SETTINGS', 'settings']:
             try:
-                proc, response = TestContext.SERVER_TO_TEST.start_server_ext(expected_response_endswith=CURRENT_MENU)
+                proc, response = self.server.start_server_ext(expected_response_endswith=CURRENT_MENU)
                 self.assertEqual(CURRENT_MENU, response)
-                response = TestContext.SERVER_TO_TEST.type_to_server_ext(proc, inputX , response_end=CURRENT_MENU)
+                response = self.server.type_to_server_ext(proc, inputX , response_end=CURRENT_MENU)
 
                 print_if(f'\nResponse:\n{response}')
                 print_if(f'\nDefault:\n{MATCH_SETTINGS}')
@@ -510,17 +569,17 @@ class TestHomeworkThree(TestHomeworkTwo):
             except AssertionError as ae:
                 details = self.get_error_details(ae)
                 print_if(f'{details}\n{ae}')
-                TestContext.LOGGER.error(f'{details}\n{ae}', exc_info=True)
+                self.context.LOGGER.error(f'{details}\n{ae}', exc_info=True)
                 self.fail(details)
             except Exception as ex:
                 details = self.get_error_details(ex)
                 print_if(f'{details}\n{ex}')
-                TestContext.LOGGER.exception(f'{details}\n{ex}', exc_info=True)
+                self.context.LOGGER.exception(f'{details}\n{ex}', exc_info=True)
                 self.fail(details)
             finally:
                 print_if('Finally!')
                 if proc:
-                    TestContext.SERVER_TO_TEST.stop_server(proc)
+                    self.server.stop_server(proc)
     #--------------------------------------------------------------------------------------------------------------
 #==================================================================================================================
 
@@ -528,7 +587,7 @@ class TestHomeworkThree(TestHomeworkTwo):
 class TestHomeworkFour(TestHomeworkThree):
     #--------------------------------------------------------------------------------------------------------------
 
-    # @unittest.skipIf(TestContext.HOMEWORK<4 , 'No DB Homeworks Less Than 4')
+    # @requires_homework(4, 'No DB Homeworks Less Than 4')
     def test_func_login_clean_profile_array(self):
         """ Array of possibilities for choosing Login Option ['2', 'l', 'L', 'Login', 'LoGiN', 'LOGIN', 'login']
             Homework must match clean profile of the user dummy11
@@ -536,19 +595,19 @@ class TestHomeworkFour(TestHomeworkThree):
         response = ''
         CURRENT_MENU = self.get_context_menu()
         print_if('\n!!!\tEntering test_func_settings_data')
-        TestContext.LOGGER.debug('test_func_exit_command')
+        self.context.LOGGER.debug('test_func_exit_command')
         MATCH_PROFILE_11 =  HWSettings.shape_output(HWSettings.DUMMY11_CLEAN, CURRENT_MENU) # 
         proc = None
         for idx, inputX in enumerate(['2', 'l', 'L', 'Login', 'LoGiN', 'LOGIN', 'login']):
             try:
-                proc, response = TestContext.SERVER_TO_TEST.start_server_ext(expected_response_endswith=CURRENT_MENU)
+                proc, response = self.server.start_server_ext(expected_response_endswith=CURRENT_MENU)
                 self.assertEqual(CURRENT_MENU, response)
-                response = TestContext.SERVER_TO_TEST.type_to_server_ext(proc, inputX , response_end='User Name:')
+                response = self.server.type_to_server_ext(proc, inputX , response_end='User Name:')
 
                 # User Name:
-                response = TestContext.SERVER_TO_TEST.type_to_server_ext(proc, 'dummy11' , response_end='Password:')
+                response = self.server.type_to_server_ext(proc, 'dummy11' , response_end='Password:')
                 # Password:
-                response = TestContext.SERVER_TO_TEST.type_to_server_ext(proc, '123123' , response_end=CURRENT_MENU)
+                response = self.server.type_to_server_ext(proc, '123123' , response_end=CURRENT_MENU)
 
                 print_if(f'\nResponse:\n{response}')
                 print_if(f'\nDefault:\n{MATCH_PROFILE_11}')
@@ -563,21 +622,21 @@ class TestHomeworkFour(TestHomeworkThree):
                 print(f"\n\tResponse:\n{response}\n\n\tExpected:\n{MATCH_PROFILE_11}")
                 details = self.get_error_details(ae)
                 print_if(f'{details}\n{ae}')
-                TestContext.LOGGER.error(f'{details}\n{ae}', exc_info=True)
+                self.context.LOGGER.error(f'{details}\n{ae}', exc_info=True)
                 self.fail(details)
             except Exception as ex:
                 print(f"\n\tResponse:\n{response}\n\n\tExpected:\n{MATCH_PROFILE_11}")
                 details = self.get_error_details(ex)
                 print_if(f'{details}\n{ex}')
-                TestContext.LOGGER.exception(f'{details}\n{ex}', exc_info=True)
+                self.context.LOGGER.exception(f'{details}\n{ex}', exc_info=True)
                 self.fail(details)
             finally:
                 print_if('Finally!')
                 if proc:
-                    TestContext.SERVER_TO_TEST.stop_server(proc)
+                    self.server.stop_server(proc)
     #--------------------------------------------------------------------------------------------------------------
 
-    # @unittest.skipIf(TestContext.HOMEWORK < 4, 'No DB Homeworks Less Than 4')
+    # @requires_homework(4, 'No DB Homeworks Less Than 4')
     def test_func_login_nonzero_failed_counts(self):
         """ Array of possibilities for choosing Login Option ['2', 'l', 'L', 'Login', 'LoGiN', 'LOGIN', 'login']
             Homework must match clean profile of the user dummy11
@@ -586,21 +645,21 @@ class TestHomeworkFour(TestHomeworkThree):
         response = ''
         CURRENT_MENU = self.get_context_menu()
         print_if('\n!!!\tEntering test_func_settings_data')
-        TestContext.LOGGER.debug('test_func_exit_command')
+        self.context.LOGGER.debug('test_func_exit_command')
         MATCH_PRO_11 =  HWSettings.shape_output(HWSettings.DUMMY11_CLEAN, CURRENT_MENU) # 
         MATCH_PRO_1F2 =  HWSettings.shape_output(HWSettings.DUMMY11_FAILED_2, CURRENT_MENU) # 
         passwords = ['123123','', '', '123123', '', '', '123123', '123123']
         proc = None
         for idx, inputX in enumerate(['2', 'l', 'L', 'Login', 'LoGiN', 'LOGIN', 'login', 'login']):
             try:
-                proc, response = TestContext.SERVER_TO_TEST.start_server_ext(expected_response_endswith=CURRENT_MENU)
+                proc, response = self.server.start_server_ext(expected_response_endswith=CURRENT_MENU)
                 self.assertEqual(CURRENT_MENU, response)
-                response = TestContext.SERVER_TO_TEST.type_to_server_ext(proc, inputX , response_end='User Name:')
+                response = self.server.type_to_server_ext(proc, inputX , response_end='User Name:')
 
                 # User Name:
-                response = TestContext.SERVER_TO_TEST.type_to_server_ext(proc, 'dummy11' , response_end='Password:')
+                response = self.server.type_to_server_ext(proc, 'dummy11' , response_end='Password:')
                 # Password:
-                response = TestContext.SERVER_TO_TEST.type_to_server_ext(proc, passwords[idx] , response_end=CURRENT_MENU)
+                response = self.server.type_to_server_ext(proc, passwords[idx] , response_end=CURRENT_MENU)
 
                 print_if(f'\nResponse:\n{response}')
                 print_if(f'\nDefault:\n{MATCH_PRO_11}')
@@ -628,7 +687,7 @@ class TestHomeworkFour(TestHomeworkThree):
 
                 details = self.get_error_details(ae)
                 print_if(f'{details}\n{ae}')
-                TestContext.LOGGER.error(f'{details}\n{ae}', exc_info=True)
+                self.context.LOGGER.error(f'{details}\n{ae}', exc_info=True)
                 self.fail(details)
             except Exception as ex:
                 if idx in [0, 1, 2, 4, 5]:
@@ -638,11 +697,11 @@ class TestHomeworkFour(TestHomeworkThree):
                     
                 details = self.get_error_details(ex)
                 print_if(f'{details}\n{ex}')
-                TestContext.LOGGER.exception(f'{details}\n{ex}', exc_info=True)
+                self.context.LOGGER.exception(f'{details}\n{ex}', exc_info=True)
                 self.fail(details)
             finally:
                 print_if('Finally!')
                 if proc:
-                    TestContext.SERVER_TO_TEST.stop_server(proc)
+                    self.server.stop_server(proc)
     #--------------------------------------------------------------------------------------------------------------
 #==================================================================================================================
\ No newline at end of file
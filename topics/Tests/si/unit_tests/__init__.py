@@ -0,0 +1,4 @@
+""" Unit tests of the si modules that run without the VMs
+    (python3 -m pytest unit_tests, or python3 -m unittest discover -s unit_tests -t .
+    from the si directory)
+"""
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+""" Unit tests of db_base: batched, the multi-row inserts, the select row
+    factories, and the statement latency histogram
+# =============================================================================
+    This software was developed at the National Institute of Standards
+    and Technology by employees of the Federal Government in the course
+    of their official duties.  Pursuant to title 17 Section 105 of the
+    United States Code this software is not subject to copyright
+    protection and is in the public domain.  NIST assumes no
+    responsibility whatsoever for its use by other parties, and makes
+    no guarantees, expressed or implied, about its quality,
+    reliability, or any other characteristic.
+# =============================================================================
+    We would appreciate acknowledgement if the software is used.
+"""
+__author__ = "Dmitry Cousin"
+__status__ = "Prototype"
+
+import os
+import sqlite3 as sql
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import db_base as dbBase
+
+# The passwords SQL would break on if they were pasted into the statements
+QUOTED_PASSWORDS = ("O'Brien", '"; DROP TABLE Users; --', "it''s", 'back\\slash', 'ünïcode "x"')
+# ============================================================================||
+
+
+class TestBatched(unittest.TestCase):
+
+    def test_splits_into_chunks(self):
+        self.assertEqual(list(dbBase.batched(range(7), 3)), [[0, 1, 2], [3, 4, 5], [6]])
+
+    def test_empty_iterable(self):
+        self.assertEqual(list(dbBase.batched([], 3)), [])
+
+    def test_consumes_generator_lazily(self):
+        consumed = []
+
+        def rows():
+            for row in range(10):
+                consumed.append(row)
+                yield row
+        chunks = dbBase.batched(rows(), 4)
+        self.assertEqual(next(chunks), [0, 1, 2, 3])
+        self.assertEqual(consumed, [0, 1, 2, 3])
+# ============================================================================||
+
+
+class TestBaseDBStatements(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.db = dbBase.BaseDB(self.work_dir.name, 'Unit.db', must_create_db=False)
+        self.db.__execute__('CREATE TABLE Users (id INTEGER PRIMARY KEY, name TEXT, password TEXT)')
+
+    def tearDown(self):
+        self.db.close()
+        self.work_dir.cleanup()
+
+    def insert_users(self, batch_size: int = 0) -> int:
+        return self.db.__insert_many__('INSERT INTO Users (name, password) VALUES (?, ?)',
+                                       ((f'user{index}', password)
+                                        for index, password in enumerate(QUOTED_PASSWORDS)),
+                                       batch_size)
+
+    def test_insert_many_keeps_quoted_passwords(self):
+        for batch_size in (0, 2):
+            with self.subTest(batch_size=batch_size):
+                self.db.__execute__('DELETE FROM Users')
+                self.assertEqual(self.insert_users(batch_size), len(QUOTED_PASSWORDS))
+                self.assertEqual([password for (password,) in self.db.__select_array__(
+                                      'SELECT password FROM Users ORDER BY id')],
+                                 list(QUOTED_PASSWORDS))
+
+    def test_insert_many_failure_inserts_nothing(self):
+        rows = [('user0', 'a'), ('user1', 'b', 'extra')]
+        self.assertEqual(self.db.__insert_many__(
+            'INSERT INTO Users (name, password) VALUES (?, ?)', rows, 1), 0)
+        self.assertEqual(self.db.__select_scalar__('SELECT COUNT(*) FROM Users'), 0)
+        self.assertEqual(self.db.ops_stats.failed_count, 1)
+        self.assertIn('Users', self.db.ops_stats.last_error[0])
+
+    def test_select_row_factories(self):
+        self.insert_users()
+        query = 'SELECT id, name, password FROM Users WHERE name = ?'
+        (row,) = self.db.__select__(query, ('user0',))
+        self.assertEqual(row, (1, 'user0', "O'Brien"))
+        (row,) = self.db.__select__(query, ('user0',), row_factory='row')
+        self.assertIsInstance(row, sql.Row)
+        self.assertEqual((row['name'], row[2]), ('user0', "O'Brien"))
+        (row,) = self.db.__select__(query, ('user0',), row_factory='namedtuple')
+        self.assertEqual((row.id, row.name, row.password), (1, 'user0', "O'Brien"))
+        self.assertEqual(self.db.stack_select[-1], ('id', 'name', 'password'))
+
+    def test_select_streams_in_arrays(self):
+        self.insert_users()
+        rows = self.db.__select__('SELECT name FROM Users ORDER BY id', array_size=2)
+        self.assertEqual([name for (name,) in rows],
+                         [f'user{index}' for index in range(len(QUOTED_PASSWORDS))])
+
+    def test_select_failure_raises(self):
+        with self.assertRaises(sql.OperationalError):
+            self.db.__select_array__('SELECT * FROM Missing')
+        self.assertEqual(self.db.ops_stats.failed_count, 1)
+
+    def test_select_failure_after_rows_raises(self):
+        self.insert_users()
+        rows = self.db.__select__('SELECT name FROM Users ORDER BY id', array_size=2)
+        self.assertEqual(next(rows), ('user0',))
+        self.db.close()     # the connection goes away mid-stream
+        with self.assertRaises(sql.ProgrammingError):
+            list(rows)
+        self.assertEqual(self.db.ops_stats.failed_count, 1)
+# ============================================================================||
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.pool = dbBase.ConnectionPool()
+        self.first_db = os.path.join(self.work_dir.name, 'first.db')
+        self.second_db = os.path.join(self.work_dir.name, 'second.db')
+
+    def tearDown(self):
+        self.pool.release_all()
+        self.work_dir.cleanup()
+
+    def run_in_thread(self, target):
+        errors = []
+
+        def run():
+            try:
+                target()
+            except Exception as ex:
+                errors.append(ex)
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        if errors:
+            raise errors[0]
+        return thread
+
+    def test_reused_thread_ident(self):
+        finished_ident = []
+        self.run_in_thread(lambda: finished_ident.append(
+            (self.pool.acquire(self.first_db, 1), threading.get_ident())[1]))
+
+        def reuse_ident():
+            with mock.patch('threading.get_ident', return_value=finished_ident[0]):
+                connection = self.pool.acquire(self.first_db, 2)
+                connection.execute('CREATE TABLE Numbers (n INTEGER)')
+                self.pool.acquire(self.second_db, 2)    # prunes the finished thread
+                self.assertEqual(connection.execute('SELECT COUNT(*) FROM Numbers').fetchone(),
+                                 (0,))
+                self.assertEqual(self.pool.release(self.first_db, 2), 1)
+        self.run_in_thread(reuse_ident)
+
+    def test_release_keeps_other_owners(self):
+        connection = self.pool.acquire(self.first_db, 1)
+        self.pool.acquire(self.first_db, 2)
+        self.assertEqual(self.pool.release(self.first_db, 1), 0)
+        connection.execute('SELECT 1')
+        self.assertEqual(self.pool.release(self.first_db, 2), 1)
+        self.assertEqual(len(self.pool), 0)
+
+    def test_prunes_finished_threads(self):
+        for _ in range(3):
+            self.run_in_thread(lambda: self.pool.acquire(self.first_db, 1))
+        self.pool.acquire(self.second_db, 1)
+        self.assertEqual(len(self.pool), 1)
+# ============================================================================||
+
+
+class TestOpsStats(unittest.TestCase):
+
+    def test_latency_buckets(self):
+        stats = dbBase.OpsStats()
+        for seconds in (0.00005, 0.0001, 0.0005, 0.05, 0.5, 2.0):
+            stats.record(seconds)
+        self.assertEqual(stats.as_dict()['latency_histogram'],
+                         {'0.0001': 2, '0.001': 1, '0.01': 0, '0.1': 1, '1.0': 1, 'inf': 1})
+
+    def test_counts_and_last_error(self):
+        stats = dbBase.OpsStats()
+        stats.record(0.002)
+        stats.record(0.004, 'SELECT 1', ValueError('bad'))
+        summary = stats.as_dict()
+        self.assertEqual((summary['ok'], summary['failed']), (1, 1))
+        self.assertEqual(summary['last_error'], ('SELECT 1', 'ValueError: bad'))
+        self.assertAlmostEqual(summary['mean_seconds'], 0.003)
+
+    def test_empty_mean(self):
+        self.assertEqual(dbBase.OpsStats().as_dict()['mean_seconds'], 0.0)
+# ============================================================================||
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+""" Unit tests of the streamed password reading of db_create, of the
+    rainbow_index build (sorted runs spilled and merged) and lookups, and of
+    the password verification of cred_crypto
+# =============================================================================
+    This software was developed at the National Institute of Standards
+    and Technology by employees of the Federal Government in the course
+    of their official duties.  Pursuant to title 17 Section 105 of the
+    United States Code this software is not subject to copyright
+    protection and is in the public domain.  NIST assumes no
+    responsibility whatsoever for its use by other parties, and makes
+    no guarantees, expressed or implied, about its quality,
+    reliability, or any other characteristic.
+# =============================================================================
+    We would appreciate acknowledgement if the software is used.
+"""
+__author__ = "Dmitry Cousin"
+__status__ = "Prototype"
+
+
+import os
+import tempfile
+import unittest
+
+import cred_crypto as pop
+import db_create as dbCreate
+import rainbow_index
+# ============================================================================||
+
+
+class PasswordFilesTestCase(unittest.TestCase):
+    """ Writes the password files of a test into its temporary directory """
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.work_dir.cleanup()
+
+    def write_passwords(self, file_name: str, text: str) -> str:
+        pwd_file = os.path.join(self.work_dir.name, file_name)
+        with open(pwd_file, 'w', encoding='utf-8', newline='') as pwd_data:
+            pwd_data.write(text)
+        return pwd_file
+# ============================================================================||
+
+
+class TestReadPasswords(PasswordFilesTestCase):
+
+    def test_strips_and_keeps_every_line(self):
+        pwd_file = self.write_passwords('pwd.txt', ' 123456 \nqwerty\r\n123456\n\npass word\n')
+        self.assertEqual(list(dbCreate.read_passwords(pwd_file)),
+                         ['123456', 'qwerty', '123456', '', 'pass word'])
+
+    def test_dedupe(self):
+        pwd_file = self.write_passwords('pwd.txt', 'a\nb\na\nc\nb\n')
+        self.assertEqual(list(dbCreate.read_passwords(pwd_file, dedupe=True)), ['a', 'b', 'c'])
+
+    def test_replaces_undecodable_bytes(self):
+        pwd_file = os.path.join(self.work_dir.name, 'latin1.txt')
+        with open(pwd_file, 'wb') as pwd_data:
+            pwd_data.write(b'caf\xe9\nok\n')
+        self.assertEqual(list(dbCreate.read_passwords(pwd_file)), ['caf�', 'ok'])
+
+    def test_populate_skips_repeated_passwords(self):
+        pwd_file = self.write_passwords('pwd.txt', '123456\nqwerty\n123456\nletmein\nqwerty\n')
+        with dbCreate.DbMaker(self.work_dir.name, 'populate.db') as db_maker:
+            db_maker.populate_db_schema_simple(pwd_file, 'Users_Top50')
+            rows = db_maker.get_connection().execute(
+                'SELECT user_name, password_text FROM Users_Top50 ORDER BY id').fetchall()
+        self.assertEqual(rows, [('dummy1', '123456'), ('dummy2', 'qwerty'), ('dummy3', 'letmein')])
+# ============================================================================||
+
+
+class TestRainbowIndex(PasswordFilesTestCase):
+    PASSWORDS = ['letmein', "O'Brien", 'пароль', 'dragon', 'monkey', 'letmein', 'abc123', 'x']
+
+    def build(self, run_size: int) -> str:
+        half = len(self.PASSWORDS) // 2
+        pwd_files = [self.write_passwords('first.txt', '\n'.join(self.PASSWORDS[:half]) + '\n'),
+                     self.write_passwords('second.txt', '\n'.join(self.PASSWORDS[half:]) + '\n')]
+        index_path = os.path.join(self.work_dir.name, 'pwd.idx')
+        count = rainbow_index.build_index(index_path, pwd_files, 'sha256', run_size)
+        self.assertEqual(count, len(set(self.PASSWORDS)))
+        return index_path
+
+    def test_lookups_after_merging_runs(self):
+        for run_size in (2, 3, rainbow_index.RUN_SIZE):    # several spilled runs, or one
+            with self.subTest(run_size=run_size):
+                with rainbow_index.HashIndex(self.build(run_size)) as index:
+                    self.assertEqual(len(index), len(set(self.PASSWORDS)))
+                    self.assertEqual(index.algorithm, 'sha256')
+                    for password in self.PASSWORDS:
+                        digest = pop.digest_password(password, 'sha256')
+                        self.assertEqual(index.lookup(digest), password)
+                        self.assertEqual(index.lookup(digest.hex()), password)
+
+    def test_unknown_digests(self):
+        with rainbow_index.HashIndex(self.build(2)) as index:
+            self.assertIsNone(index.lookup(pop.digest_password('not-there', 'sha256')))
+            self.assertIsNone(index.lookup(b'\x00' * index.digest_size))
+            self.assertIsNone(index.lookup(b'\xff' * index.digest_size))
+            self.assertIsNone(index.lookup(b'short'))
+
+    def test_empty_wordlist(self):
+        index_path = os.path.join(self.work_dir.name, 'empty.idx')
+        self.assertEqual(rainbow_index.build_index(
+            index_path, [self.write_passwords('empty.txt', '')]), 0)
+        with rainbow_index.HashIndex(index_path) as index:
+            self.assertEqual(len(index), 0)
+            self.assertIsNone(index.lookup(pop.digest_password('x', 'sha256')))
+
+    def test_rejects_other_files(self):
+        not_index = self.write_passwords('not.idx', 'x' * rainbow_index.RECORDS_OFFSET)
+        with self.assertRaises(ValueError):
+            rainbow_index.HashIndex(not_index)
+# ============================================================================||
+
+
+class TestPasswordOperations(unittest.TestCase):
+
+    def setUp(self):
+        self.operations = pop.PasswordOperations(iterations=1_000)
+        self.password_hash, self.salt = self.operations.hash_password('letmein', os.urandom(16).hex())
+
+    def test_same_password(self):
+        self.assertTrue(self.operations.is_password_same('letmein', self.password_hash, self.salt))
+        self.assertFalse(self.operations.is_password_same('dragon', self.password_hash, self.salt))
+
+    def test_malformed_hex_never_matches(self):
+        self.assertFalse(self.operations.is_password_same('letmein', 'not hex', self.salt))
+        self.assertFalse(self.operations.is_password_same('letmein', self.password_hash, 'abc'))
+# ============================================================================||
+
+
+if __name__ == '__main__':
+    unittest.main()
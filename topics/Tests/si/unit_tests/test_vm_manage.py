@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+""" Unit tests of si_server_vm_manage: the VBoxManage listing parsers and the
+    exit-status marker framing of the HostChannel (over a local sh)
+# =============================================================================
+    This software was developed at the National Institute of Standards
+    and Technology by employees of the Federal Government in the course
+    of their official duties.  Pursuant to title 17 Section 105 of the
+    United States Code this software is not subject to copyright
+    protection and is in the public domain.  NIST assumes no
+    responsibility whatsoever for its use by other parties, and makes
+    no guarantees, expressed or implied, about its quality,
+    reliability, or any other characteristic.
+# =============================================================================
+    We would appreciate acknowledgement if the software is used.
+"""
+__author__ = "Dmitry Cousin"
+__status__ = "Prototype"
+
+
+import subprocess
+import unittest
+from unittest import mock
+
+import si_server_vm_manage as vm_manage
+
+# "VBoxManage list -l vms" of two VMs: a shared folder and a snapshot also
+# have the "Name:" lines, and only the first UUID of a VM is its own
+VM_LISTING = """Name:                        student1
+Encryption:     disabled
+Groups:                      /
+Guest OS:                    Ubuntu (64-bit)
+UUID:                        1b7c2c48-6a8e-4a43-9d4c-4a5d3d2a6b01
+Config file:                 /home/si/VirtualBox VMs/student1/student1.vbox
+State:                       running (since 2026-10-17T09:12:44.120000000)
+NIC 1:                       MAC: 080027AB12CD, Attachment: NAT, Cable connected: on
+NIC 1 Rule(0):   name = ssh, protocol = tcp, host ip = , host port = 2021, guest ip = , guest port = 22
+NIC 1 Rule(1):   name = web, protocol = tcp, host ip = 127.0.0.1, host port = 8081, guest ip = , guest port = 80
+Name: 'share', Host path: '/home/si/share' (machine mapping), writable
+Snapshots:
+
+   Name: si-baseline (UUID: 9f0e4a50-5d17-4b8e-8d1c-0b4d9a9e7c22) *
+
+Name:                        student2
+UUID:                        2c8d3d59-7b9f-4b54-8e2d-5b6e4e3b7c02
+State:                       powered off (since 2026-10-17T08:00:00.000000000)
+"""
+# ============================================================================||
+
+
+class TestListingParsers(unittest.TestCase):
+
+    def test_parse_vm_inventory(self):
+        (student1, student2) = vm_manage.parse_vm_inventory(VM_LISTING)
+        self.assertEqual((student1.name, student1.uuid, student1.state),
+                         ('student1', '1b7c2c48-6a8e-4a43-9d4c-4a5d3d2a6b01', 'running'))
+        self.assertTrue(student1.running)
+        self.assertEqual(student1.forwarded_ports,
+                         {'ssh': ('tcp', 2021, 22), 'web': ('tcp', 8081, 80)})
+        self.assertEqual((student2.name, student2.state, student2.forwarded_ports),
+                         ('student2', 'powered off', {}))
+        self.assertFalse(student2.running)
+
+    def test_parse_vm_inventory_empty(self):
+        self.assertEqual(vm_manage.parse_vm_inventory(''), [])
+        self.assertEqual(vm_manage.parse_vm_inventory('State: running\n'), [])
+
+    def test_parse_vm_names(self):
+        listing = ('"student1" {1b7c2c48-6a8e-4a43-9d4c-4a5d3d2a6b01}\n'
+                   '"lab \\"x\\" {2}" {2c8d3d59-7b9f-4b54-8e2d-5b6e4e3b7c02}\n'
+                   'WARNING: not a VM line\n')
+        self.assertEqual(vm_manage.parse_vm_names(listing),
+                         {'student1': '1b7c2c48-6a8e-4a43-9d4c-4a5d3d2a6b01',
+                          'lab \\"x\\" {2}': '2c8d3d59-7b9f-4b54-8e2d-5b6e4e3b7c02'})
+
+
+class TestVmInventory(unittest.TestCase):
+
+    def test_failed_listing_is_not_cached(self):
+        inventory = vm_manage.VmInventory('user', False)
+        with mock.patch.object(vm_manage, '_run_vboxmanage',
+                               side_effect=['TimeoutError', VM_LISTING]) as listing:
+            with self.assertRaises(vm_manage.InventoryError):
+                inventory.is_running('student1')
+            self.assertTrue(inventory.is_running('student1'))
+            self.assertTrue(inventory.is_registered('2c8d3d59-7b9f-4b54-8e2d-5b6e4e3b7c02'))
+            self.assertEqual(inventory.used_host_ports(), {2021, 8081})
+        self.assertEqual(listing.call_count, 2)     # the second listing is cached
+
+    def test_operations_fail_without_listing(self):
+        with mock.patch.object(vm_manage, '_run_vboxmanage', return_value='CalledProcessError'):
+            for operation in (vm_manage.start_vm, vm_manage.stop_vm, vm_manage.delete_vm,
+                              vm_manage.reset_vm):
+                with self.subTest(operation=operation.__name__):
+                    self.assertEqual(operation('unit-user', 'student1', False),
+                                     'FAIL - Unable to list registered virtual machines')
+
+
+class TestVmStateWatcher(unittest.TestCase):
+
+    def test_host_listings_share_round_trip(self):
+        watcher = vm_manage.VmStateWatcher('user', True)
+        results = [subprocess.CompletedProcess('', 0, b'"student1" {1b7c}\n"student2" {2c8d}\n',
+                                               None),
+                   subprocess.CompletedProcess('', 0, b'"student1" {1b7c}\n', None)]
+        with mock.patch.object(vm_manage, 'host_ssh_batch', return_value=results) as batch:
+            self.assertEqual(watcher.list_all_names({'registered', 'running'}),
+                             {'registered': {'student1': '1b7c', 'student2': '2c8d'},
+                              'running': {'student1': '1b7c'}})
+        batch.assert_called_once_with('user', ['/usr/local/bin/vboxmanage list vms',
+                                               '/usr/local/bin/vboxmanage list runningvms'], 30)
+        self.assertEqual(watcher.polls, 2)
+
+    def test_failed_host_listing(self):
+        watcher = vm_manage.VmStateWatcher('user', True)
+        results = ['TimeoutError', subprocess.CompletedProcess('', 1, b'error', None)]
+        with mock.patch.object(vm_manage, 'host_ssh_batch', return_value=results):
+            self.assertEqual(watcher.list_all_names({'registered', 'running'}),
+                             {'registered': None, 'running': None})
+# ============================================================================||
+
+
+class LocalChannel(vm_manage.HostChannel):
+    """ HostChannel over a local sh instead of the ssh session to the host """
+
+    def open(self):
+        self.process = subprocess.Popen(['sh'], stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        self._HostChannel__pending = b''
+# ============================================================================||
+
+
+class TestHostChannel(unittest.TestCase):
+
+    def setUp(self):
+        self.channel = LocalChannel('user', '127.0.0.1')
+
+    def tearDown(self):
+        self.channel.close()
+
+    def test_batch_framing(self):
+        results = self.channel.run_batch(['echo one; echo two',
+                                          "printf 'no line break'",
+                                          'echo oops >&2; exit 3',
+                                          'true',
+                                          'read line; echo "stdin: [$line]"'], 10)
+        self.assertEqual([(result.returncode, result.stdout) for result in results],
+                         [(0, b'one\ntwo\n'), (0, b'no line break'), (3, b'oops\n'),
+                          (0, b''), (0, b'stdin: []\n')])
+        self.assertEqual(self.channel.commands_run, 5)
+
+    def test_marker_lookalike_output(self):
+        result = self.channel.run("printf '\\n__SI_HOST_EXIT_fake__ 7\\n'; echo done", 10)
+        self.assertEqual((result.returncode, result.stdout),
+                         (0, b'\n__SI_HOST_EXIT_fake__ 7\ndone\n'))
+
+    def test_reuses_session(self):
+        self.channel.run('X=kept', 10)
+        process = self.channel.process
+        self.assertEqual(self.channel.run('echo "[$X]"', 10).stdout, b'[]\n')   # a subshell
+        self.assertIs(self.channel.process, process)
+
+    def test_timeout_closes_and_reopens(self):
+        self.assertEqual(self.channel.run_batch(['echo fast', 'sleep 5', 'echo late'], 0.5)[1:],
+                         ['TimeoutError', 'TimeoutError'])
+        self.assertFalse(self.channel.is_open())
+        self.assertEqual(self.channel.run('echo again', 10).stdout, b'again\n')
+
+    def test_broken_session(self):
+        self.assertEqual(self.channel.run('kill -9 $$', 10), 'CalledProcessError')
+        self.assertEqual(self.channel.run('echo back', 10).returncode, 0)
+# ============================================================================||
+
+
+if __name__ == '__main__':
+    unittest.main()